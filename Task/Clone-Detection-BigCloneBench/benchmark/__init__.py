@@ -0,0 +1 @@
+# Clone-pair inference benchmark for the BCB model families, see __main__.py.
@@ -0,0 +1,142 @@
+# Clone-pair inference benchmark for the BCB model families.
+#
+# From Task/Clone-Detection-BigCloneBench:
+#   python -m benchmark run --output base.json
+#   ... change get_example / Model.forward ...
+#   python -m benchmark run --output new.json
+#   python -m benchmark compare base.json new.json
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmark import synthetic
+from benchmark.compare import compare_reports
+from benchmark.families import FAMILIES, root_dir
+
+
+def add_config_args(parser):
+    parser.add_argument("--families", nargs='+', default=sorted(FAMILIES), choices=sorted(FAMILIES))
+    parser.add_argument("--num_functions", default=200, type=int)
+    parser.add_argument("--num_pairs", default=1000, type=int)
+    parser.add_argument("--batch_size", default=16, type=int)
+    parser.add_argument("--block_size", default=128, type=int,
+                        help="Tokens per function (code_length+data_flow_length for graphcodebert).")
+    parser.add_argument("--data_flow_length", default=32, type=int)
+    parser.add_argument("--hidden_size", default=64, type=int)
+    parser.add_argument("--num_layers", default=2, type=int)
+    parser.add_argument("--num_heads", default=4, type=int)
+    parser.add_argument("--workers", default=4, type=int, help="Featurization pool size.")
+    parser.add_argument("--threads", default=1, type=int, help="torch intra-op threads.")
+    parser.add_argument("--seed", default=42, type=int)
+
+
+def config_argv(args):
+    argv=[]
+    for key,value in sorted(vars(args).items()):
+        if key in ('command','output','work_dir','family','data_dir','families'):
+            continue
+        argv+=['--'+key,str(value)]
+    return argv
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git','rev-parse','HEAD'],cwd=root_dir,stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def run(args):
+    import torch
+    work_dir=os.path.abspath(args.work_dir or tempfile.mkdtemp(prefix='bcb_benchmark_'))
+    args.output=os.path.abspath(args.output)
+    data_dir=os.path.join(work_dir,'data')
+    synthetic.write_dataset(data_dir,num_functions=args.num_functions,num_pairs=args.num_pairs,seed=args.seed)
+    report={'meta':{'created':time.strftime('%Y-%m-%d %H:%M:%S'),
+                    'git_commit':_git_commit(),
+                    'python':platform.python_version(),
+                    'torch':torch.__version__,
+                    'platform':platform.platform(),
+                    'cpu_count':os.cpu_count(),
+                    'config':{key:value for key,value in vars(args).items()
+                              if key not in ('command','output','work_dir')}},
+            'families':{}}
+    for name in args.families:
+        result_file=os.path.join(work_dir,name+'.json')
+        # one process per family: separate module namespaces and peak memory
+        command=[sys.executable,'-m','benchmark','family','--family',name,'--data_dir',data_dir,
+                 '--work_dir',work_dir,'--output',result_file]+config_argv(args)
+        print('[benchmark] {}'.format(name),file=sys.stderr)
+        returncode=subprocess.call(command,cwd=root_dir)
+        if returncode!=0 or not os.path.exists(result_file):
+            report['families'][name]={'skipped':'failed with exit code {}'.format(returncode)}
+            continue
+        with open(result_file) as f:
+            report['families'][name]=json.load(f)
+    with open(args.output,'w') as f:
+        json.dump(report,f,indent=2)
+    for name,result in report['families'].items():
+        if 'skipped' in result:
+            print('{:<14} skipped: {}'.format(name,result['skipped']))
+        else:
+            print('{:<14} {:>9.1f} pairs/s end to end, {:>9.1f} pairs/s forward, peak {} MB'.format(
+                name,result['end_to_end']['pairs_per_second'],result['forward']['pairs_per_second'],
+                result['end_to_end']['peak_rss_mb']))
+    print('report written to {}'.format(args.output))
+
+
+def run_family(args):
+    from benchmark.runner import benchmark_family
+    result=benchmark_family(args.family,args.data_dir,args.work_dir,args)
+    with open(args.output,'w') as f:
+        json.dump(result,f,indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmark')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="Benchmark the model families and write a JSON report.")
+    add_config_args(run_parser)
+    run_parser.add_argument("--output", default='benchmark_report.json', type=str)
+    run_parser.add_argument("--work_dir", default=None, type=str,
+                            help="Where synthetic data and caches go, a temporary directory by default.")
+
+    family_parser = subparsers.add_parser('family', help="(internal) benchmark a single family.")
+    add_config_args(family_parser)
+    family_parser.add_argument("--family", required=True, choices=sorted(FAMILIES))
+    family_parser.add_argument("--data_dir", required=True, type=str)
+    family_parser.add_argument("--work_dir", required=True, type=str)
+    family_parser.add_argument("--output", required=True, type=str)
+
+    compare_parser = subparsers.add_parser('compare', help="Diff two JSON reports.")
+    compare_parser.add_argument("base", type=str)
+    compare_parser.add_argument("new", type=str)
+    compare_parser.add_argument("--tolerance", default=0.05, type=float,
+                                help="Relative change that counts as a regression.")
+    compare_parser.add_argument("--fail_on_regression", action='store_true')
+
+    args = parser.parse_args()
+    if args.command=='run':
+        run(args)
+    elif args.command=='family':
+        run_family(args)
+    else:
+        with open(args.base) as f:
+            base=json.load(f)
+        with open(args.new) as f:
+            new=json.load(f)
+        flagged=compare_reports(base,new,args.tolerance)
+        if flagged and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
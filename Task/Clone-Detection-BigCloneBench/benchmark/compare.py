@@ -0,0 +1,34 @@
+# Diff of two benchmark reports.
+#
+# Prints every stage of every family that both reports ran, with the relative
+# change, and flags slowdowns or memory growth beyond a tolerance. A changed F1
+# is flagged too: both runs use the same seed and synthetic data, so a
+# different score means the change altered what the model computes.
+from benchmark.runner import stages
+
+
+def _rows(base, new, tolerance):
+    for name in sorted(set(base['families'])|set(new['families'])):
+        old_result=base['families'].get(name,{'skipped':'not run'})
+        new_result=new['families'].get(name,{'skipped':'not run'})
+        if 'skipped' in old_result or 'skipped' in new_result:
+            yield name,'-',old_result.get('skipped',''),new_result.get('skipped',''),'','skipped'
+            continue
+        for stage in stages+['end_to_end']:
+            for key,higher_is_better in [('seconds',False),('peak_rss_mb',False)]:
+                old,cur=old_result[stage][key],new_result[stage][key]
+                change=(cur-old)/old if old else 0.0
+                worse=change<-tolerance if higher_is_better else change>tolerance
+                yield name,'{}.{}'.format(stage,key),old,cur,'{:+.1%}'.format(change),'REGRESSION' if worse else ''
+        old_f1,new_f1=old_result['metric']['scores']['f1'],new_result['metric']['scores']['f1']
+        yield name,'metric.f1',round(old_f1,6),round(new_f1,6),'','CHANGED' if abs(old_f1-new_f1)>1e-6 else ''
+
+
+def compare_reports(base, new, tolerance=0.05):
+    """Print the diff table, returns the number of flagged rows."""
+    rows=list(_rows(base,new,tolerance))
+    header=('family','measure','base','new','change','')
+    widths=[max(len(str(row[i])) for row in rows+[header]) for i in range(len(header))]
+    for row in [header]+rows:
+        print('  '.join(str(x).ljust(width) for x,width in zip(row,widths)).rstrip())
+    return sum(1 for row in rows if row[-1] in ('REGRESSION','CHANGED'))
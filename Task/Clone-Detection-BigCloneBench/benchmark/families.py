@@ -0,0 +1,185 @@
+# Model families of the benchmark.
+#
+# Each family imports the real run.py/model.py of its directory (the same code
+# run.sh executes) and exposes the four stages the runner times: featurize a
+# pair file into the family's Dataset, build a tiny randomly initialized model,
+# run its forward pass on a collated batch, and compute the metric its evaluate()
+# reports. A family is loaded once per process, the runner starts one process
+# per family so identically named modules (run, model, ...) never collide.
+import multiprocessing
+import os
+import sys
+
+import torch
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _import_family(name, modules):
+    """Import modules from the family directory, run from there like run.sh does."""
+    family_dir=os.path.join(root_dir,name)
+    sys.path.insert(0,family_dir)
+    os.chdir(family_dir)
+    return [__import__(module) for module in modules]
+
+
+def sweep_threshold(y_trues, scores):
+    """Best macro F1 over thresholds 0.01..0.99, computed as the BCB run.py evaluate() does."""
+    from sklearn.metrics import recall_score, precision_score, f1_score
+    best_threshold=0
+    best_f1=-1
+    for i in range(1,100):
+        threshold=i/100
+        y_preds=scores>threshold
+        recall_score(y_trues, y_preds, average='macro')
+        precision_score(y_trues, y_preds, average='macro')
+        f1=f1_score(y_trues, y_preds, average='macro')
+        if f1>best_f1:
+            best_f1=f1
+            best_threshold=threshold
+    y_preds=scores>best_threshold
+    return {'recall':float(recall_score(y_trues, y_preds, average='macro')),
+            'precision':float(precision_score(y_trues, y_preds, average='macro')),
+            'f1':float(f1_score(y_trues, y_preds, average='macro')),
+            'threshold':best_threshold}
+
+
+class Family(object):
+    name = None
+    tokenizer_kind = 'roberta'
+    device = torch.device('cpu')
+
+    def load(self):
+        raise NotImplementedError
+
+    def available(self):
+        """None when the family can run here, otherwise the reason it cannot."""
+        return None
+
+    def pool(self, args, tokenizer, processes):
+        """The multiprocessing pool featurize gets, the plain one run.py creates by default."""
+        return multiprocessing.Pool(processes)
+
+    def featurize(self, args, tokenizer, pairs_file, pool):
+        raise NotImplementedError
+
+    def build_model(self, args, tokenizer):
+        raise NotImplementedError
+
+    def collate_fn(self):
+        """The collate_fn run.py gives its DataLoaders, None for the default one."""
+        return None
+
+    def forward(self, model, batch):
+        """Clone probabilities (B * 2) of a collated batch."""
+        inputs=batch[0].to(self.device)
+        return model(inputs)
+
+    def metric(self, y_trues, scores):
+        return sweep_threshold(y_trues,scores)
+
+
+class CodeBERT(Family):
+    name = 'codebert'
+
+    def load(self):
+        self.run,=_import_family(self.name,['run'])
+
+    def featurize(self, args, tokenizer, pairs_file, pool):
+        return self.run.TextDataset(tokenizer,args,pairs_file,block_size=args.block_size,pool=pool)
+
+    def build_model(self, args, tokenizer):
+        from transformers import RobertaConfig, RobertaModel
+        config=RobertaConfig(vocab_size=len(tokenizer),hidden_size=args.hidden_size,num_hidden_layers=args.num_layers,
+                             num_attention_heads=args.num_heads,intermediate_size=args.hidden_size*4,
+                             max_position_embeddings=args.block_size+4,pad_token_id=tokenizer.pad_token_id)
+        return self.run.Model(RobertaModel(config),config,tokenizer,args)
+
+
+class CodeGPT(Family):
+    name = 'codegpt'
+    tokenizer_kind = 'gpt2'
+
+    def load(self):
+        self.run,=_import_family(self.name,['run'])
+
+    def featurize(self, args, tokenizer, pairs_file, pool):
+        return self.run.TextDataset(tokenizer,args,pairs_file,block_size=args.block_size,pool=pool)
+
+    def build_model(self, args, tokenizer):
+        from transformers import GPT2Config, GPT2Model
+        config=GPT2Config(vocab_size=len(tokenizer),n_embd=args.hidden_size,n_layer=args.num_layers,
+                          n_head=args.num_heads,n_positions=args.block_size)
+        return self.run.Model(GPT2Model(config),config,tokenizer,args)
+
+    def metric(self, y_trues, scores):
+        # run.py picks its threshold with the sorted sweep
+        return self.run.find_best_threshold(y_trues,scores)
+
+
+class GraphCodeBERT(Family):
+    name = 'graphcodebert'
+
+    def available(self):
+        if not os.path.exists(os.path.join(root_dir,self.name,'parser','my-languages.so')):
+            return 'parser/my-languages.so is not built (see parser/build.sh)'
+        return None
+
+    def load(self):
+        self.run,=_import_family(self.name,['run'])
+
+    def pool(self, args, tokenizer, processes):
+        return self.run.featurization_pool(processes,'java',tokenizer,args)
+
+    def featurize(self, args, tokenizer, pairs_file, pool):
+        return self.run.TextDataset(tokenizer,args,pairs_file,pool=pool)
+
+    def collate_fn(self):
+        return self.run.collate_batch
+
+    def build_model(self, args, tokenizer):
+        from transformers import RobertaConfig, RobertaModel
+        length=args.code_length+args.data_flow_length
+        config=RobertaConfig(vocab_size=len(tokenizer),hidden_size=args.hidden_size,num_hidden_layers=args.num_layers,
+                             num_attention_heads=args.num_heads,intermediate_size=args.hidden_size*4,
+                             max_position_embeddings=length+4,pad_token_id=tokenizer.pad_token_id)
+        self.masks=self.run.MaskFactory(length,args.mask_cache_size)
+        return self.run.Model(RobertaModel(config),config,tokenizer,args)
+
+    def forward(self, model, batch):
+        #masks are built from the collated descriptors in this process, as run.py does
+        inputs_ids,position_idx=[x.to(self.device) for x in batch[:2]]
+        attn_mask=self.masks(batch[2]).to(self.device)
+        node_spans=self.masks.node_spans(batch[2]).to(self.device)
+        return model(inputs_ids,position_idx,attn_mask,node_spans=node_spans)
+
+
+class CodeT5(Family):
+    name = 'codet5'
+
+    def load(self):
+        self.models,self.utils=_import_family(self.name,['models','utils'])
+
+    def featurize(self, args, tokenizer, pairs_file, pool):
+        _,data=self.utils.load_and_cache_clone_data(args,pairs_file,pool,tokenizer,'test')
+        return data
+
+    def build_model(self, args, tokenizer):
+        from transformers import T5Config, T5ForConditionalGeneration
+        config=T5Config(vocab_size=len(tokenizer),d_model=args.hidden_size,d_kv=args.hidden_size//args.num_heads,
+                        d_ff=args.hidden_size*4,num_layers=args.num_layers,num_heads=args.num_heads,
+                        pad_token_id=tokenizer.pad_token_id,eos_token_id=tokenizer.eos_token_id,
+                        decoder_start_token_id=tokenizer.pad_token_id)
+        return self.models.CloneModel(T5ForConditionalGeneration(config),config,tokenizer,args)
+
+    def metric(self, y_trues, scores):
+        # run_clone.py evaluate() uses a fixed 0.5 threshold and binary scores
+        from sklearn.metrics import recall_score, precision_score, f1_score
+        y_preds=scores>0.5
+        return {'recall':float(recall_score(y_trues,y_preds)),
+                'precision':float(precision_score(y_trues,y_preds)),
+                'f1':float(f1_score(y_trues,y_preds)),
+                'threshold':0.5}
+
+
+FAMILIES = {family.name:family for family in [CodeBERT,CodeGPT,GraphCodeBERT,CodeT5]}
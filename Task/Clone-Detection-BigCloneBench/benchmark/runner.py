@@ -0,0 +1,116 @@
+# Stage timings of one model family.
+#
+# benchmark_family() featurizes the synthetic pair file with the family's own
+# Dataset (tokenize), batches it with a sequential DataLoader (collate), runs the
+# tiny model over every batch under no_grad (forward) and scores the
+# probabilities the way the family's evaluate() does (metric). It is run in a
+# fresh process per family, so peak RSS belongs to that family alone.
+import os
+import resource
+import shutil
+import time
+import types
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, SequentialSampler
+
+from benchmark.families import FAMILIES
+
+stages = ['tokenize', 'collate', 'forward', 'metric']
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024,1)
+
+
+def family_args(args, out_dir):
+    """The subset of run.py arguments the datasets and models read."""
+    return types.SimpleNamespace(
+        block_size=args.block_size,max_source_length=args.block_size,
+        code_length=args.block_size-args.data_flow_length,data_flow_length=args.data_flow_length,
+        hidden_size=args.hidden_size,num_layers=args.num_layers,num_heads=args.num_heads,
+        per_gpu_eval_batch_size=args.batch_size,eval_batch_size=args.batch_size,
+        test_type='',subsample_ratio=1.0,encode_once=False,dynamic_padding=False,dfg_cache_dir=None,mask_cache_size=0,
+        model_type='codet5',task='clone',sub_task='',data_num=-1,add_task_prefix=False,
+        cache_path=out_dir,output_dir=out_dir,local_rank=-1,n_gpu=0,device=torch.device('cpu'))
+
+
+def load_tokenizer(kind, tokenizer_dir):
+    if kind=='gpt2':
+        from transformers import GPT2Tokenizer
+        return GPT2Tokenizer.from_pretrained(tokenizer_dir,bos_token='<s>',eos_token='</s>',pad_token='<pad>')
+    from transformers import RobertaTokenizer
+    return RobertaTokenizer.from_pretrained(tokenizer_dir)
+
+
+def _stage(seconds, num_pairs):
+    return {'seconds':round(seconds,4),
+            'pairs_per_second':round(num_pairs/seconds,1) if seconds>0 else None,
+            'peak_rss_mb':peak_rss_mb()}
+
+
+def benchmark_family(name, data_dir, work_dir, args):
+    """Run the four stages of one family on a private copy of data_dir."""
+    family=FAMILIES[name]()
+    reason=family.available()
+    if reason is not None:
+        return {'skipped':reason}
+    # private copy, so caches the family writes next to its data start cold
+    family_dir=os.path.join(work_dir,name)
+    shutil.rmtree(family_dir,ignore_errors=True)
+    shutil.copytree(data_dir,os.path.join(family_dir,'data'))
+    pairs_file=os.path.join(family_dir,'data','test.txt')
+    family.load()
+    torch.manual_seed(args.seed)
+    torch.set_num_threads(args.threads)
+    tokenizer=load_tokenizer(family.tokenizer_kind,os.path.join(family_dir,'data','tokenizer'))
+    fargs=family_args(args,family_dir)
+    result={}
+
+    pool=family.pool(fargs,tokenizer,args.workers)
+    try:
+        start=time.time()
+        dataset=family.featurize(fargs,tokenizer,pairs_file,pool)
+        result['tokenize']=_stage(time.time()-start,len(dataset))
+    finally:
+        pool.close()
+        pool.join()
+    num_pairs=len(dataset)
+
+    start=time.time()
+    dataloader=DataLoader(dataset,sampler=SequentialSampler(dataset),batch_size=args.batch_size,
+                          collate_fn=family.collate_fn())
+    batches=list(dataloader)
+    result['collate']=_stage(time.time()-start,num_pairs)
+
+    model=family.build_model(fargs,tokenizer)
+    model.eval()
+    latencies=[]
+    probs=[]
+    with torch.no_grad():
+        # first call pays for lazy initialisation, keep it out of the timings
+        family.forward(model,batches[0])
+        for batch in batches:
+            start=time.time()
+            probs.append(family.forward(model,batch).cpu().numpy())
+            latencies.append(time.time()-start)
+    result['forward']=_stage(sum(latencies),num_pairs)
+    result['forward']['batch_ms']={'mean':round(1000*float(np.mean(latencies)),3),
+                                   'p50':round(1000*float(np.percentile(latencies,50)),3),
+                                   'p90':round(1000*float(np.percentile(latencies,90)),3)}
+
+    probs=np.concatenate(probs,0)
+    y_trues=np.concatenate([batch[-1].numpy() for batch in batches],0)
+    start=time.time()
+    scores=family.metric(y_trues,probs[:,1])
+    result['metric']=_stage(time.time()-start,num_pairs)
+    result['metric']['scores']=scores
+
+    total=sum(result[stage]['seconds'] for stage in stages)
+    result['end_to_end']=_stage(total,num_pairs)
+    result['num_pairs']=num_pairs
+    result['num_batches']=len(batches)
+    result['num_parameters']=sum(p.numel() for p in model.parameters())
+    return result
@@ -0,0 +1,87 @@
+# Synthetic BCB-shaped data for the benchmark.
+#
+# Writes <out>/data.jsonl ({"idx","func"} per Java function, with a long-tailed
+# number of statements like BigCloneBench), <out>/test.txt (url1 \t url2 \t
+# label, clones are renamed copies) and a small byte-level BPE vocabulary in
+# <out>/tokenizer (vocab.json + merges.txt) that loads with both
+# RobertaTokenizer and GPT2Tokenizer. The pair file is called test.txt because
+# the run.py datasets subsample every other split.
+import json
+import os
+import random
+
+from tokenizers import ByteLevelBPETokenizer
+
+special_tokens = ["<s>", "<pad>", "</s>", "<unk>", "<mask>"]
+
+_types = ['int', 'long', 'double', 'String', 'boolean']
+_names = ['count', 'total', 'index', 'value', 'result', 'buffer', 'size', 'offset', 'line', 'item',
+          'key', 'data', 'path', 'name', 'left', 'right', 'node', 'limit', 'flag', 'temp']
+
+
+def _statement(rng, variables):
+    a=rng.choice(variables)
+    b=rng.choice(variables)
+    kind=rng.randint(0,4)
+    if kind==0:
+        return '{} = {} + {};'.format(a,b,rng.randint(1,9))
+    if kind==1:
+        return 'if ({} > {}) {{ {} = {} * 2; }}'.format(a,b,a,b)
+    if kind==2:
+        return 'for (int i = 0; i < {}; i++) {{ {} += i; }}'.format(b,a)
+    if kind==3:
+        return 'while ({} < {}) {{ {}++; }}'.format(a,b,a)
+    return 'System.out.println({} - {});'.format(a,b)
+
+
+def make_function(rng, name, num_statements):
+    variables=rng.sample(_names,4)
+    params=', '.join('int {}'.format(v) for v in variables[:2])
+    body=['int {} = 0;'.format(v) for v in variables[2:]]
+    body+=[_statement(rng,variables) for _ in range(num_statements)]
+    body.append('return {};'.format(variables[-1]))
+    return 'public static {} {}({}) {{\n    {}\n}}'.format(rng.choice(_types),name,params,'\n    '.join(body))
+
+
+def rename(code, rng):
+    """A type-2 clone: same structure, different identifiers."""
+    for name in _names:
+        code=code.replace(name,name+'_'+str(rng.randint(0,99)))
+    return code
+
+
+def write_dataset(out_dir, num_functions=200, num_pairs=1000, seed=42):
+    """Write data.jsonl, test.txt and the tokenizer, returns the pair file path."""
+    rng=random.Random(seed)
+    os.makedirs(out_dir,exist_ok=True)
+    functions={}
+    clones=[]
+    for idx in range(num_functions):
+        if idx%2==1 and rng.random()<0.5:
+            functions[str(idx)]=rename(functions[str(idx-1)],rng)
+            clones.append((str(idx-1),str(idx)))
+        else:
+            # log-normal statement counts, most functions are short and a few are very long
+            num_statements=max(1,min(200,int(rng.lognormvariate(2.0,0.9))))
+            functions[str(idx)]=make_function(rng,'method{}'.format(idx),num_statements)
+    with open(os.path.join(out_dir,'data.jsonl'),'w') as f:
+        for idx,code in functions.items():
+            f.write(json.dumps({'idx':idx,'func':code})+'\n')
+
+    urls=list(functions)
+    with open(os.path.join(out_dir,'test.txt'),'w') as f:
+        for _ in range(num_pairs):
+            if clones and rng.random()<0.3:
+                url1,url2=rng.choice(clones)
+            else:
+                url1,url2=rng.choice(urls),rng.choice(urls)
+            label=int(url1==url2 or (url1,url2) in clones)
+            f.write('{}\t{}\t{}\n'.format(url1,url2,label))
+
+    tokenizer=ByteLevelBPETokenizer()
+    tokenizer.train_from_iterator([' '.join(code.split()) for code in functions.values()],
+                                  vocab_size=1000,min_frequency=2,special_tokens=special_tokens,show_progress=False)
+    tokenizer_dir=os.path.join(out_dir,'tokenizer')
+    os.makedirs(tokenizer_dir,exist_ok=True)
+    tokenizer.save_model(tokenizer_dir)
+    return os.path.join(out_dir,'test.txt')
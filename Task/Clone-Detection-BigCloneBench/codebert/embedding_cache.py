@@ -0,0 +1,92 @@
+# Encode-once inference for clone-pair evaluation.
+#
+# Model.forward encodes both functions of every pair, so a function that shows
+# up in many test pairs is re-encoded once per pair. Here each unique url is
+# encoded exactly once into an on-disk embedding table (<prefix>.npy plus a
+# <prefix>.urls.json row index) and the pairs are scored by running only the
+# classification head over gathered rows.
+import json
+import logging
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, SequentialSampler, TensorDataset
+from tqdm import tqdm
+
+logger = logging.getLogger(__name__)
+
+# pairs are cheap to score, so the head runs over large slices of the table
+score_batch_size = 4096
+
+
+def get_function_ids(item):
+    code,tokenizer,args=item
+    code=' '.join(code.split())
+    code_tokens=tokenizer.tokenize(code)[:args.block_size-2]
+    code_tokens=[tokenizer.cls_token]+code_tokens+[tokenizer.sep_token]
+    code_ids=tokenizer.convert_tokens_to_ids(code_tokens)
+    code_ids+=[tokenizer.pad_token_id]*(args.block_size-len(code_ids))
+    return code_ids
+
+
+def build_embedding_table(args, model, tokenizer, url_to_code, urls, table_prefix, pool=None):
+    """Encode every url once and write the vectors to <table_prefix>.npy."""
+    items=[(url_to_code[url],tokenizer,args) for url in urls]
+    if pool is not None:
+        function_ids=pool.map(get_function_ids,tqdm(items,total=len(items)))
+    else:
+        function_ids=[get_function_ids(item) for item in tqdm(items,total=len(items))]
+    dataset=TensorDataset(torch.tensor(function_ids))
+    # a pair batch encodes 2B functions, keep the same encoder batch size
+    dataloader=DataLoader(dataset,sampler=SequentialSampler(dataset),batch_size=args.eval_batch_size*2)
+
+    model.eval()
+    table=None
+    row=0
+    for batch in tqdm(dataloader,total=len(dataloader)):
+        inputs=batch[0].to(args.device)
+        with torch.no_grad():
+            vecs=model.encode(inputs).float().cpu().numpy()
+        if table is None:
+            table=np.lib.format.open_memmap(table_prefix+'.npy',mode='w+',dtype=np.float32,
+                                            shape=(len(urls),vecs.shape[-1]))
+        table[row:row+len(vecs)]=vecs
+        row+=len(vecs)
+    table.flush()
+    with open(table_prefix+'.urls.json','w') as f:
+        json.dump(list(urls),f)
+    logger.info("  Encoded %d unique functions into %s.npy", len(urls), table_prefix)
+    return table
+
+
+def load_embedding_table(table_prefix):
+    table=np.load(table_prefix+'.npy',mmap_mode='r')
+    with open(table_prefix+'.urls.json') as f:
+        urls=json.load(f)
+    return table,{url:idx for idx,url in enumerate(urls)}
+
+
+def score_pairs(args, model, table, url_index, pairs):
+    """Run the classification head over gathered table rows, returns B * 2 probabilities."""
+    idx1=np.array([url_index[url1] for url1,_,_ in pairs],dtype=np.int64)
+    idx2=np.array([url_index[url2] for _,url2,_ in pairs],dtype=np.int64)
+    probs=[]
+    model.eval()
+    for start in range(0,len(pairs),score_batch_size):
+        vec1=torch.from_numpy(np.asarray(table[idx1[start:start+score_batch_size]])).to(args.device)
+        vec2=torch.from_numpy(np.asarray(table[idx2[start:start+score_batch_size]])).to(args.device)
+        with torch.no_grad():
+            probs.append(model.classify(vec1,vec2).cpu().numpy())
+    return np.concatenate(probs,0)
+
+
+def encode_once_predict(args, model, tokenizer, url_to_code, pairs, table_prefix, pool=None):
+    """Score (url1,url2,label) pairs, encoding each distinct function exactly once."""
+    model=model.module if hasattr(model,'module') else model
+    if len(pairs)==0:
+        return np.zeros((0,2),dtype=np.float32)
+    urls=list(dict.fromkeys(url for url1,url2,_ in pairs for url in (url1,url2)))
+    logger.info("  Num pairs = %d, unique functions = %d", len(pairs), len(urls))
+    build_embedding_table(args,model,tokenizer,url_to_code,urls,table_prefix,pool=pool)
+    table,url_index=load_embedding_table(table_prefix)
+    return score_pairs(args,model,table,url_index,pairs)
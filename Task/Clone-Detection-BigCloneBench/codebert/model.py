@@ -37,10 +37,21 @@ class Model(nn.Module):
         self.args=args
     
         
-    def forward(self, input_ids=None,labels=None): 
+    def encode(self, input_ids):
+        """Encode each function independently into its <s> vector."""
         input_ids=input_ids.view(-1,self.args.block_size)
         outputs = self.encoder(input_ids= input_ids,attention_mask=input_ids.ne(1))[0]
-        logits=self.classifier(outputs)
+        return outputs[:,0,:] # 2B * D
+
+    def classify(self, vec1, vec2):
+        """Score pairs from precomputed function vectors (see encode)."""
+        features=torch.stack((vec1,vec2),1).view(-1,1,vec1.size(-1)) # 2B * 1 * D
+        logits=self.classifier(features)
+        return F.softmax(logits,-1)
+        
+    def forward(self, input_ids=None,labels=None): 
+        outputs=self.encode(input_ids)
+        logits=self.classifier(outputs[:,None,:])
         prob=F.softmax(logits)
         if labels is not None:
             loss_fct = CrossEntropyLoss()
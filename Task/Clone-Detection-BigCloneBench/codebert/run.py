@@ -43,6 +43,7 @@ except:
 from tqdm import tqdm, trange
 import multiprocessing
 from model import Model
+from embedding_cache import encode_once_predict
 
 cpu_cont = 16
 from transformers import (WEIGHTS_NAME, AdamW, get_linear_schedule_with_warmup,
@@ -119,36 +120,51 @@ def convert_examples_to_features(code1_tokens,code2_tokens,label,url1,url2,token
     source_ids=code1_ids+code2_ids
     return InputFeatures(source_tokens,source_ids,label,url1,url2)
 
+def load_pairs(args, file_path):
+    """Read the url->code mapping and the (url1,url2,label) pairs of an index file."""
+    index_filename=file_path
+    url_to_code={}
+    with open('/'.join(index_filename.split('/')[:-1])+'/{}/data.jsonl'.format(args.test_type)) as f:
+        for line in f:
+            line=line.strip()
+            js=json.loads(line)
+            url_to_code[js['idx']]=js['func']
+
+    pairs=[]
+    # f=open(index_filename) # M. Song - 2026.2.5 - unused file descriptor.
+    with open(index_filename) as f:
+        for line in f:
+            line=line.strip()
+            url1,url2,label=line.split('\t')
+            if url1 not in url_to_code or url2 not in url_to_code:
+                continue
+            if label=='0':
+                label=0
+            else:
+                label=1
+            pairs.append((url1,url2,label))
+    # NOTE: 10% sampling is handled externally (train_10percent.txt / valid_10percent.txt)
+    # if 'test' not in postfix:
+    #     data=random.sample(data,int(len(data)*0.1))
+    return url_to_code,pairs
+
+def encode_once_inference(args, model, tokenizer, file_path, pool=None):
+    """Pair logits from an embedding table holding each function of file_path once."""
+    url_to_code,pairs=load_pairs(args,file_path)
+    postfix=file_path.split('/')[-1].split('.txt')[0]
+    table_prefix=os.path.join(args.output_dir,'embeddings_{}'.format(postfix))
+    logits=encode_once_predict(args,model,tokenizer,url_to_code,pairs,table_prefix,pool=pool)
+    y_trues=np.array([label for _,_,label in pairs])
+    return pairs,logits,y_trues
+
 class TextDataset(Dataset):
     def __init__(self, tokenizer, args, file_path='train', block_size=512,pool=None):
         postfix=file_path.split('/')[-1].split('.txt')[0]
         self.examples = []
-        index_filename=file_path
-        logger.info("Creating features from index file at %s ", index_filename)
-        url_to_code={}
-        with open('/'.join(index_filename.split('/')[:-1])+'/{}/data.jsonl'.format(args.test_type)) as f:
-            for line in f:
-                line=line.strip()
-                js=json.loads(line)
-                url_to_code[js['idx']]=js['func']
-
-        data=[]
+        logger.info("Creating features from index file at %s ", file_path)
+        url_to_code,pairs=load_pairs(args,file_path)
         cache={}
-        # f=open(index_filename) # M. Song - 2026.2.5 - unused file descriptor.
-        with open(index_filename) as f:
-            for line in f:
-                line=line.strip()
-                url1,url2,label=line.split('\t')
-                if url1 not in url_to_code or url2 not in url_to_code:
-                    continue
-                if label=='0':
-                    label=0
-                else:
-                    label=1
-                data.append((url1,url2,label,tokenizer, args,cache,url_to_code))
-        # NOTE: 10% sampling is handled externally (train_10percent.txt / valid_10percent.txt)
-        # if 'test' not in postfix:
-        #     data=random.sample(data,int(len(data)*0.1))
+        data=[(url1,url2,label,tokenizer,args,cache,url_to_code) for url1,url2,label in pairs]
         logger.info(f"[Dataset] postfix={postfix} pairs_loaded={len(data)}")
 
         self.examples=pool.map(get_example,tqdm(data,total=len(data)))
@@ -321,39 +337,44 @@ def train(args, train_dataset, model, tokenizer,pool):
 def evaluate(args, model, tokenizer, prefix="",pool=None,eval_when_training=False,test=False):
     # Loop to handle MNLI double evaluation (matched, mis-matched)
     eval_output_dir = args.output_dir
-    eval_dataset = load_and_cache_examples(args, tokenizer, test=test,evaluate=True,pool=pool)
     if not os.path.exists(eval_output_dir) and args.local_rank in [-1, 0]:
         os.makedirs(eval_output_dir)
 
     args.eval_batch_size = args.per_gpu_eval_batch_size * max(1, args.n_gpu)
-    # Note that DistributedSampler samples randomly
-    eval_sampler = SequentialSampler(eval_dataset) if args.local_rank == -1 else DistributedSampler(eval_dataset)
-    eval_dataloader = DataLoader(eval_dataset, sampler=eval_sampler, batch_size=args.eval_batch_size,num_workers=4,pin_memory=True)
-
-    # multi-gpu evaluate
-    if args.n_gpu > 1 and eval_when_training is False:
-        model = torch.nn.DataParallel(model)
-
-    # Eval!
-    logger.info("***** Running evaluation {} *****".format(prefix))
-    logger.info("  Num examples = %d", len(eval_dataset))
-    logger.info("  Batch size = %d", args.eval_batch_size)
-    eval_loss = 0.0
-    nb_eval_steps = 0
-    model.eval()
-    logits=[]  
-    y_trues=[]
-    for batch in tqdm(eval_dataloader,total=len(eval_dataloader)):
-        inputs = batch[0].to(args.device)        
-        labels=batch[1].to(args.device) 
-        with torch.no_grad():
-            lm_loss,logit = model(inputs,labels)
-            eval_loss += lm_loss.mean().item()
-            logits.append(logit.cpu().numpy())
-            y_trues.append(labels.cpu().numpy())
-        nb_eval_steps += 1
-    logits=np.concatenate(logits,0)
-    y_trues=np.concatenate(y_trues,0)
+    if args.encode_once:
+        logger.info("***** Running evaluation {} (encode once) *****".format(prefix))
+        _,logits,y_trues=encode_once_inference(args, model, tokenizer,
+                                               args.test_data_file if test else args.eval_data_file,pool=pool)
+    else:
+        eval_dataset = load_and_cache_examples(args, tokenizer, test=test,evaluate=True,pool=pool)
+        # Note that DistributedSampler samples randomly
+        eval_sampler = SequentialSampler(eval_dataset) if args.local_rank == -1 else DistributedSampler(eval_dataset)
+        eval_dataloader = DataLoader(eval_dataset, sampler=eval_sampler, batch_size=args.eval_batch_size,num_workers=4,pin_memory=True)
+
+        # multi-gpu evaluate
+        if args.n_gpu > 1 and eval_when_training is False:
+            model = torch.nn.DataParallel(model)
+
+        # Eval!
+        logger.info("***** Running evaluation {} *****".format(prefix))
+        logger.info("  Num examples = %d", len(eval_dataset))
+        logger.info("  Batch size = %d", args.eval_batch_size)
+        eval_loss = 0.0
+        nb_eval_steps = 0
+        model.eval()
+        logits=[]  
+        y_trues=[]
+        for batch in tqdm(eval_dataloader,total=len(eval_dataloader)):
+            inputs = batch[0].to(args.device)        
+            labels=batch[1].to(args.device) 
+            with torch.no_grad():
+                lm_loss,logit = model(inputs,labels)
+                eval_loss += lm_loss.mean().item()
+                logits.append(logit.cpu().numpy())
+                y_trues.append(labels.cpu().numpy())
+            nb_eval_steps += 1
+        logits=np.concatenate(logits,0)
+        y_trues=np.concatenate(y_trues,0)
     best_threshold=0
     best_f1=0
     for i in range(1,100):
@@ -393,44 +414,49 @@ def evaluate(args, model, tokenizer, prefix="",pool=None,eval_when_training=Fals
 
 def test(args, model, tokenizer, prefix="",pool=None,best_threshold=0):
     # Loop to handle MNLI double evaluation (matched, mis-matched)
-    eval_dataset = load_and_cache_examples(args, tokenizer, test=True,pool=pool)
-
     args.eval_batch_size = args.per_gpu_eval_batch_size * max(1, args.n_gpu)
-    # Note that DistributedSampler samples randomly
-    eval_sampler = SequentialSampler(eval_dataset) if args.local_rank == -1 else DistributedSampler(eval_dataset)
-    eval_dataloader = DataLoader(eval_dataset, sampler=eval_sampler, batch_size=args.eval_batch_size,num_workers=4,pin_memory=True)
-
-    # multi-gpu evaluate
-    if args.n_gpu > 1:
-        model = torch.nn.DataParallel(model)
-
-    # Eval!
-    logger.info("***** Running Test {} *****".format(prefix))
-    logger.info("  Num examples = %d", len(eval_dataset))
-    logger.info("  Batch size = %d", args.eval_batch_size)
-    eval_loss = 0.0
-    nb_eval_steps = 0
-    model.eval()
-    logits=[]  
-    y_trues=[]
-    for batch in tqdm(eval_dataloader, total=len(eval_dataloader)):
-        inputs = batch[0].to(args.device)        
-        labels=batch[1].to(args.device) 
-        with torch.no_grad():
-            lm_loss,logit = model(inputs,labels)
-            eval_loss += lm_loss.mean().item()
-            logits.append(logit.cpu().numpy())
-            y_trues.append(labels.cpu().numpy())
-        nb_eval_steps += 1
-    logits=np.concatenate(logits,0)
-    y_trues=np.concatenate(y_trues,0)
+    if args.encode_once:
+        logger.info("***** Running Test {} (encode once) *****".format(prefix))
+        pairs,logits,y_trues=encode_once_inference(args, model, tokenizer, args.test_data_file, pool=pool)
+    else:
+        eval_dataset = load_and_cache_examples(args, tokenizer, test=True,pool=pool)
+        pairs=[(example.url1,example.url2,example.label) for example in eval_dataset.examples]
+
+        # Note that DistributedSampler samples randomly
+        eval_sampler = SequentialSampler(eval_dataset) if args.local_rank == -1 else DistributedSampler(eval_dataset)
+        eval_dataloader = DataLoader(eval_dataset, sampler=eval_sampler, batch_size=args.eval_batch_size,num_workers=4,pin_memory=True)
+
+        # multi-gpu evaluate
+        if args.n_gpu > 1:
+            model = torch.nn.DataParallel(model)
+
+        # Eval!
+        logger.info("***** Running Test {} *****".format(prefix))
+        logger.info("  Num examples = %d", len(eval_dataset))
+        logger.info("  Batch size = %d", args.eval_batch_size)
+        eval_loss = 0.0
+        nb_eval_steps = 0
+        model.eval()
+        logits=[]  
+        y_trues=[]
+        for batch in tqdm(eval_dataloader, total=len(eval_dataloader)):
+            inputs = batch[0].to(args.device)        
+            labels=batch[1].to(args.device) 
+            with torch.no_grad():
+                lm_loss,logit = model(inputs,labels)
+                eval_loss += lm_loss.mean().item()
+                logits.append(logit.cpu().numpy())
+                y_trues.append(labels.cpu().numpy())
+            nb_eval_steps += 1
+        logits=np.concatenate(logits,0)
+        y_trues=np.concatenate(y_trues,0)
     y_preds=logits[:,1]>best_threshold
     with open(os.path.join(args.output_dir,"predictions.txt"),'w') as f:
-        for example,pred in zip(eval_dataset.examples,y_preds):
+        for (url1,url2,_),pred in zip(pairs,y_preds):
             if pred:
-                f.write(example.url1+'\t'+example.url2+'\t'+'1'+'\n')
+                f.write(url1+'\t'+url2+'\t'+'1'+'\n')
             else:
-                f.write(example.url1+'\t'+example.url2+'\t'+'0'+'\n')
+                f.write(url1+'\t'+url2+'\t'+'0'+'\n')
     
     from sklearn.metrics import recall_score
     recall=recall_score(y_trues, y_preds, average='macro')
@@ -545,6 +571,8 @@ def main():
                         help="For distributed training: local_rank")
     parser.add_argument('--server_ip', type=str, default='', help="For distant debugging.")
     parser.add_argument('--server_port', type=str, default='', help="For distant debugging.")
+    parser.add_argument("--encode_once", action='store_true',
+                        help="Evaluate/test by encoding each unique function once and scoring pairs from the embedding table.")
 
     
     pool = multiprocessing.Pool(cpu_cont)
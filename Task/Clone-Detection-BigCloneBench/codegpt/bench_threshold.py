@@ -0,0 +1,97 @@
+# Timing benchmark for the evaluate() threshold search.
+#
+# Compares the old 0.01..0.99 loop over sklearn metrics with the sorted sweep of
+# threshold_search.py on a synthetic clone-probability vector, and checks that
+# both agree: on the legacy grid every threshold must give the sklearn
+# precision/recall/F1, and the exact best threshold is re-scored with sklearn.
+#
+#   python bench_threshold.py --num_pairs 1000000
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import json
+import time
+
+import numpy as np
+from sklearn.metrics import f1_score, precision_score, recall_score
+
+from threshold_search import find_best_threshold, threshold_sweep
+
+
+def synthetic_scores(num_pairs, clone_ratio, seed):
+    """Labels and float32 clone probabilities shaped like logits[:,1] of evaluate()."""
+    rng=np.random.RandomState(seed)
+    y_trues=(rng.rand(num_pairs)<clone_ratio).astype(np.int64)
+    margin=rng.randn(num_pairs)+np.where(y_trues==1,1.5,-1.5)
+    scores=(1/(1+np.exp(-margin))).astype(np.float32)
+    # softmax outputs saturate, keep some exact ties like real logits have
+    return y_trues,np.round(scores,5).astype(np.float32)
+
+
+def legacy_search(y_trues, scores):
+    best_threshold=0
+    best_f1=-1
+    curve=[]
+    for i in range(1,100):
+        threshold=i/100
+        y_preds=scores>threshold
+        recall=recall_score(y_trues, y_preds, average='macro')
+        precision=precision_score(y_trues, y_preds, average='macro')
+        f1=f1_score(y_trues, y_preds, average='macro')
+        curve.append((precision,recall,f1))
+        if f1>best_f1:
+            best_f1=f1
+            best_threshold=threshold
+    return best_threshold,np.array(curve)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_pairs", default=1000000, type=int)
+    parser.add_argument("--clone_ratio", default=0.3, type=float)
+    parser.add_argument("--seed", default=42, type=int)
+    parser.add_argument("--repeat", default=3, type=int,
+                        help="Timed runs of the sorted sweep, the best one is reported.")
+    parser.add_argument("--skip_legacy", action='store_true',
+                        help="Do not time the sklearn loop (it takes minutes at 1M pairs).")
+    args = parser.parse_args()
+
+    y_trues,scores=synthetic_scores(args.num_pairs,args.clone_ratio,args.seed)
+    report={'num_pairs':args.num_pairs,'distinct_scores':int(len(np.unique(scores)))}
+
+    sweep_time=float('inf')
+    for _ in range(args.repeat):
+        start=time.time()
+        best=find_best_threshold(y_trues,scores)
+        sweep_time=min(sweep_time,time.time()-start)
+    report['sweep_seconds']=round(sweep_time,4)
+    report['best']=best
+
+    # exact best threshold, re-scored with sklearn
+    y_preds=scores>best['threshold']
+    expected=(precision_score(y_trues,y_preds,average='macro'),
+              recall_score(y_trues,y_preds,average='macro'),
+              f1_score(y_trues,y_preds,average='macro'))
+    assert np.allclose((best['precision'],best['recall'],best['f1']),expected,rtol=0,atol=1e-12),expected
+
+    grid=[i/100 for i in range(1,100)]
+    start=time.time()
+    grid_best=find_best_threshold(y_trues,scores,grid)
+    report['sweep_grid_seconds']=round(time.time()-start,4)
+    report['grid_best']=grid_best
+    assert grid_best['f1']<=best['f1']
+
+    if not args.skip_legacy:
+        start=time.time()
+        legacy_threshold,legacy_curve=legacy_search(y_trues,scores)
+        report['legacy_seconds']=round(time.time()-start,4)
+        _,precision,recall,f1=threshold_sweep(y_trues,scores,grid)
+        assert np.allclose(np.stack([precision,recall,f1],1),legacy_curve,rtol=0,atol=1e-12)
+        assert legacy_threshold==grid_best['threshold'],(legacy_threshold,grid_best)
+        report['speedup']=round(report['legacy_seconds']/max(sweep_time,1e-9),1)
+
+    print(json.dumps(report,indent=2))
+
+
+if __name__ == "__main__":
+    main()
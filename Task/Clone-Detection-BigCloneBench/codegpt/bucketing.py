@@ -0,0 +1,93 @@
+# Length-bucketed batching for clone pairs.
+#
+# TextDataset pads both functions of a pair to block_size, but BCB functions are
+# long-tailed and most of a batch is padding. BucketBatchSampler groups pairs of
+# similar length (the longer function of the pair) into the same batch and
+# PairCollator cuts each batch down to its longest function, so attention only
+# runs over block_size columns when a batch really needs them.
+import numpy as np
+import torch
+from torch.utils.data import Sampler
+
+# pairs are sorted by length inside windows of this many batches
+bucket_batches = 100
+
+
+def pair_lengths(dataset):
+    """Unpadded length of the longer function of every pair of a TextDataset."""
+    lengths=np.minimum(dataset.store.lengths(),dataset.args.block_size-2)+2 # <bos> ... <eos>
+    return lengths[dataset.rows].max(-1) if len(dataset.rows) else np.zeros(0,dtype=np.int64)
+
+
+class BucketBatchSampler(Sampler):
+    """Shuffled batches of indices with similar lengths.
+
+    Indices are shuffled, cut into windows of bucket_batches batches, sorted by
+    length inside each window, batched, and the batch order is shuffled again.
+    The permutation is drawn from the global torch RNG (like RandomSampler), so
+    batches are reproducible after set_seed and identical on every rank; rank r
+    of num_replicas takes every num_replicas-th batch.
+    """
+    def __init__(self, lengths, batch_size, num_replicas=1, rank=0):
+        self.lengths=np.asarray(lengths)
+        self.batch_size=batch_size
+        self.num_replicas=num_replicas
+        self.rank=rank
+
+    def _batches(self):
+        seed=int(torch.empty((),dtype=torch.int64).random_().item())
+        generator=torch.Generator()
+        generator.manual_seed(seed)
+        indices=torch.randperm(len(self.lengths),generator=generator).numpy()
+        window=self.batch_size*bucket_batches
+        batches=[]
+        for start in range(0,len(indices),window):
+            chunk=indices[start:start+window]
+            chunk=chunk[np.argsort(self.lengths[chunk],kind='stable')]
+            batches.extend(chunk[i:i+self.batch_size].tolist() for i in range(0,len(chunk),self.batch_size))
+        order=torch.randperm(len(batches),generator=generator).tolist()
+        return [batches[i] for i in order]
+
+    def __iter__(self):
+        batches=self._batches()
+        if self.num_replicas>1 and batches:
+            # every rank runs the same number of steps
+            total=len(self)*self.num_replicas
+            batches=(batches+batches[:total-len(batches)])[self.rank:total:self.num_replicas]
+        return iter(batches)
+
+    def __len__(self):
+        num_batches=(len(self.lengths)+self.batch_size-1)//self.batch_size
+        return (num_batches+self.num_replicas-1)//self.num_replicas
+
+
+class PairCollator(object):
+    """Stack (input_ids, label) items and drop the pad columns no function of the batch uses."""
+    def __init__(self, pad_token_id):
+        self.pad_token_id=pad_token_id
+
+    def __call__(self, batch):
+        input_ids=torch.stack([x[0] for x in batch])
+        labels=torch.stack([x[1] for x in batch])
+        functions=input_ids.view(len(batch),2,-1)
+        max_len=int(functions.ne(self.pad_token_id).sum(-1).max())
+        return functions[:,:,:max_len].reshape(len(batch),-1),labels
+
+
+class PaddingStats(object):
+    """Fraction of real (non-pad) tokens among the tokens fed to the encoder."""
+    def __init__(self, pad_token_id):
+        self.pad_token_id=pad_token_id
+        self.reset()
+
+    def reset(self):
+        self.real_tokens=0
+        self.total_tokens=0
+
+    def update(self, input_ids):
+        self.real_tokens+=int(input_ids.ne(self.pad_token_id).sum())
+        self.total_tokens+=input_ids.numel()
+
+    @property
+    def efficiency(self):
+        return self.real_tokens/self.total_tokens if self.total_tokens else 0.0
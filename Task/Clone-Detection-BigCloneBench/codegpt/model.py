@@ -36,11 +36,21 @@ class Model(nn.Module):
         self.args=args
     
         
-    def forward(self, input_ids=None,labels=None): 
-        input_ids=input_ids.view(-1,self.args.block_size)
+    def encode(self, input_ids):
+        """Encode each function (rows of input_ids) independently into its last-token vector."""
         outputs = self.encoder(input_ids= input_ids,attention_mask=input_ids.ne(self.tokenizer.pad_token_id))[0] # 2B * L * D
         sequence_lengths = torch.ne(input_ids, self.tokenizer.pad_token_id).sum(-1) - 1
-        outputs=outputs[range(input_ids.size(0)),sequence_lengths,:] # 2B * D
+        return outputs[range(input_ids.size(0)),sequence_lengths,:] # 2B * D
+
+    def classify(self, vec1, vec2):
+        """Score pairs from precomputed function vectors (see encode)."""
+        outputs=torch.stack((vec1,vec2),1).view(-1,vec1.size(-1)) # 2B * D
+        logits=self.classifier(outputs)
+        return F.softmax(logits,-1)
+        
+    def forward(self, input_ids=None,labels=None): 
+        # pairs are two functions side by side, padded to block_size or to the batch max
+        outputs=self.encode(input_ids.view(-1,input_ids.size(-1)//2)) # 2B * D
         logits=self.classifier(outputs) # 2B * D
         prob=F.softmax(logits) # B * 2
         if labels is not None:
@@ -43,6 +43,10 @@ except:
 from tqdm import tqdm, trange
 import multiprocessing
 from model import Model
+from embedding_cache import encode_once_predict
+from token_store import load_token_store, function_input_ids
+from threshold_search import find_best_threshold
+from bucketing import BucketBatchSampler, PairCollator, PaddingStats, pair_lengths
 
 cpu_cont = 16
 from transformers import (WEIGHTS_NAME, AdamW, get_linear_schedule_with_warmup,
@@ -62,28 +66,6 @@ MODEL_CLASSES = {
     'distilbert': (DistilBertConfig, DistilBertForMaskedLM, DistilBertTokenizer)
 }
 
-def get_example(item):
-    url1,url2,label,tokenizer,args,cache,url_to_code=item
-    if url1 in cache:
-        code1=cache[url1].copy()
-    else:
-        try:
-            code=' '.join(url_to_code[url1].split())
-        except:
-            code=""
-        code1=tokenizer.tokenize(code)
-    if url2 in cache:
-        code2=cache[url2].copy()
-    else:
-        try:
-            code=' '.join(url_to_code[url2].split())
-        except:
-            code=""
-        code2=tokenizer.tokenize(code)
-        
-    return convert_examples_to_features(code1,code2,label,url1,url2,tokenizer,args,cache)
-
-
 class InputFeatures(object):
     """A single training/test features for a example."""
     def __init__(self,
@@ -100,78 +82,87 @@ class InputFeatures(object):
         self.url1=url1
         self.url2=url2
         
-def convert_examples_to_features(code1_tokens,code2_tokens,label,url1,url2,tokenizer,args,cache):
+def convert_examples_to_features(code1_ids,code2_ids,label,url1,url2,tokenizer,args):
     #source
-    code1_tokens=code1_tokens[:args.block_size-2]
-    code1_tokens =[tokenizer.bos_token]+code1_tokens+[tokenizer.eos_token]
-    code2_tokens=code2_tokens[:args.block_size-2]
-    code2_tokens =[tokenizer.bos_token]+code2_tokens+[tokenizer.eos_token]  
-    
-    code1_ids=tokenizer.convert_tokens_to_ids(code1_tokens)
-    padding_length = args.block_size - len(code1_ids)
-    code1_ids+=[tokenizer.pad_token_id]*padding_length
-    
-    code2_ids=tokenizer.convert_tokens_to_ids(code2_tokens)
-    code2_length=len(code2_ids)
-    padding_length = args.block_size - code2_length
-    code2_ids+=[tokenizer.pad_token_id]*padding_length
-    
-    source_tokens=code1_tokens+code2_tokens
+    code1_ids=function_input_ids(code1_ids,tokenizer,args.block_size)
+    code2_ids=function_input_ids(code2_ids,tokenizer,args.block_size)
     source_ids=code1_ids+code2_ids
-    length=len(code1_ids)+code2_length
+    source_tokens=[x for x in tokenizer.convert_ids_to_tokens(source_ids) if x!=tokenizer.pad_token]
     return InputFeatures(source_tokens,source_ids,label,url1,url2)
 
+def get_token_store(args, tokenizer, file_path, pool=None):
+    """Pretokenized functions of the data.jsonl that belongs to an index file."""
+    data_file='/'.join(file_path.split('/')[:-1])+'/{}/data.jsonl'.format(args.test_type)
+    return load_token_store(data_file,tokenizer,pool=pool)
+
+def load_pairs(args, file_path, store):
+    """Read the (url1,url2,label) pairs of an index file whose functions are in store."""
+    postfix=file_path.split('/')[-1].split('.txt')[0]
+    pairs=[]
+    with open(file_path) as f:
+        for line in f:
+            line=line.strip()
+            url1,url2,label=line.split('\t')
+            if url1 not in store or url2 not in store:
+                continue
+            if label=='0':
+                label=0
+            else:
+                label=1
+            pairs.append((url1,url2,label))
+    # if 'test' not in postfix: # m. song - updated to load data fully.
+    #     data=random.sample(data,int(len(data)*0.1))
+    ratio = getattr(args, "subsample_ratio", 1.0)
+    if ratio < 1.0 and 'test' not in postfix:
+        k = max(1, int(len(pairs) * ratio))
+        pairs = random.sample(pairs, k)
+    return pairs
+
+def encode_once_inference(args, model, tokenizer, file_path, pool=None):
+    """Pair logits from an embedding table holding each function of file_path once."""
+    store=get_token_store(args,tokenizer,file_path,pool=pool)
+    pairs=load_pairs(args,file_path,store)
+    postfix=file_path.split('/')[-1].split('.txt')[0]
+    table_prefix=os.path.join(args.output_dir,'embeddings_{}'.format(postfix))
+    logits=encode_once_predict(args,model,tokenizer,store,pairs,table_prefix)
+    y_trues=np.array([label for _,_,label in pairs])
+    return pairs,logits,y_trues
+
 class TextDataset(Dataset):
     def __init__(self, tokenizer, args, file_path='train', block_size=512,pool=None):
         postfix=file_path.split('/')[-1].split('.txt')[0]
-        self.examples = []
-        index_filename=file_path
-        logger.info("Creating features from index file at %s ", index_filename)
-        url_to_code={}
-        with open('/'.join(index_filename.split('/')[:-1])+'/{}/data.jsonl'.format(args.test_type)) as f:
-            for line in f:
-                line=line.strip()
-                js=json.loads(line)
-                url_to_code[js['idx']]=js['func']
-
-        data=[]
-        cache={}
-        f=open(index_filename)
-        with open(index_filename) as f:
-            for line in f:
-                line=line.strip()
-                url1,url2,label=line.split('\t')
-                if url1 not in url_to_code or url2 not in url_to_code:
-                    continue
-                if label=='0':
-                    label=0
-                else:
-                    label=1
-                data.append((url1,url2,label,tokenizer, args,cache,url_to_code))
-        # if 'test' not in postfix: # m. song - updated to load data fully.
-        #     data=random.sample(data,int(len(data)*0.1))
-        ratio = getattr(args, "subsample_ratio", 1.0)
-        if ratio < 1.0 and 'test' not in postfix:
-            k = max(1, int(len(data) * ratio))
-            data = random.sample(data, k)
-
-        self.examples=pool.map(get_example,tqdm(data,total=len(data)))
+        self.args=args
+        self.tokenizer=tokenizer
+        logger.info("Creating features from index file at %s ", file_path)
+        self.store=get_token_store(args,tokenizer,file_path,pool=pool)
+        self.pairs=load_pairs(args,file_path,self.store)
+        # items only touch these arrays and the store, so forked workers share them
+        self.rows=np.array([[self.store.row(url1),self.store.row(url2)] for url1,url2,_ in self.pairs],
+                           dtype=np.int64).reshape(-1,2)
+        self.labels=np.array([label for _,_,label in self.pairs],dtype=np.int64)
         if 'train' in postfix:
-            for idx, example in enumerate(self.examples[:3]):
+            for idx in range(min(3,len(self.pairs))):
+                    example=self.get_example(idx)
                     logger.info("*** Example ***")
                     logger.info("idx: {}".format(idx))
                     logger.info("label: {}".format(example.label))
                     logger.info("input_tokens: {}".format([x.replace('\u0120','_') for x in example.input_tokens]))
                     logger.info("input_ids: {}".format(' '.join(map(str, example.input_ids))))
 
-
+    def get_example(self, item):
+        url1,url2,label=self.pairs[item]
+        row1,row2=self.rows[item]
+        return convert_examples_to_features(self.store.ids(row1),self.store.ids(row2),label,url1,url2,
+                                            self.tokenizer,self.args)
 
     def __len__(self):
-        return len(self.examples)
+        return len(self.rows)
 
     def __getitem__(self, item):
-        
-        return torch.tensor(self.examples[item].input_ids),torch.tensor(self.examples[item].label)
+        row1,row2=self.rows[item]
+        input_ids=function_input_ids(self.store.ids(row1),self.tokenizer,self.args.block_size)+\
+                  function_input_ids(self.store.ids(row2),self.tokenizer,self.args.block_size)
+        return torch.tensor(input_ids),torch.tensor(self.labels[item])
 
 
 def load_and_cache_examples(args, tokenizer, evaluate=False,test=False,pool=None):
@@ -190,9 +181,17 @@ def train(args, train_dataset, model, tokenizer,pool):
     """ Train the model """
 
     args.train_batch_size = args.per_gpu_train_batch_size * max(1, args.n_gpu)
-    train_sampler = RandomSampler(train_dataset) if args.local_rank == -1 else DistributedSampler(train_dataset)
+    if args.dynamic_padding:
+        # batches of similar-length pairs, padded to their own longest function
+        train_sampler = BucketBatchSampler(pair_lengths(train_dataset), args.train_batch_size,
+                                           num_replicas=1 if args.local_rank == -1 else torch.distributed.get_world_size(),
+                                           rank=0 if args.local_rank == -1 else torch.distributed.get_rank())
+        train_dataloader = DataLoader(train_dataset, batch_sampler=train_sampler,
+                                      collate_fn=PairCollator(tokenizer.pad_token_id))
+    else:
+        train_sampler = RandomSampler(train_dataset) if args.local_rank == -1 else DistributedSampler(train_dataset)
     
-    train_dataloader = DataLoader(train_dataset, sampler=train_sampler, batch_size=args.train_batch_size)
+        train_dataloader = DataLoader(train_dataset, sampler=train_sampler, batch_size=args.train_batch_size)
     args.max_steps=args.epoch*len( train_dataloader)
     # # # # # # args.save_steps=len( train_dataloader)
     args.warmup_steps=len( train_dataloader)
@@ -251,14 +250,17 @@ def train(args, train_dataset, model, tokenizer,pool):
     # model.resize_token_embeddings(len(tokenizer))
     model.zero_grad()
     set_seed(args.seed)  # Added here for reproducibility (even between python 2 and 3)
+    padding_stats=PaddingStats(tokenizer.pad_token_id)
  
     for idx in range(args.start_epoch, int(args.num_train_epochs)): 
         bar = tqdm(train_dataloader,total=len(train_dataloader))
         tr_num=0
         train_loss=0
+        padding_stats.reset()
         for step, batch in enumerate(bar):
             inputs = batch[0].to(args.device)        
             labels=batch[1].to(args.device) 
+            padding_stats.update(batch[0])
             model.train()
             loss,logits = model(inputs,labels)
 
@@ -318,6 +320,8 @@ def train(args, train_dataset, model, tokenizer,pool):
                         torch.save(model_to_save.state_dict(), output_dir)
                         logger.info("Saving model checkpoint to %s", output_dir)
                         
+        logger.info("  epoch %d padding efficiency = %s (%d real of %d tokens)", idx,
+                    round(padding_stats.efficiency,4), padding_stats.real_tokens, padding_stats.total_tokens)
         if args.max_steps > 0 and global_step > args.max_steps:
             train_iterator.close()
             break
@@ -341,66 +345,52 @@ def train(args, train_dataset, model, tokenizer,pool):
 def evaluate(args, model, tokenizer, prefix="",pool=None,eval_when_training=False,test=False):
     # Loop to handle MNLI double evaluation (matched, mis-matched)
     eval_output_dir = args.output_dir
-    eval_dataset = load_and_cache_examples(args, tokenizer, test=test,evaluate=True,pool=pool)
     if not os.path.exists(eval_output_dir) and args.local_rank in [-1, 0]:
         os.makedirs(eval_output_dir)
 
     args.eval_batch_size = args.per_gpu_eval_batch_size * max(1, args.n_gpu)
-    # Note that DistributedSampler samples randomly
-    eval_sampler = SequentialSampler(eval_dataset) if args.local_rank == -1 else DistributedSampler(eval_dataset)
-    eval_dataloader = DataLoader(eval_dataset, sampler=eval_sampler, batch_size=args.eval_batch_size,num_workers=4,pin_memory=True)
-
-    # multi-gpu evaluate
-    if args.n_gpu > 1 and eval_when_training is False:
-        model = torch.nn.DataParallel(model)
-
-    # Eval!
-    logger.info("***** Running evaluation {} *****".format(prefix))
-    logger.info("  Num examples = %d", len(eval_dataset))
-    logger.info("  Batch size = %d", args.eval_batch_size)
-    eval_loss = 0.0
-    nb_eval_steps = 0
-    model.eval()
-    logits=[]  
-    y_trues=[]
-    for batch in eval_dataloader:
-        inputs = batch[0].to(args.device)        
-        labels=batch[1].to(args.device) 
-        with torch.no_grad():
-            lm_loss,logit = model(inputs,labels)
-            eval_loss += lm_loss.mean().item()
-            logits.append(logit.cpu().numpy())
-            y_trues.append(labels.cpu().numpy())
-        nb_eval_steps += 1
-    logits=np.concatenate(logits,0)
-    y_trues=np.concatenate(y_trues,0)
-    best_threshold=0
-    best_f1=-1
-    for i in range(1,100):
-        threshold=i/100
-        y_preds=logits[:,1]>threshold
-        from sklearn.metrics import recall_score
-        recall=recall_score(y_trues, y_preds, average='macro')
-        from sklearn.metrics import precision_score
-        precision=precision_score(y_trues, y_preds, average='macro')   
-        from sklearn.metrics import f1_score
-        f1=f1_score(y_trues, y_preds, average='macro') 
-        if f1>best_f1:
-            best_f1=f1
-            best_threshold=threshold
-
-    y_preds=logits[:,1]>best_threshold
-    from sklearn.metrics import recall_score
-    recall=recall_score(y_trues, y_preds, average='macro')
-    from sklearn.metrics import precision_score
-    precision=precision_score(y_trues, y_preds, average='macro')   
-    from sklearn.metrics import f1_score
-    f1=f1_score(y_trues, y_preds, average='macro')             
+    if args.encode_once:
+        logger.info("***** Running evaluation {} (encode once) *****".format(prefix))
+        _,logits,y_trues=encode_once_inference(args, model, tokenizer,
+                                               args.test_data_file if test else args.eval_data_file,pool=pool)
+    else:
+        eval_dataset = load_and_cache_examples(args, tokenizer, test=test,evaluate=True,pool=pool)
+        # Note that DistributedSampler samples randomly
+        eval_sampler = SequentialSampler(eval_dataset) if args.local_rank == -1 else DistributedSampler(eval_dataset)
+        eval_dataloader = DataLoader(eval_dataset, sampler=eval_sampler, batch_size=args.eval_batch_size,num_workers=4,pin_memory=True,
+                                     collate_fn=PairCollator(tokenizer.pad_token_id) if args.dynamic_padding else None)
+
+        # multi-gpu evaluate
+        if args.n_gpu > 1 and eval_when_training is False:
+            model = torch.nn.DataParallel(model)
+
+        # Eval!
+        logger.info("***** Running evaluation {} *****".format(prefix))
+        logger.info("  Num examples = %d", len(eval_dataset))
+        logger.info("  Batch size = %d", args.eval_batch_size)
+        eval_loss = 0.0
+        nb_eval_steps = 0
+        model.eval()
+        logits=[]  
+        y_trues=[]
+        for batch in eval_dataloader:
+            inputs = batch[0].to(args.device)        
+            labels=batch[1].to(args.device) 
+            with torch.no_grad():
+                lm_loss,logit = model(inputs,labels)
+                eval_loss += lm_loss.mean().item()
+                logits.append(logit.cpu().numpy())
+                y_trues.append(labels.cpu().numpy())
+            nb_eval_steps += 1
+        logits=np.concatenate(logits,0)
+        y_trues=np.concatenate(y_trues,0)
+    # one sorted pass over the scores instead of a sklearn call per threshold
+    best=find_best_threshold(y_trues, logits[:,1])
     result = {
-        "eval_recall": float(recall),
-        "eval_precision": float(precision),
-        "eval_f1": float(f1),
-        "eval_threshold":best_threshold,
+        "eval_recall": best['recall'],
+        "eval_precision": best['precision'],
+        "eval_f1": best['f1'],
+        "eval_threshold":best['threshold'],
         
     }
 
@@ -413,44 +403,50 @@ def evaluate(args, model, tokenizer, prefix="",pool=None,eval_when_training=Fals
 
 def test(args, model, tokenizer, prefix="",pool=None,best_threshold=0):
     # Loop to handle MNLI double evaluation (matched, mis-matched)
-    eval_dataset = load_and_cache_examples(args, tokenizer, test=True,pool=pool)
-
     args.eval_batch_size = args.per_gpu_eval_batch_size * max(1, args.n_gpu)
-    # Note that DistributedSampler samples randomly
-    eval_sampler = SequentialSampler(eval_dataset) if args.local_rank == -1 else DistributedSampler(eval_dataset)
-    eval_dataloader = DataLoader(eval_dataset, sampler=eval_sampler, batch_size=args.eval_batch_size,num_workers=4,pin_memory=True)
-
-    # multi-gpu evaluate
-    if args.n_gpu > 1:
-        model = torch.nn.DataParallel(model)
-
-    # Eval!
-    logger.info("***** Running Test {} *****".format(prefix))
-    logger.info("  Num examples = %d", len(eval_dataset))
-    logger.info("  Batch size = %d", args.eval_batch_size)
-    eval_loss = 0.0
-    nb_eval_steps = 0
-    model.eval()
-    logits=[]  
-    y_trues=[]
-    for batch in tqdm(eval_dataloader, total=len(eval_dataloader)):
-        inputs = batch[0].to(args.device)        
-        labels=batch[1].to(args.device) 
-        with torch.no_grad():
-            lm_loss,logit = model(inputs,labels)
-            eval_loss += lm_loss.mean().item()
-            logits.append(logit.cpu().numpy())
-            y_trues.append(labels.cpu().numpy())
-        nb_eval_steps += 1
-    logits=np.concatenate(logits,0)
-    y_trues=np.concatenate(y_trues,0)
+    if args.encode_once:
+        logger.info("***** Running Test {} (encode once) *****".format(prefix))
+        pairs,logits,y_trues=encode_once_inference(args, model, tokenizer, args.test_data_file, pool=pool)
+    else:
+        eval_dataset = load_and_cache_examples(args, tokenizer, test=True,pool=pool)
+        pairs=eval_dataset.pairs
+
+        # Note that DistributedSampler samples randomly
+        eval_sampler = SequentialSampler(eval_dataset) if args.local_rank == -1 else DistributedSampler(eval_dataset)
+        eval_dataloader = DataLoader(eval_dataset, sampler=eval_sampler, batch_size=args.eval_batch_size,num_workers=4,pin_memory=True,
+                                     collate_fn=PairCollator(tokenizer.pad_token_id) if args.dynamic_padding else None)
+
+        # multi-gpu evaluate
+        if args.n_gpu > 1:
+            model = torch.nn.DataParallel(model)
+
+        # Eval!
+        logger.info("***** Running Test {} *****".format(prefix))
+        logger.info("  Num examples = %d", len(eval_dataset))
+        logger.info("  Batch size = %d", args.eval_batch_size)
+        eval_loss = 0.0
+        nb_eval_steps = 0
+        model.eval()
+        logits=[]  
+        y_trues=[]
+        for batch in tqdm(eval_dataloader, total=len(eval_dataloader)):
+            inputs = batch[0].to(args.device)        
+            labels=batch[1].to(args.device) 
+            with torch.no_grad():
+                lm_loss,logit = model(inputs,labels)
+                eval_loss += lm_loss.mean().item()
+                logits.append(logit.cpu().numpy())
+                y_trues.append(labels.cpu().numpy())
+            nb_eval_steps += 1
+        logits=np.concatenate(logits,0)
+        y_trues=np.concatenate(y_trues,0)
     y_preds=logits[:,1]>best_threshold
     with open(os.path.join(args.output_dir,"predictions.txt"),'w') as f:
-        for example,pred in zip(eval_dataset.examples,y_preds):
+        for (url1,url2,_),pred in zip(pairs,y_preds):
             if pred:
-                f.write(example.url1+'\t'+example.url2+'\t'+'1'+'\n')
+                f.write(url1+'\t'+url2+'\t'+'1'+'\n')
             else:
-                f.write(example.url1+'\t'+example.url2+'\t'+'0'+'\n')
+                f.write(url1+'\t'+url2+'\t'+'0'+'\n')
     
     from sklearn.metrics import recall_score
     recall=recall_score(y_trues, y_preds, average='macro')
@@ -568,6 +564,10 @@ def main():
     parser.add_argument('--server_port', type=str, default='', help="For distant debugging.")
     parser.add_argument("--subsample_ratio", type=float, default=1.0,
                         help="Use <1.0 to subsample train/valid. 1.0 means full data.")
+    parser.add_argument("--encode_once", action='store_true',
+                        help="Evaluate/test by encoding each unique function once and scoring pairs from the embedding table.")
+    parser.add_argument("--dynamic_padding", action='store_true',
+                        help="Batch pairs of similar length and pad each batch only to its longest function.")
     
     pool = multiprocessing.Pool(cpu_cont)
     args = parser.parse_args()
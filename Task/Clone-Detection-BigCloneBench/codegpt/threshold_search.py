@@ -0,0 +1,69 @@
+# Decision threshold search for clone classification.
+#
+# evaluate() used to try thresholds 0.01..0.99 and call sklearn's
+# recall/precision/f1 once per step, i.e. ~300 passes over the logits. Here the
+# scores are sorted once and the confusion counts of every candidate threshold
+# come from one cumulative sum, so all distinct score values can be tried.
+# Metrics follow sklearn's average='macro' (ill-defined ratios count as 0 and
+# only labels present in y_true or y_pred are averaged).
+import numpy as np
+
+
+def _divide(num, den):
+    num=np.asarray(num,dtype=np.float64)
+    den=np.asarray(den,dtype=np.float64)
+    out=np.zeros(np.broadcast(num,den).shape)
+    np.divide(num,den,out=out,where=den>0)
+    return out
+
+
+def threshold_sweep(y_true, scores, thresholds=None):
+    """Macro precision, recall and F1 of `scores > t` for every threshold t.
+
+    thresholds defaults to every distinct score plus one value below the
+    minimum (everything predicted as a clone), in ascending order.
+    Returns (thresholds, precision, recall, f1) as arrays.
+    """
+    y_true=np.asarray(y_true).astype(bool)
+    scores=np.asarray(scores)
+    order=np.argsort(scores,kind='mergesort')
+    sorted_scores=scores[order]
+    if thresholds is None:
+        thresholds=np.unique(sorted_scores)
+        if len(thresholds):
+            thresholds=np.concatenate([[np.nextafter(thresholds[0],-np.inf)],thresholds])
+    thresholds=np.asarray(thresholds)
+
+    n_pos=int(y_true.sum())
+    n_neg=len(y_true)-n_pos
+    # positives among the k lowest scores, for k = 0..n
+    cum_pos=np.concatenate([[0],np.cumsum(y_true[order])])
+    # compare in the dtype of the scores, like `scores > threshold` does
+    n_pred_neg=np.searchsorted(sorted_scores,thresholds.astype(scores.dtype),side='right')
+    fn=cum_pos[n_pred_neg]
+    tp=n_pos-fn
+    tn=n_pred_neg-fn
+    fp=n_neg-tn
+
+    # per class counts: class 1 is (tp, fp, fn), class 0 is (tn, fn, fp)
+    precision1,recall1,f1_1=_divide(tp,tp+fp),_divide(tp,n_pos),_divide(2*tp,2*tp+fp+fn)
+    precision0,recall0,f1_0=_divide(tn,tn+fn),_divide(tn,n_neg),_divide(2*tn,2*tn+fn+fp)
+    present1=((n_pos>0)|(tp+fp>0)).astype(np.float64)
+    present0=((n_neg>0)|(tn+fn>0)).astype(np.float64)
+    n_present=np.maximum(present0+present1,1)
+    precision=(precision0*present0+precision1*present1)/n_present
+    recall=(recall0*present0+recall1*present1)/n_present
+    f1=(f1_0*present0+f1_1*present1)/n_present
+    return thresholds,precision,recall,f1
+
+
+def find_best_threshold(y_true, scores, thresholds=None):
+    """Threshold with the highest macro F1; ties go to the lowest threshold."""
+    thresholds,precision,recall,f1=threshold_sweep(y_true,scores,thresholds)
+    if len(thresholds)==0:
+        return {'threshold':0.0,'precision':0.0,'recall':0.0,'f1':0.0}
+    best=int(np.argmax(f1))
+    return {'threshold':float(thresholds[best]),
+            'precision':float(precision[best]),
+            'recall':float(recall[best]),
+            'f1':float(f1[best])}
@@ -0,0 +1,140 @@
+# Pretokenized function store for clone-pair featurization.
+#
+# Every function of a data.jsonl is tokenized once and its token ids are
+# written into a flat int32 file (ids.bin) read back as a memory map, with a
+# row offset index (offsets.npy) and the row order of the urls (urls.json).
+# The store lives in <data dir>/token_store/<tokenizer fingerprint>/, so a
+# different tokenizer gets its own store and a rebuilt data.jsonl is detected
+# through the size/mtime recorded in meta.json. Datasets then assemble pairs by
+# slicing the memory map: nothing is re-tokenized and DataLoader workers share
+# the same pages instead of unpickling per-item copies.
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+from tqdm import tqdm
+
+logger = logging.getLogger(__name__)
+
+# functions per pool task, the tokenizer is pickled once per chunk
+chunk_size = 1000
+
+_stores = {}
+
+
+def tokenizer_fingerprint(tokenizer):
+    """Hash of everything that decides the token ids of a string."""
+    h=hashlib.sha1()
+    h.update(type(tokenizer).__name__.encode())
+    h.update(json.dumps(sorted(tokenizer.get_vocab().items())).encode())
+    h.update(json.dumps(tokenizer.special_tokens_map,sort_keys=True).encode())
+    h.update(json.dumps(bool(tokenizer.init_kwargs.get('do_lower_case',False))).encode())
+    bpe_ranks=getattr(tokenizer,'bpe_ranks',None)
+    if bpe_ranks:
+        h.update(json.dumps(sorted(bpe_ranks.items(),key=lambda x:x[1])).encode())
+    return h.hexdigest()[:16]
+
+
+def tokenize_chunk(item):
+    tokenizer,codes=item
+    return [np.array(tokenizer.convert_tokens_to_ids(tokenizer.tokenize(' '.join(code.split()))),dtype=np.int32)
+            for code in codes]
+
+
+def _source_meta(data_file):
+    stat=os.stat(data_file)
+    return {'size':stat.st_size,'mtime':int(stat.st_mtime)}
+
+
+def build_token_store(data_file, tokenizer, store_dir, pool=None):
+    """Tokenize every function of data_file once and write the store to store_dir."""
+    urls=[]
+    codes=[]
+    with open(data_file) as f:
+        for line in f:
+            js=json.loads(line.strip())
+            urls.append(js['idx'])
+            codes.append(js['func'])
+    logger.info("Building token store for %d functions at %s", len(urls), store_dir)
+
+    # build next to the target and rename, concurrent builders never see half a store
+    tmp_dir='{}.tmp{}'.format(store_dir,os.getpid())
+    os.makedirs(tmp_dir,exist_ok=True)
+    chunks=[(tokenizer,codes[i:i+chunk_size]) for i in range(0,len(codes),chunk_size)]
+    results=pool.imap(tokenize_chunk,chunks) if pool is not None else map(tokenize_chunk,chunks)
+    offsets=[0]
+    with open(os.path.join(tmp_dir,'ids.bin'),'wb') as f:
+        for chunk in tqdm(results,total=len(chunks)):
+            for ids in chunk:
+                f.write(ids.tobytes())
+                offsets.append(offsets[-1]+len(ids))
+    np.save(os.path.join(tmp_dir,'offsets.npy'),np.array(offsets,dtype=np.int64))
+    with open(os.path.join(tmp_dir,'urls.json'),'w') as f:
+        json.dump(urls,f)
+    with open(os.path.join(tmp_dir,'meta.json'),'w') as f:
+        json.dump({'tokenizer':tokenizer_fingerprint(tokenizer),'source':_source_meta(data_file)},f)
+    try:
+        os.rename(tmp_dir,store_dir)
+    except OSError:
+        # another process finished first
+        shutil.rmtree(tmp_dir,ignore_errors=True)
+
+
+class TokenStore(object):
+    """Read-only view of a built store: url -> token ids (without special tokens)."""
+    def __init__(self, store_dir):
+        self.store_dir=store_dir
+        self.offsets=np.load(os.path.join(store_dir,'offsets.npy'))
+        if self.offsets[-1]>0:
+            self.token_ids=np.memmap(os.path.join(store_dir,'ids.bin'),dtype=np.int32,mode='r')
+        else:
+            self.token_ids=np.zeros(0,dtype=np.int32)
+        with open(os.path.join(store_dir,'urls.json')) as f:
+            self.urls=json.load(f)
+        self.url_to_row={url:row for row,url in enumerate(self.urls)}
+
+    def __len__(self):
+        return len(self.urls)
+
+    def __contains__(self, url):
+        return url in self.url_to_row
+
+    def row(self, url):
+        return self.url_to_row[url]
+
+    def ids(self, row):
+        return self.token_ids[self.offsets[row]:self.offsets[row+1]]
+
+    def lengths(self):
+        return np.diff(self.offsets)
+
+
+def load_token_store(data_file, tokenizer, pool=None):
+    """Open the store of data_file for this tokenizer, building it on first use."""
+    fingerprint=tokenizer_fingerprint(tokenizer)
+    store_dir=os.path.join(os.path.dirname(data_file),'token_store',fingerprint)
+    source=_source_meta(data_file)
+    if store_dir in _stores and _stores[store_dir][0]==source:
+        return _stores[store_dir][1]
+    meta_file=os.path.join(store_dir,'meta.json')
+    if os.path.exists(meta_file):
+        with open(meta_file) as f:
+            if json.load(f)['source']!=source:
+                logger.info("%s changed, rebuilding token store", data_file)
+                shutil.rmtree(store_dir,ignore_errors=True)
+    if not os.path.exists(meta_file):
+        os.makedirs(os.path.dirname(store_dir),exist_ok=True)
+        build_token_store(data_file,tokenizer,store_dir,pool=pool)
+    store=TokenStore(store_dir)
+    _stores[store_dir]=(source,store)
+    return store
+
+
+def function_input_ids(ids, tokenizer, block_size):
+    """<bos> ids[:block_size-2] <eos> padded to block_size, as convert_examples_to_features does."""
+    ids=[tokenizer.convert_tokens_to_ids(tokenizer.bos_token)]+ids[:block_size-2].tolist()+\
+        [tokenizer.convert_tokens_to_ids(tokenizer.eos_token)]
+    return ids+[tokenizer.pad_token_id]*(block_size-len(ids))
@@ -0,0 +1,111 @@
+# Scaling benchmark for featurize.py.
+#
+# Featurizes the same functions in process and with featurization_pool for an
+# increasing number of workers, checks that every run gives the same features
+# as the in-process one and reports throughput, speedup over one worker and
+# parallel efficiency (speedup / workers).
+#
+#   python bench_featurize.py --data_file ../dataset/data.jsonl --workers 1,2,4,8,16
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import json
+import multiprocessing
+import time
+import types
+
+import numpy as np
+from transformers import RobertaTokenizer
+
+from featurize import (convert_function_to_features, featurization_pool, featurize_functions,
+                       load_parser)
+from graph_mask import mask_descriptor
+
+
+def load_functions(data_file, num_functions):
+    codes=[]
+    with open(data_file) as f:
+        for line in f:
+            codes.append(' '.join(json.loads(line)['func'].split()))
+            if len(codes)==num_functions:
+                break
+    return codes
+
+
+def same_features(a, b):
+    if not (np.array_equal(a.input_ids,b.input_ids) and np.array_equal(a.position_idx,b.position_idx)):
+        return False
+    for x,y in zip(a.descriptors,b.descriptors):
+        if x.node_index!=y.node_index or x.max_length!=y.max_length:
+            return False
+        if not all(np.array_equal(u,v) for u,v in zip(x[2:],y[2:])):
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data_file", default="../dataset/data.jsonl", type=str,
+                        help="BigCloneBench data.jsonl, one {'idx','func'} per line.")
+    parser.add_argument("--tokenizer_name", default="microsoft/graphcodebert-base", type=str)
+    parser.add_argument("--num_functions", default=2000, type=int)
+    parser.add_argument("--code_length", default=512, type=int)
+    parser.add_argument("--data_flow_length", default=128, type=int)
+    parser.add_argument("--chunk_size", default=64, type=int)
+    parser.add_argument("--workers", default=None, type=str,
+                        help="Comma separated worker counts, powers of two up to the cpu count by default.")
+    args = parser.parse_args()
+    args.dfg_cache_dir=None
+    if args.workers is None:
+        counts=[1]
+        while counts[-1]*2<=multiprocessing.cpu_count():
+            counts.append(counts[-1]*2)
+        if counts[-1]!=multiprocessing.cpu_count():
+            counts.append(multiprocessing.cpu_count())
+    else:
+        counts=[int(x) for x in args.workers.split(',')]
+    tokenizer=RobertaTokenizer.from_pretrained(args.tokenizer_name)
+    codes=load_functions(args.data_file,args.num_functions)
+    length=args.code_length+args.data_flow_length
+    fargs=types.SimpleNamespace(code_length=args.code_length,data_flow_length=args.data_flow_length,dfg_cache_dir=None)
+
+    # in process, one function at a time
+    start=time.time()
+    rows=[]
+    descriptors=[]
+    java=load_parser('java')
+    for code in codes:
+        _,input_ids,position_idx,dfg_to_code,dfg_to_dfg=convert_function_to_features(code,tokenizer,fargs,java)
+        rows.append((input_ids,position_idx))
+        descriptors.append(mask_descriptor(input_ids,position_idx,dfg_to_code,dfg_to_dfg))
+    serial_seconds=time.time()-start
+    rows=np.array(rows,dtype=np.int32).reshape(-1,2,length)
+    expected=types.SimpleNamespace(input_ids=rows[:,0],position_idx=rows[:,1],descriptors=descriptors)
+
+    report={'num_functions':len(codes),'length':length,'cpu_count':multiprocessing.cpu_count(),
+            'serial':{'seconds':round(serial_seconds,3),'functions_per_second':round(len(codes)/serial_seconds,1)},
+            'workers':[]}
+    for count in counts:
+        pool=featurization_pool(count,'java',tokenizer,fargs)
+        try:
+            # the first map pays for the initializers, keep it out of the timing
+            featurize_functions(pool,codes[:count],length,chunk_size=1)
+            start=time.time()
+            features=featurize_functions(pool,codes,length,chunk_size=args.chunk_size)
+            seconds=time.time()-start
+        finally:
+            pool.close()
+            pool.join()
+        if not same_features(features,expected):
+            raise AssertionError("features of {} workers differ from the in-process ones".format(count))
+        report['workers'].append({'workers':count,'seconds':round(seconds,3),
+                                  'functions_per_second':round(len(codes)/seconds,1)})
+    base=report['workers'][0]['seconds']
+    for entry in report['workers']:
+        entry['speedup']=round(base/entry['seconds'],2)
+        entry['efficiency']=round(base/entry['seconds']/entry['workers'],2)
+    print(json.dumps(report,indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+# Equality check and microbenchmark for graph_mask.py.
+#
+# legacy_attn_mask is the loop TextDataset.get_feature used to run per function.
+# Random examples shaped like convert_examples_to_features output (code tokens,
+# DFG nodes, spans, edges, padding) are turned into masks both ways, compared
+# element by element, and timed per batch of pairs. Pairs are drawn from
+# --distinct_functions functions, like BigCloneBench pairs share functions, to
+# measure the MaskFactory cache, and the bytes a DataLoader worker hands over
+# per batch are reported for a batch carrying the masks and for one carrying
+# the descriptors.
+#
+#   python bench_graph_mask.py --code_length 512 --data_flow_length 128
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import json
+import pickle
+import random
+import time
+
+import numpy as np
+import torch
+
+from graph_mask import MaskFactory, build_attn_masks, collate_batch, mask_descriptor
+
+
+def legacy_attn_mask(input_ids, position_idx, dfg_to_code, dfg_to_dfg, length):
+    #calculate graph-guided masked function
+    attn_mask= np.zeros((length,length),dtype=bool)
+    #calculate begin index of node and max length of input
+    node_index=sum([i>1 for i in position_idx])
+    max_length=sum([i!=1 for i in position_idx])
+    #sequence can attend to sequence
+    attn_mask[:node_index,:node_index]=True
+    #special tokens attend to all tokens
+    for idx,i in enumerate(input_ids):
+        if i in [0,2]:
+            attn_mask[idx,:max_length]=True
+    #nodes attend to code tokens that are identified from
+    for idx,(a,b) in enumerate(dfg_to_code):
+        if a<node_index and b<node_index:
+            attn_mask[idx+node_index,a:b]=True
+            attn_mask[a:b,idx+node_index]=True
+    #nodes attend to adjacent nodes
+    for idx,nodes in enumerate(dfg_to_dfg):
+        for a in nodes:
+            if a+node_index<len(position_idx):
+                attn_mask[idx+node_index,a+node_index]=True
+    return attn_mask
+
+
+def random_function(rng, code_length, data_flow_length):
+    """(input_ids, position_idx, dfg_to_code, dfg_to_dfg) like convert_examples_to_features builds."""
+    length=code_length+data_flow_length
+    num_tokens=rng.randint(0,code_length+data_flow_length-3)
+    num_nodes=rng.randint(0,min(data_flow_length,length-num_tokens-2))
+    input_ids=[0]+[rng.randint(4,50000) for _ in range(num_tokens)]+[2]
+    position_idx=[i+2 for i in range(len(input_ids))]
+    input_ids+=[3]*num_nodes
+    position_idx+=[0]*num_nodes
+    padding=length-len(input_ids)
+    input_ids+=[1]*padding
+    position_idx+=[1]*padding
+    dfg_to_code=[]
+    for _ in range(num_nodes):
+        a=rng.randint(1,num_tokens+2)
+        # some spans run past the code, the builders must skip them
+        dfg_to_code.append((a,a+rng.randint(0,3)))
+    dfg_to_dfg=[[rng.randint(0,num_nodes+2) for _ in range(rng.randint(0,3))] for _ in range(num_nodes)]
+    return input_ids,position_idx,dfg_to_code,dfg_to_dfg
+
+
+def check_equal(functions, length):
+    descriptors=[mask_descriptor(*f) for f in functions]
+    masks=build_attn_masks(descriptors,length).numpy()
+    for f,mask in zip(functions,masks):
+        expected=legacy_attn_mask(*f,length)
+        if not np.array_equal(expected,mask):
+            raise AssertionError("mask mismatch on {} positions".format(int((expected!=mask).sum())))
+
+
+def transfer_bytes(batch):
+    """Bytes of a collated batch crossing from a DataLoader worker: tensor storages plus the pickle of the rest."""
+    tensors=[]
+    def strip(x):
+        if isinstance(x,torch.Tensor):
+            tensors.append(x)
+            return None
+        if isinstance(x,tuple) and hasattr(x,'_fields'):
+            return type(x)(*[strip(y) for y in x])
+        if isinstance(x,(list,tuple)):
+            return type(x)([strip(y) for y in x])
+        return x
+    rest=strip(batch)
+    return sum(t.numel()*t.element_size() for t in tensors)+len(pickle.dumps(rest,protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--code_length", default=256, type=int)
+    parser.add_argument("--data_flow_length", default=64, type=int)
+    parser.add_argument("--batch_size", default=16, type=int, help="Pairs per batch.")
+    parser.add_argument("--num_batches", default=10, type=int)
+    parser.add_argument("--distinct_functions", default=200, type=int, help="Functions the pairs are drawn from.")
+    parser.add_argument("--mask_cache_size", default=256, type=int, help="Size of the cache measured against none.")
+    parser.add_argument("--num_checks", default=500, type=int, help="Random functions compared with the legacy masks.")
+    parser.add_argument("--seed", default=42, type=int)
+    args = parser.parse_args()
+    rng=random.Random(args.seed)
+    length=args.code_length+args.data_flow_length
+
+    # random functions plus one without code tokens or nodes
+    functions=[random_function(random.Random(seed),args.code_length,args.data_flow_length) for seed in range(args.num_checks)]
+    functions.append(([0,2]+[1]*(length-2),[2,3]+[1]*(length-2),[],[]))
+    check_equal(functions,length)
+
+    distinct=[random_function(rng,args.code_length,args.data_flow_length) for _ in range(args.distinct_functions)]
+    batches=[[(rng.choice(distinct),rng.choice(distinct)) for _ in range(args.batch_size)]
+             for _ in range(args.num_batches)]
+
+    start=time.time()
+    for batch in batches:
+        torch.stack([torch.tensor([legacy_attn_mask(*f1,length).tolist(),legacy_attn_mask(*f2,length).tolist()])
+                     for f1,f2 in batch])
+    legacy_seconds=(time.time()-start)/len(batches)
+
+    start=time.time()
+    items=[]
+    for batch in batches:
+        items.append([(torch.tensor(f1[0]+f2[0]),torch.tensor(f1[1]+f2[1]),
+                       (mask_descriptor(*f1),mask_descriptor(*f2)),torch.tensor(0)) for f1,f2 in batch])
+    descriptor_seconds=(time.time()-start)/len(batches)
+    start=time.time()
+    collated=[collate_batch(batch_items) for batch_items in items]
+    collate_seconds=(time.time()-start)/len(batches)
+
+    timings={}
+    for cache_size in [0,args.mask_cache_size]:
+        factory=MaskFactory(length,cache_size)
+        start=time.time()
+        for batch in collated:
+            attn_mask=factory(batch[2])
+        timings[cache_size]=((time.time()-start)/len(batches),factory)
+        # the last batch once more, through the whole collate path
+        expected=np.stack([[legacy_attn_mask(*f1,length),legacy_attn_mask(*f2,length)] for f1,f2 in batches[-1]])
+        assert np.array_equal(attn_mask.numpy(),expected)
+    cached_seconds,factory=timings[args.mask_cache_size]
+
+    # what a worker sent before: the batch with the masks and node spans already materialized
+    eager_factory=MaskFactory(length,0)
+    eager=[batch[:2]+(eager_factory(batch[2]),eager_factory.node_spans(batch[2]),batch[3]) for batch in collated]
+    eager_bytes=np.mean([transfer_bytes(batch) for batch in eager])
+    lazy_bytes=np.mean([transfer_bytes(batch) for batch in collated])
+
+    print(json.dumps({'length':length,
+                      'batch_size':args.batch_size,
+                      'checked_functions':len(functions)+2*args.batch_size,
+                      'legacy_ms_per_batch':round(1000*legacy_seconds,2),
+                      'descriptor_ms_per_batch':round(1000*descriptor_seconds,2),
+                      'collate_ms_per_batch':round(1000*collate_seconds,2),
+                      'mask_ms_per_batch':round(1000*timings[0][0],2),
+                      'cached_mask_ms_per_batch':round(1000*cached_seconds,2),
+                      'mask_cache_hit_rate':round(factory.hits/max(1,factory.hits+factory.misses),3),
+                      'speedup':round(legacy_seconds/(descriptor_seconds+collate_seconds+cached_seconds),1),
+                      'bytes_per_batch_with_masks':int(eager_bytes),
+                      'bytes_per_batch_with_descriptors':int(lazy_bytes),
+                      'bytes_reduction':round(eager_bytes/lazy_bytes,1)},indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# Equality check and CPU benchmark for the DFG node pooling of model.py.
+#
+# legacy_average is the einsum Model.forward used to run over the dense
+# 2B*L*L node-to-token mask. For every length, random batches shaped like
+# collate_batch output are pooled the legacy way, from the (node, token) pairs
+# read off the mask, and from the node spans collate_batch passes; the results
+# are compared and the latency and peak memory of each path are reported.
+# Peak memory is the growth of the process high-water mark (VmHWM, reset through
+# /proc/self/clear_refs) over the resident size before the call; large blocks
+# are mmapped by glibc so freed buffers leave the resident size instead of
+# being reused unseen by the next path.
+#
+#   python bench_node_pooling.py --lengths 256,512,1024 --batch_size 8
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import ctypes
+import gc
+import json
+import random
+import time
+
+import torch
+
+from bench_graph_mask import random_function
+from graph_mask import MaskFactory, collate_batch, mask_descriptor
+from model import average_node_embeddings, mask_node_token_pairs, span_node_token_pairs
+
+
+def legacy_average(inputs_embeddings, position_idx, attn_mask):
+    nodes_mask=position_idx.eq(0)
+    token_mask=position_idx.ge(2)
+    nodes_to_token_mask=nodes_mask[:,:,None]&token_mask[:,None,:]&attn_mask
+    nodes_to_token_mask=nodes_to_token_mask/(nodes_to_token_mask.sum(-1)+1e-10)[:,:,None]
+    return torch.einsum("abc,acd->abd",nodes_to_token_mask,inputs_embeddings)
+
+
+def mask_average(inputs_embeddings, position_idx, attn_mask):
+    nodes,tokens=mask_node_token_pairs(position_idx.eq(0),position_idx.ge(2),attn_mask)
+    return average_node_embeddings(inputs_embeddings,nodes,tokens)
+
+
+def span_average(inputs_embeddings, node_spans):
+    nodes,tokens=span_node_token_pairs(node_spans)
+    return average_node_embeddings(inputs_embeddings,nodes,tokens)
+
+
+def _status_kb(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field+':'):
+                return int(line.split()[1])
+    return None
+
+
+def mmap_large_blocks(threshold=1<<16):
+    """Serve allocations above threshold bytes with mmap (glibc M_MMAP_THRESHOLD), False elsewhere."""
+    try:
+        return bool(ctypes.CDLL('libc.so.6').mallopt(-3,threshold))
+    except (OSError,AttributeError):
+        return False
+
+
+def measure(fn, repeats):
+    """(mean ms, peak MB above the resident size before the first call) of fn()."""
+    gc.collect()
+    try:
+        with open('/proc/self/clear_refs','w') as f:
+            f.write('5')
+        before=_status_kb('VmRSS')
+    except (IOError,OSError):
+        before=None
+    start=time.time()
+    for _ in range(repeats):
+        out=fn()
+        del out
+    ms=1000*(time.time()-start)/repeats
+    peak=None if before is None else round((_status_kb('VmHWM')-before)/1024,1)
+    return round(ms,2),peak
+
+
+def batch_inputs(rng, batch_size, length, hidden_size):
+    code_length=length-length//4
+    items=[]
+    for _ in range(batch_size):
+        f1=random_function(rng,code_length,length//4)
+        f2=random_function(rng,code_length,length//4)
+        items.append((torch.tensor(f1[0]+f2[0]),torch.tensor(f1[1]+f2[1]),
+                      (mask_descriptor(*f1),mask_descriptor(*f2)),torch.tensor(0)))
+    input_ids,position_idx,descriptors,_=collate_batch(items)
+    factory=MaskFactory(length,0)
+    attn_mask=factory(descriptors)
+    node_spans=factory.node_spans(descriptors)
+    #the views Model.forward works on
+    position_idx=position_idx.view(-1,length)
+    attn_mask=attn_mask.view(-1,length,length)
+    node_spans=node_spans.view(-1,length,2)
+    inputs_embeddings=torch.randn(position_idx.size(0),length,hidden_size)
+    return inputs_embeddings,position_idx,attn_mask,node_spans
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lengths", default="256,512,1024", type=str,
+                        help="Comma separated code_length+data_flow_length values.")
+    parser.add_argument("--batch_size", default=8, type=int, help="Pairs per batch.")
+    parser.add_argument("--hidden_size", default=768, type=int)
+    parser.add_argument("--repeats", default=5, type=int)
+    parser.add_argument("--threads", default=1, type=int)
+    parser.add_argument("--seed", default=42, type=int)
+    args = parser.parse_args()
+    torch.set_num_threads(args.threads)
+    mmap_large_blocks()
+    rng=random.Random(args.seed)
+    torch.manual_seed(args.seed)
+
+    report=[]
+    with torch.no_grad():
+        for length in [int(x) for x in args.lengths.split(',')]:
+            inputs_embeddings,position_idx,attn_mask,node_spans=batch_inputs(rng,args.batch_size,length,args.hidden_size)
+            expected=legacy_average(inputs_embeddings,position_idx,attn_mask)
+            errors={}
+            for name,average in [('mask',mask_average(inputs_embeddings,position_idx,attn_mask)),
+                                 ('spans',span_average(inputs_embeddings,node_spans))]:
+                errors[name]=float((average-expected).abs().max())
+                if not torch.allclose(average,expected,rtol=1e-5,atol=1e-6):
+                    raise AssertionError("{} pooling differs by {} at length {}".format(name,errors[name],length))
+            del expected
+            entry={'length':length,'functions':position_idx.size(0),'max_abs_error':errors,
+                   'output_mb':round(inputs_embeddings.numel()*inputs_embeddings.element_size()/2**20,1)}
+            for name,fn in [('legacy_einsum',lambda: legacy_average(inputs_embeddings,position_idx,attn_mask)),
+                            ('index_from_mask',lambda: mask_average(inputs_embeddings,position_idx,attn_mask)),
+                            ('index_from_spans',lambda: span_average(inputs_embeddings,node_spans))]:
+                ms,peak=measure(fn,args.repeats)
+                entry[name]={'ms':ms,'peak_mb':peak}
+            entry['speedup']=round(entry['legacy_einsum']['ms']/entry['index_from_spans']['ms'],1)
+            report.append(entry)
+    print(json.dumps(report,indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# Throughput benchmark of the single-walk tokenization of extract_dataflow.
+#
+# Tokenizes and extracts the data flow of the same functions twice: the way
+# extract_dataflow used to (remove_comments_and_docstrings, parse,
+# tree_to_token_index, index_to_code_token over the split lines) and with
+# featurize.extract_dataflow, which walks the parse once with
+# tree_to_code_tokens. Reports functions per second of the tokenization alone
+# and of the whole extraction, and how many functions get the same tokens and
+# the same data flow both ways. The old path strips comments with regexes that
+# also eat '//' inside strings and drops lines of python docstrings, so a few
+# differences on real code are expected; they are counted, not raised.
+#
+#   python bench_tokenize.py --data_file ../dataset/data.jsonl
+#   python bench_tokenize.py --data_file python.jsonl --lang python --code_key code
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import json
+import time
+
+from featurize import extract_dataflow, load_parser
+from parser import (remove_comments_and_docstrings,
+                   tree_to_token_index,
+                   index_to_code_token,
+                   tree_to_code_tokens)
+
+
+def load_functions(data_file, code_key, num_functions):
+    codes=[]
+    with open(data_file) as f:
+        for line in f:
+            codes.append(json.loads(line)[code_key])
+            if len(codes)==num_functions:
+                break
+    return codes
+
+
+def legacy_tokens(code,parser,lang):
+    """(code_tokens, index_to_code) the way extract_dataflow built them before tree_to_code_tokens."""
+    try:
+        code=remove_comments_and_docstrings(code,lang)
+    except:
+        pass
+    if lang=="php":
+        code="<?php"+code+"?>"
+    tree = parser[0].parse(bytes(code,'utf8'))
+    root_node = tree.root_node
+    tokens_index=tree_to_token_index(root_node)
+    code=code.split('\n')
+    code_tokens=[index_to_code_token(x,code) for x in tokens_index]
+    index_to_code={}
+    for idx,(index,code) in enumerate(zip(tokens_index,code_tokens)):
+        index_to_code[index]=(idx,code)
+    return root_node,code_tokens,index_to_code
+
+
+def fused_tokens(code,parser,lang):
+    if lang=="php":
+        code="<?php"+code+"?>"
+    code_bytes=bytes(code,'utf8')
+    root_node = parser[0].parse(code_bytes).root_node
+    code_tokens,_,index_to_code=tree_to_code_tokens(root_node,code_bytes,lang)
+    return root_node,code_tokens,index_to_code
+
+
+def legacy_extract_dataflow(code,parser,lang):
+    try:
+        root_node,code_tokens,index_to_code=legacy_tokens(code,parser,lang)
+        try:
+            DFG,_=parser[1](root_node,index_to_code,{})
+        except:
+            DFG=[]
+        DFG=sorted(DFG,key=lambda x:x[1])
+        indexs=set()
+        for d in DFG:
+            if len(d[-1])!=0:
+                indexs.add(d[1])
+            for x in d[-1]:
+                indexs.add(x)
+        dfg=[d for d in DFG if d[1] in indexs]
+    except:
+        code_tokens=[]
+        dfg=[]
+    return code_tokens,dfg
+
+
+def throughput(function,codes,parser,lang):
+    start=time.time()
+    outputs=[function(code,parser,lang) for code in codes]
+    seconds=time.time()-start
+    return outputs,{'seconds':round(seconds,3),'functions_per_second':round(len(codes)/seconds,1)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data_file", default="../dataset/data.jsonl", type=str,
+                        help="One json object per line, the function under --code_key.")
+    parser.add_argument("--code_key", default="func", type=str)
+    parser.add_argument("--lang", default="java", type=str)
+    parser.add_argument("--num_functions", default=2000, type=int)
+    args = parser.parse_args()
+    codes=load_functions(args.data_file,args.code_key,args.num_functions)
+    code_parser=load_parser(args.lang)
+
+    report={'num_functions':len(codes),'lang':args.lang}
+    # the first parses pay for loading the grammar, keep them out of the timing
+    for code in codes[:10]:
+        fused_tokens(code,code_parser,args.lang)
+    _,report['legacy_tokenize']=throughput(legacy_tokens,codes,code_parser,args.lang)
+    _,report['fused_tokenize']=throughput(fused_tokens,codes,code_parser,args.lang)
+    legacy,report['legacy_extract_dataflow']=throughput(legacy_extract_dataflow,codes,code_parser,args.lang)
+    fused,report['fused_extract_dataflow']=throughput(extract_dataflow,codes,code_parser,args.lang)
+    for name in ('tokenize','extract_dataflow'):
+        report[name+'_speedup']=round(report['legacy_'+name]['seconds']/report['fused_'+name]['seconds'],2)
+    # the old path keeps the '' token of stripped lines, only real tokens are compared
+    report['same_tokens']=sum(1 for (a,_),(b,_) in zip(legacy,fused)
+                              if [x for x in a if x]==[x for x in b if x])
+    report['same_dataflow']=sum(1 for (_,a),(_,b) in zip(legacy,fused)
+                                if [d[:1]+d[2:4] for d in a]==[d[:1]+d[2:4] for d in b])
+    print(json.dumps(report,indent=2))
+
+
+if __name__ == "__main__":
+    main()
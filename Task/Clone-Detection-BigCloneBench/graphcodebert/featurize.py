@@ -0,0 +1,171 @@
+# Parallel featurization of BigCloneBench functions.
+#
+# run.py used to load the tree-sitter grammars of every language at import time
+# and map get_example over the pairs, pickling the tokenizer, args and the whole
+# url->code dict into every task and an InputFeatures object out of it, and
+# featurizing a function again for every pair it appears in. Here the distinct
+# functions of a pair file are featurized once, in chunks, by a pool whose
+# initializer loads the grammar of a single language next to the tokenizer and
+# args. Workers write input_ids/position_idx rows straight into a shared memory
+# matrix and only send back the mask descriptors, so the result costs one copy
+# in the parent instead of unpickling a Python list per position.
+import collections
+import multiprocessing
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+from tqdm import tqdm
+
+from graph_mask import mask_descriptor
+from parser import DFG_python,DFG_java,DFG_ruby,DFG_go,DFG_php,DFG_javascript,DFG_c
+from parser import tree_to_code_tokens
+from parser import load_dfg_cache
+from tree_sitter import Language, Parser
+dfg_function={
+    'python':DFG_python,
+    'java':DFG_java,
+    'ruby':DFG_ruby,
+    'go':DFG_go,
+    'php':DFG_php,
+    'javascript':DFG_javascript,
+    'c':DFG_c
+}
+#parsers are loaded on first use, pool workers only load the language they featurize
+parsers={}
+
+FunctionFeatures = collections.namedtuple('FunctionFeatures', ['input_ids', 'position_idx', 'descriptors'])
+FunctionFeatures.__doc__ = """Features of n functions: two n * length int32 matrices and n MaskDescriptors."""
+
+_worker = {}
+
+
+def load_parser(lang):
+    """[Parser, DFG function] of lang, built once per process."""
+    if lang not in parsers:
+        LANGUAGE = Language('parser/my-languages.so', lang)
+        parser = Parser()
+        parser.set_language(LANGUAGE)
+        parsers[lang]=[parser,dfg_function[lang]]
+    return parsers[lang]
+
+
+#remove comments, tokenize code and extract dataflow
+def extract_dataflow(code, parser,lang):
+    #obtain dataflow
+    if lang=="php":
+        code="<?php"+code+"?>"
+    try:
+        #comments and docstrings are skipped while walking the tree, no regex or tokenize pass
+        code_bytes=bytes(code,'utf8')
+        tree = parser[0].parse(code_bytes)
+        root_node = tree.root_node
+        code_tokens,_,index_to_code=tree_to_code_tokens(root_node,code_bytes,lang)
+        try:
+            DFG,_=parser[1](root_node,index_to_code,{})
+        except:
+            DFG=[]
+        DFG=sorted(DFG,key=lambda x:x[1])
+        indexs=set()
+        for d in DFG:
+            if len(d[-1])!=0:
+                indexs.add(d[1])
+            for x in d[-1]:
+                indexs.add(x)
+        new_DFG=[]
+        for d in DFG:
+            if d[1] in indexs:
+                new_DFG.append(d)
+        dfg=new_DFG
+    except:
+        dfg=[]
+    return code_tokens,dfg
+
+def cached_dataflow(code, parser, lang, args):
+    """extract_dataflow, served from the cache in args.dfg_cache_dir when it is set."""
+    if not args.dfg_cache_dir:
+        return extract_dataflow(code,parser,lang)
+    return load_dfg_cache(args.dfg_cache_dir,extract_dataflow).dataflow(code,parser,lang)
+
+
+def convert_function_to_features(code,tokenizer,args,parser,lang='java'):
+    """(input_tokens, input_ids, position_idx, dfg_to_code, dfg_to_dfg) of one side of a pair."""
+    #extract data flow
+    code_tokens,dfg=cached_dataflow(code,parser,lang,args)
+    code_tokens=[tokenizer.tokenize('@ '+x)[1:] if idx!=0 else tokenizer.tokenize(x) for idx,x in enumerate(code_tokens)]
+    ori2cur_pos={}
+    ori2cur_pos[-1]=(0,0)
+    for i in range(len(code_tokens)):
+        ori2cur_pos[i]=(ori2cur_pos[i-1][1],ori2cur_pos[i-1][1]+len(code_tokens[i]))
+    code_tokens=[y for x in code_tokens for y in x]
+
+    #truncating
+    code_tokens=code_tokens[:args.code_length+args.data_flow_length-3-min(len(dfg),args.data_flow_length)][:512-3]
+    source_tokens =[tokenizer.cls_token]+code_tokens+[tokenizer.sep_token]
+    source_ids =  tokenizer.convert_tokens_to_ids(source_tokens)
+    position_idx = [i+tokenizer.pad_token_id + 1 for i in range(len(source_tokens))]
+    dfg=dfg[:args.code_length+args.data_flow_length-len(source_tokens)]
+    source_tokens+=[x[0] for x in dfg]
+    position_idx+=[0 for x in dfg]
+    source_ids+=[tokenizer.unk_token_id for x in dfg]
+    padding_length=args.code_length+args.data_flow_length-len(source_ids)
+    position_idx+=[tokenizer.pad_token_id]*padding_length
+    source_ids+=[tokenizer.pad_token_id]*padding_length
+
+    #reindex
+    reverse_index={}
+    for idx,x in enumerate(dfg):
+        reverse_index[x[1]]=idx
+    for idx,x in enumerate(dfg):
+        dfg[idx]=x[:-1]+([reverse_index[i] for i in x[-1] if i in reverse_index],)
+    dfg_to_dfg=[x[-1] for x in dfg]
+    dfg_to_code=[ori2cur_pos[x[1]] for x in dfg]
+    length=len([tokenizer.cls_token])
+    dfg_to_code=[(x[0]+length,x[1]+length) for x in dfg_to_code]
+    return source_tokens,source_ids,position_idx,dfg_to_code,dfg_to_dfg
+
+
+def init_worker(lang, tokenizer, args):
+    """Pool initializer: the parser of lang only, and what every chunk needs."""
+    _worker.update(lang=lang,parser=load_parser(lang),tokenizer=tokenizer,args=args)
+
+
+def featurization_pool(processes, lang, tokenizer, args):
+    """Pool for featurize_functions, its workers featurize lang functions with tokenizer and args."""
+    # start the resource tracker first so the workers share it, otherwise every worker
+    # starts its own one and unlinks the shared blocks it has seen when it exits
+    resource_tracker.ensure_running()
+    return multiprocessing.Pool(processes,initializer=init_worker,initargs=(lang,tokenizer,args))
+
+
+def _featurize_chunk(task):
+    name,shape,start,codes=task
+    shm=shared_memory.SharedMemory(name=name)
+    rows=np.ndarray(shape,dtype=np.int32,buffer=shm.buf)
+    descriptors=[]
+    for row,code in enumerate(codes,start):
+        _,input_ids,position_idx,dfg_to_code,dfg_to_dfg=convert_function_to_features(
+            code,_worker['tokenizer'],_worker['args'],_worker['parser'],_worker['lang'])
+        rows[0,row]=input_ids
+        rows[1,row]=position_idx
+        descriptors.append(mask_descriptor(input_ids,position_idx,dfg_to_code,dfg_to_dfg))
+    del rows
+    shm.close()
+    return start,descriptors
+
+
+def featurize_functions(pool, codes, length, chunk_size=64):
+    """FunctionFeatures of codes, rows in the order of codes. pool comes from featurization_pool."""
+    shape=(2,len(codes),length)
+    shm=shared_memory.SharedMemory(create=True,size=max(1,int(np.prod(shape))*4))
+    try:
+        tasks=[(shm.name,shape,start,codes[start:start+chunk_size]) for start in range(0,len(codes),chunk_size)]
+        descriptors=[None]*len(codes)
+        with tqdm(total=len(codes)) as bar:
+            for start,chunk in pool.imap_unordered(_featurize_chunk,tasks):
+                descriptors[start:start+len(chunk)]=chunk
+                bar.update(len(chunk))
+        rows=np.ndarray(shape,dtype=np.int32,buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+    return FunctionFeatures(rows[0],rows[1],descriptors)
@@ -0,0 +1,162 @@
+# Graph-guided attention masks, built per batch.
+#
+# TextDataset used to fill two dense (code_length+data_flow_length)^2 numpy
+# masks per pair with Python loops over tokens, DFG spans and DFG edges, and
+# convert them with torch.tensor(mask.tolist()). Here an example only keeps a
+# MaskDescriptor (a few integers and small index arrays) and build_attn_masks
+# materializes the masks of many functions with broadcasting and index writes.
+# build_attn_masks(...)[i] equals the mask the old get_feature built.
+#
+# collate_batch runs in the DataLoader workers and leaves the descriptors as
+# they are, so a batch crosses the process boundary in O(L) per function.
+# MaskFactory builds the masks in the training process. It can keep the masks
+# of recently seen functions in an LRU cache, since BigCloneBench pairs share
+# functions and an identical descriptor always gives the same mask. A hit
+# still copies the length^2 mask into the batch and a build is little more
+# than that, so the cache only pays off at high hit rates: it is off by
+# default, measure the hit rate on the real train batches (hits, misses)
+# before turning it on with --mask_cache_size.
+import collections
+
+import numpy as np
+import torch
+
+# roberta <s> and </s>, they attend to every non-pad position
+special_token_ids = (0, 2)
+
+MaskDescriptor = collections.namedtuple('MaskDescriptor',
+                                        ['node_index', 'max_length', 'special', 'spans', 'edges'])
+MaskDescriptor.__doc__ = """Everything the graph-guided mask of one function depends on.
+
+node_index: number of code positions (tokens attend to each other below it)
+max_length: number of non-pad positions
+special: positions of special tokens
+spans: (row, start, end) rows, DFG node row attends to code columns start:end and back
+edges: (row, col) rows, DFG node row attends to DFG node col
+"""
+
+
+def mask_descriptor(input_ids, position_idx, dfg_to_code, dfg_to_dfg):
+    """Compact descriptor of one function's mask from its InputFeatures fields."""
+    input_ids=np.asarray(input_ids)
+    position_idx=np.asarray(position_idx)
+    node_index=int((position_idx>1).sum())
+    max_length=int((position_idx!=1).sum())
+    special=np.flatnonzero(np.isin(input_ids,special_token_ids)).astype(np.int32)
+    spans=np.asarray(dfg_to_code,dtype=np.int32).reshape(-1,2)
+    rows=node_index+np.arange(len(spans),dtype=np.int32)
+    keep=(spans[:,0]<node_index)&(spans[:,1]<node_index)
+    spans=np.stack([rows,spans[:,0],spans[:,1]],1)[keep]
+    edges=np.array([(node_index+idx,node_index+a) for idx,nodes in enumerate(dfg_to_dfg) for a in nodes
+                    if a+node_index<len(position_idx)],dtype=np.int32).reshape(-1,2)
+    return MaskDescriptor(node_index,max_length,special,spans,edges)
+
+
+def _stack(arrays, columns):
+    """Concatenate per-function index arrays and the function each row belongs to."""
+    counts=torch.tensor([len(x) for x in arrays])
+    owner=torch.repeat_interleave(torch.arange(len(arrays)),counts)
+    rows=np.concatenate(arrays) if len(arrays) else np.zeros((0,columns),dtype=np.int32)
+    return owner,torch.from_numpy(rows.astype(np.int64)).view(-1,columns)
+
+
+def build_attn_masks(descriptors, length):
+    """n * length * length bool masks of n functions."""
+    n=len(descriptors)
+    positions=torch.arange(length)
+    node_index=torch.tensor([d.node_index for d in descriptors])
+    max_length=torch.tensor([d.max_length for d in descriptors])
+
+    #sequence can attend to sequence
+    in_sequence=positions[None,:]<node_index[:,None]
+    masks=in_sequence[:,:,None]&in_sequence[:,None,:]
+
+    #special tokens attend to all tokens
+    owner,special=_stack([d.special for d in descriptors],1)
+    special=special[:,0]
+    masks[owner,special]=masks[owner,special]|(positions[None,:]<max_length[owner][:,None])
+
+    #nodes attend to code tokens that are identified from, and back
+    owner,spans=_stack([d.spans for d in descriptors],3)
+    widths=(spans[:,2]-spans[:,1]).clamp(min=0)
+    span_owner=torch.repeat_interleave(owner,widths)
+    span_rows=torch.repeat_interleave(spans[:,0],widths)
+    starts=torch.cumsum(widths,0)-widths
+    span_cols=torch.repeat_interleave(spans[:,1]-starts,widths)+torch.arange(int(widths.sum()))
+    masks[span_owner,span_rows,span_cols]=True
+    masks[span_owner,span_cols,span_rows]=True
+
+    #nodes attend to adjacent nodes
+    owner,edges=_stack([d.edges for d in descriptors],2)
+    masks[owner,edges[:,0],edges[:,1]]=True
+    return masks
+
+
+def build_node_spans(descriptors, length):
+    """n * length * 2 (start, end) code span of every DFG node position, empty elsewhere."""
+    owner,spans=_stack([d.spans for d in descriptors],3)
+    node_spans=torch.zeros(len(descriptors),length,2,dtype=torch.long)
+    node_spans[owner,spans[:,0]]=spans[:,1:]
+    return node_spans
+
+
+def descriptor_key(descriptor):
+    """Hashable content of a MaskDescriptor, equal keys give equal masks."""
+    return (descriptor.node_index,descriptor.max_length,descriptor.special.tobytes(),
+            descriptor.spans.tobytes(),descriptor.edges.tobytes())
+
+
+class MaskFactory(object):
+    """Attention masks of collated descriptors, with an LRU cache of per-function masks.
+
+    factory(descriptors) takes the 2B descriptors collate_batch returns for B pairs and
+    gives the B * 2 * length * length mask Model expects. cache_size 0, the default, disables the cache.
+    """
+
+    def __init__(self, length, cache_size=0):
+        self.length=length
+        self.cache_size=cache_size
+        self.cache=collections.OrderedDict()
+        self.hits=0
+        self.misses=0
+
+    def __call__(self, descriptors):
+        length=self.length
+        if self.cache_size<=0:
+            return build_attn_masks(descriptors,length).view(-1,2,length,length)
+        keys=[descriptor_key(d) for d in descriptors]
+        missing={}
+        for key,descriptor in zip(keys,descriptors):
+            if key in self.cache:
+                self.cache.move_to_end(key)
+            elif key not in missing:
+                missing[key]=descriptor
+        self.hits+=len(keys)-len(missing)
+        self.misses+=len(missing)
+        if missing:
+            # a copy of its own, a view would keep the whole built batch alive
+            for key,mask in zip(missing,build_attn_masks(list(missing.values()),length)):
+                self.cache[key]=mask.clone()
+        #one copy of every mask into the batch, hit or not
+        masks=torch.empty(len(keys),length,length,dtype=torch.bool)
+        for i,key in enumerate(keys):
+            masks[i]=self.cache[key]
+        while len(self.cache)>self.cache_size:
+            self.cache.popitem(last=False)
+        return masks.view(-1,2,length,length)
+
+    def node_spans(self, descriptors):
+        """B * 2length * 2 node spans of the 2B descriptors, Model pools the DFG node embeddings with them."""
+        return build_node_spans(descriptors,self.length).view(-1,2*self.length,2)
+
+
+def collate_batch(batch):
+    """DataLoader collate_fn for TextDataset items (ids, position_idx, (descriptor1, descriptor2), label).
+
+    Returns (ids, position_idx, descriptors, labels), descriptors are the 2B MaskDescriptors of
+    the batch, a MaskFactory turns them into attention masks and node spans in the training process.
+    """
+    input_ids=torch.stack([x[0] for x in batch])
+    position_idx=torch.stack([x[1] for x in batch])
+    labels=torch.stack([x[3] for x in batch])
+    return input_ids,position_idx,[d for x in batch for d in x[2]],labels
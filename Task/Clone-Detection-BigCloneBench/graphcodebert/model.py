@@ -8,6 +8,31 @@ import copy
 import torch.nn.functional as F
 from torch.nn import CrossEntropyLoss, MSELoss
 
+def mask_node_token_pairs(nodes_mask,token_mask,attn_mask):
+    """Flat (node, token) indices into the 2B*L positions of every node attending to a code token."""
+    length=attn_mask.size(-1)
+    function,node,token=(nodes_mask[:,:,None]&token_mask[:,None,:]&attn_mask).nonzero(as_tuple=True)
+    return function*length+node,function*length+token
+
+def span_node_token_pairs(node_spans):
+    """Flat (node, token) indices from 2B * L * 2 (start, end) code spans of the node positions."""
+    length=node_spans.size(1)
+    starts=node_spans[:,:,0].reshape(-1)
+    widths=(node_spans[:,:,1].reshape(-1)-starts).clamp(min=0)
+    positions=torch.arange(widths.numel(),device=node_spans.device)
+    nodes=positions.repeat_interleave(widths)
+    #token of the k-th pair: function offset + span start + rank of the pair inside its span
+    offsets=torch.arange(nodes.numel(),device=node_spans.device)-(torch.cumsum(widths,0)-widths).repeat_interleave(widths)
+    tokens=(positions-positions%length+starts).repeat_interleave(widths)+offsets
+    return nodes,tokens
+
+def average_node_embeddings(inputs_embeddings,nodes,tokens):
+    """Mean embedding of the tokens of every node (zero without tokens), a segment mean over flat indices."""
+    flat=inputs_embeddings.reshape(-1,inputs_embeddings.size(-1))
+    sums=torch.zeros_like(flat).index_add_(0,nodes,flat[tokens])
+    counts=torch.bincount(nodes,minlength=flat.size(0)).to(flat.dtype)
+    return sums.div_((counts+1e-10)[:,None]).view_as(inputs_embeddings)
+
 class RobertaClassificationHead(nn.Module):
     """Head for sentence-level classification tasks."""
 
@@ -37,7 +62,7 @@ class Model(nn.Module):
         self.args=args
     
         
-    def forward(self, input_ids=None,position_idx=None,attn_mask=None,labels=None): 
+    def forward(self, input_ids=None,position_idx=None,attn_mask=None,labels=None,node_spans=None): 
         assert input_ids.size(-1) % 2 == 0
         assert position_idx.size(-1) % 2 == 0
         assert attn_mask.size(-1) % 2 == 0
@@ -50,9 +75,13 @@ class Model(nn.Module):
         nodes_mask=position_idx.eq(0)
         token_mask=position_idx.ge(2)        
         inputs_embeddings=self.encoder.embeddings.word_embeddings(input_ids)
-        nodes_to_token_mask=nodes_mask[:,:,None]&token_mask[:,None,:]&attn_mask
-        nodes_to_token_mask=nodes_to_token_mask/(nodes_to_token_mask.sum(-1)+1e-10)[:,:,None]
-        avg_embeddings=torch.einsum("abc,acd->abd",nodes_to_token_mask,inputs_embeddings)
+        #node embeddings are the average of the tokens they are identified from,
+        #collate_batch passes the node spans, otherwise they are read off the mask
+        if node_spans is None:
+            nodes,tokens=mask_node_token_pairs(nodes_mask,token_mask,attn_mask)
+        else:
+            nodes,tokens=span_node_token_pairs(node_spans.view(-1,input_ids.size(-1),2))
+        avg_embeddings=average_node_embeddings(inputs_embeddings,nodes,tokens)
         inputs_embeddings=inputs_embeddings*(~nodes_mask)[:,:,None]+avg_embeddings*nodes_mask[:,:,None]    
 
         # inputs_embeddings: 96 * 640 * 768 
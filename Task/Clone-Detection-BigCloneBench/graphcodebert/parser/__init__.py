@@ -1,5 +1,7 @@
 from .utils import (remove_comments_and_docstrings,
                    tree_to_token_index,
                    index_to_code_token,
-                   tree_to_variable_index)
-from .DFG import DFG_python,DFG_java,DFG_ruby,DFG_go,DFG_php,DFG_javascript,DFG_csharp,DFG_c
\ No newline at end of file
+                   tree_to_variable_index,
+                   tree_to_code_tokens)
+from .DFG import DFG_python,DFG_java,DFG_ruby,DFG_go,DFG_php,DFG_javascript,DFG_csharp,DFG_c
+from .dfg_cache import load_dfg_cache, dfg_cache_stats
@@ -0,0 +1,75 @@
+# On-disk cache of extract_dataflow results.
+#
+# Parsing with tree-sitter and walking the tree with the DFG_* functions is the
+# slow part of featurization, and the functions of a dataset never change
+# between runs. Entries are keyed by sha1(code) and language under a version
+# directory that hashes DFG.py, utils.py and the extract function itself, so
+# editing any of them starts a fresh cache instead of serving stale graphs.
+# Each entry is one marshal file (code tokens + DFG tuples) written to a
+# temporary name and renamed into place, which keeps concurrent pool workers
+# from ever reading a partial entry. Hit/miss counters live in shared memory
+# created at import, so forked pool workers count into the parent's totals.
+import hashlib
+import inspect
+import marshal
+import multiprocessing
+import os
+import sys
+
+_package_dir = os.path.dirname(os.path.abspath(__file__))
+_hits = multiprocessing.Value('l', 0)
+_misses = multiprocessing.Value('l', 0)
+_caches = {}
+
+
+def _version(extract):
+    h=hashlib.sha1()
+    for name in ['DFG.py','utils.py']:
+        with open(os.path.join(_package_dir,name),'rb') as f:
+            h.update(f.read())
+    h.update(inspect.getsource(extract).encode())
+    # marshal output is only readable by the same format and python version
+    h.update('{} {}.{}'.format(marshal.version,*sys.version_info[:2]).encode())
+    return h.hexdigest()[:16]
+
+
+class DFGCache(object):
+    def __init__(self, cache_dir, extract):
+        self.extract=extract
+        self.root=os.path.join(cache_dir,_version(extract))
+
+    def path(self, code, lang):
+        key=hashlib.sha1(code.encode('utf8')).hexdigest()
+        return os.path.join(self.root,lang,key[:2],key+'.bin')
+
+    def dataflow(self, code, parser, lang):
+        """extract(code,parser,lang), read from disk when this code was seen before."""
+        path=self.path(code,lang)
+        try:
+            with open(path,'rb') as f:
+                code_tokens,dfg=marshal.load(f)
+            with _hits.get_lock():
+                _hits.value+=1
+            return code_tokens,dfg
+        except (IOError,OSError,EOFError,ValueError,TypeError):
+            pass
+        code_tokens,dfg=self.extract(code,parser,lang)
+        with _misses.get_lock():
+            _misses.value+=1
+        os.makedirs(os.path.dirname(path),exist_ok=True)
+        tmp_path='{}.{}.tmp'.format(path,os.getpid())
+        with open(tmp_path,'wb') as f:
+            marshal.dump((code_tokens,dfg),f)
+        os.replace(tmp_path,path)
+        return code_tokens,dfg
+
+
+def load_dfg_cache(cache_dir, extract):
+    """Process-wide DFGCache of cache_dir for the given extract function."""
+    if cache_dir not in _caches:
+        _caches[cache_dir]=DFGCache(cache_dir,extract)
+    return _caches[cache_dir]
+
+
+def dfg_cache_stats():
+    return {'hits':_hits.value,'misses':_misses.value}
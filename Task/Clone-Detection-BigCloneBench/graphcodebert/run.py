@@ -43,6 +43,7 @@ except:
 from tqdm import tqdm, trange
 import multiprocessing
 from model import Model
+from graph_mask import MaskFactory, collate_batch
 
 cpu_cont = 16
 from transformers import (WEIGHTS_NAME, AdamW, get_linear_schedule_with_warmup,
@@ -53,29 +54,8 @@ from transformers import (WEIGHTS_NAME, AdamW, get_linear_schedule_with_warmup,
                           DistilBertConfig, DistilBertForMaskedLM, DistilBertTokenizer)
 
 logger = logging.getLogger(__name__)
-from parser import DFG_python,DFG_java,DFG_ruby,DFG_go,DFG_php,DFG_javascript,DFG_c
-from parser import (remove_comments_and_docstrings,
-                   tree_to_token_index,
-                   index_to_code_token,
-                   tree_to_variable_index)
-from tree_sitter import Language, Parser
-dfg_function={
-    'python':DFG_python,
-    'java':DFG_java,
-    'ruby':DFG_ruby,
-    'go':DFG_go,
-    'php':DFG_php,
-    'javascript':DFG_javascript,
-    'c':DFG_c
-}
-#load parsers
-parsers={}        
-for lang in dfg_function:
-    LANGUAGE = Language('parser/my-languages.so', lang)
-    parser = Parser()
-    parser.set_language(LANGUAGE) 
-    parser = [parser,dfg_function[lang]]    
-    parsers[lang]= parser
+from parser import dfg_cache_stats
+from featurize import featurization_pool, featurize_functions
 
 MODEL_CLASSES = {
     'gpt2': (GPT2Config, GPT2LMHeadModel, GPT2Tokenizer),
@@ -85,162 +65,6 @@ MODEL_CLASSES = {
     'distilbert': (DistilBertConfig, DistilBertForMaskedLM, DistilBertTokenizer)
 }
 
-#remove comments, tokenize code and extract dataflow                                        
-def extract_dataflow(code, parser,lang):
-    #remove comments
-    try:
-        code=remove_comments_and_docstrings(code,lang)
-    except:
-        pass    
-    #obtain dataflow
-    if lang=="php":
-        code="<?php"+code+"?>"    
-    try:
-        tree = parser[0].parse(bytes(code,'utf8'))    
-        root_node = tree.root_node  
-        tokens_index=tree_to_token_index(root_node)     
-        code=code.split('\n')
-        code_tokens=[index_to_code_token(x,code) for x in tokens_index]  
-        index_to_code={}
-        for idx,(index,code) in enumerate(zip(tokens_index,code_tokens)):
-            index_to_code[index]=(idx,code)  
-        try:
-            DFG,_=parser[1](root_node,index_to_code,{}) 
-        except:
-            DFG=[]
-        DFG=sorted(DFG,key=lambda x:x[1])
-        indexs=set()
-        for d in DFG:
-            if len(d[-1])!=0:
-                indexs.add(d[1])
-            for x in d[-1]:
-                indexs.add(x)
-        new_DFG=[]
-        for d in DFG:
-            if d[1] in indexs:
-                new_DFG.append(d)
-        dfg=new_DFG
-    except:
-        dfg=[]
-    return code_tokens,dfg
-
-def get_example(item):
-    url1,url2,label,tokenizer,args,cache,url_to_code=item
-    try:
-        code1=' '.join(url_to_code[url1].split())
-    except:
-        code1=""
-    try:
-        code2=' '.join(url_to_code[url2].split())
-    except:
-        code2=""
-        
-    return convert_examples_to_features(code1,code2,label,url1,url2,tokenizer,args,cache)
-
-
-class InputFeatures(object):
-    """A single training/test features for a example."""
-    def __init__(self,
-                 input_tokens1,
-                 input_ids1,
-                 position_idx1,
-                 dfg_to_code1,
-                 dfg_to_dfg1,
-                 input_tokens2,
-                 input_ids2,
-                 position_idx2,
-                 dfg_to_code2,
-                 dfg_to_dfg2,
-                 label,
-                 url1,
-                 url2
-
-    ):
-        self.input_tokens1 = input_tokens1
-        self.input_ids1 = input_ids1
-        self.label=label
-        self.url1=url1
-        self.url2=url2
-        self.position_idx1=position_idx1
-        self.dfg_to_code1=dfg_to_code1
-        self.dfg_to_dfg1=dfg_to_dfg1
-
-        self.input_tokens2 = input_tokens2
-        self.input_ids2 = input_ids2
-        self.position_idx2=position_idx2
-        self.dfg_to_code2=dfg_to_code2
-        self.dfg_to_dfg2=dfg_to_dfg2
-        
-def convert_examples_to_features(code1,code2,label,url1,url2,tokenizer,args,cache):
-    #extract data flow
-    code_tokens,dfg=extract_dataflow(code1,parsers['java'],'java')
-    code_tokens=[tokenizer.tokenize('@ '+x)[1:] if idx!=0 else tokenizer.tokenize(x) for idx,x in enumerate(code_tokens)]
-    ori2cur_pos={}
-    ori2cur_pos[-1]=(0,0)
-    for i in range(len(code_tokens)):
-        ori2cur_pos[i]=(ori2cur_pos[i-1][1],ori2cur_pos[i-1][1]+len(code_tokens[i]))    
-    code_tokens=[y for x in code_tokens for y in x]  
-    
-    #truncating
-    code_tokens=code_tokens[:args.code_length+args.data_flow_length-3-min(len(dfg),args.data_flow_length)][:512-3]
-    code1_tokens =[tokenizer.cls_token]+code_tokens+[tokenizer.sep_token]
-    code1_ids =  tokenizer.convert_tokens_to_ids(code1_tokens)
-    position1_idx = [i+tokenizer.pad_token_id + 1 for i in range(len(code1_tokens))]
-    dfg=dfg[:args.code_length+args.data_flow_length-len(code1_tokens)]
-    code1_tokens+=[x[0] for x in dfg]
-    position1_idx+=[0 for x in dfg]
-    code1_ids+=[tokenizer.unk_token_id for x in dfg]
-    padding_length=args.code_length+args.data_flow_length-len(code1_ids)
-    position1_idx+=[tokenizer.pad_token_id]*padding_length
-    code1_ids+=[tokenizer.pad_token_id]*padding_length      
-    
-    #reindex
-    reverse_index={}
-    for idx,x in enumerate(dfg):
-        reverse_index[x[1]]=idx
-    for idx,x in enumerate(dfg):
-        dfg[idx]=x[:-1]+([reverse_index[i] for i in x[-1] if i in reverse_index],)    
-    dfg_to_dfg1=[x[-1] for x in dfg]
-    dfg_to_code1=[ori2cur_pos[x[1]] for x in dfg]
-    length=len([tokenizer.cls_token])
-    dfg_to_code1=[(x[0]+length,x[1]+length) for x in dfg_to_code1]        
-
-    #extract data flow
-    code_tokens,dfg=extract_dataflow(code2,parser,'java')
-    code_tokens=[tokenizer.tokenize('@ '+x)[1:] if idx!=0 else tokenizer.tokenize(x) for idx,x in enumerate(code_tokens)]
-    ori2cur_pos={}
-    ori2cur_pos[-1]=(0,0)
-    for i in range(len(code_tokens)):
-        ori2cur_pos[i]=(ori2cur_pos[i-1][1],ori2cur_pos[i-1][1]+len(code_tokens[i]))    
-    code_tokens=[y for x in code_tokens for y in x]  
-    
-    #truncating
-    code_tokens=code_tokens[:args.code_length+args.data_flow_length-3-min(len(dfg),args.data_flow_length)][:512-3]
-    code2_tokens =[tokenizer.cls_token]+code_tokens+[tokenizer.sep_token]
-    code2_ids =  tokenizer.convert_tokens_to_ids(code2_tokens)
-    position2_idx = [i+tokenizer.pad_token_id + 1 for i in range(len(code2_tokens))]
-    dfg=dfg[:args.code_length+args.data_flow_length-len(code2_tokens)]
-    code2_tokens+=[x[0] for x in dfg]
-    position2_idx+=[0 for x in dfg]
-    code2_ids+=[tokenizer.unk_token_id for x in dfg]
-    padding_length=args.code_length+args.data_flow_length-len(code2_ids)
-    position2_idx+=[tokenizer.pad_token_id]*padding_length
-    code2_ids+=[tokenizer.pad_token_id]*padding_length      
-    
-    #reindex
-    reverse_index={}
-    for idx,x in enumerate(dfg):
-        reverse_index[x[1]]=idx
-    for idx,x in enumerate(dfg):
-        dfg[idx]=x[:-1]+([reverse_index[i] for i in x[-1] if i in reverse_index],)    
-    dfg_to_dfg2=[x[-1] for x in dfg]
-    dfg_to_code2=[ori2cur_pos[x[1]] for x in dfg]
-    length=len([tokenizer.cls_token])
-    dfg_to_code2=[(x[0]+length,x[1]+length) for x in dfg_to_code2]        
-
-    return InputFeatures(code1_tokens,code1_ids,position1_idx,dfg_to_code1,dfg_to_dfg1,
-                         code2_tokens,code2_ids,position2_idx,dfg_to_code2,dfg_to_dfg2,
-                         label,url1,url2)
 
 class TextDataset(Dataset):
     def __init__(self, tokenizer, args, file_path='train',pool=None):
@@ -257,8 +81,6 @@ class TextDataset(Dataset):
                 url_to_code[js['idx']]=js['func']
 
         data=[]
-        cache={}
-        f=open(index_filename)
         with open(index_filename) as f:
             for line in f:
                 line=line.strip()
@@ -269,77 +91,42 @@ class TextDataset(Dataset):
                     label=0
                 else:
                     label=1
-                data.append((url1,url2,label,tokenizer, args,cache,url_to_code))
+                data.append((url1,url2,label))
         if 'test' not in postfix:
             data=random.sample(data,int(len(data)*0.1))
 
-        self.examples=pool.map(get_example,tqdm(data,total=len(data)))
+        #pairs share functions, featurize every distinct function once
+        urls=list(dict.fromkeys(url for url1,url2,_ in data for url in (url1,url2)))
+        url_to_row={url:row for row,url in enumerate(urls)}
+        self.functions=featurize_functions(pool,[' '.join(url_to_code[url].split()) for url in urls],
+                                           args.code_length+args.data_flow_length)
+        self.examples=data
+        self.rows=np.array([(url_to_row[url1],url_to_row[url2]) for url1,url2,_ in data],dtype=np.int64).reshape(-1,2)
+        if args.dfg_cache_dir:
+            logger.info("DFG cache: %(hits)d hits, %(misses)d misses", dfg_cache_stats())
         if 'train' in postfix:
-            for idx, example in enumerate(self.examples[:3]):
+            for idx, (url1,url2,label) in enumerate(self.examples[:3]):
+                    input_ids=self.functions.input_ids[self.rows[idx,0]]
                     logger.info("*** Example ***")
                     logger.info("idx: {}".format(idx))
-                    logger.info("label: {}".format(example.label))
-                    logger.info("input_tokens: {}".format([x.replace('\u0120','_') for x in example.input_tokens1]))
-                    logger.info("input_ids: {}".format(' '.join(map(str, example.input_ids1))))
-
-    def get_feature(self, example):
-        #calculate graph-guided masked function
-        attn_mask1= np.zeros((self.args.code_length+self.args.data_flow_length,
-                        self.args.code_length+self.args.data_flow_length),dtype=bool)
-        #calculate begin index of node and max length of input
-        node_index=sum([i>1 for i in example.position_idx1])
-        max_length=sum([i!=1 for i in example.position_idx1])
-        #sequence can attend to sequence
-        attn_mask1[:node_index,:node_index]=True
-        #special tokens attend to all tokens
-        for idx,i in enumerate(example.input_ids1):
-            if i in [0,2]:
-                attn_mask1[idx,:max_length]=True
-        #nodes attend to code tokens that are identified from
-        for idx,(a,b) in enumerate(example.dfg_to_code1):
-            if a<node_index and b<node_index:
-                attn_mask1[idx+node_index,a:b]=True
-                attn_mask1[a:b,idx+node_index]=True
-        #nodes attend to adjacent nodes 
-        for idx,nodes in enumerate(example.dfg_to_dfg1):
-            for a in nodes:
-                if a+node_index<len(example.position_idx1):
-                    attn_mask1[idx+node_index,a+node_index]=True  
-                    
-        #calculate graph-guided masked function
-        attn_mask2= np.zeros((self.args.code_length+self.args.data_flow_length,
-                        self.args.code_length+self.args.data_flow_length),dtype=bool)
-        #calculate begin index of node and max length of input
-        node_index=sum([i>1 for i in example.position_idx2])
-        max_length=sum([i!=1 for i in example.position_idx2])
-        #sequence can attend to sequence
-        attn_mask2[:node_index,:node_index]=True
-        #special tokens attend to all tokens
-        for idx,i in enumerate(example.input_ids2):
-            if i in [0,2]:
-                attn_mask2[idx,:max_length]=True
-        #nodes attend to code tokens that are identified from
-        for idx,(a,b) in enumerate(example.dfg_to_code2):
-            if a<node_index and b<node_index:
-                attn_mask2[idx+node_index,a:b]=True
-                attn_mask2[a:b,idx+node_index]=True
-        #nodes attend to adjacent nodes 
-        for idx,nodes in enumerate(example.dfg_to_dfg2):
-            for a in nodes:
-                if a+node_index<len(example.position_idx2):
-                    attn_mask2[idx+node_index,a+node_index]=True  
-
-        return torch.tensor(example.input_ids1+example.input_ids2),\
-               torch.tensor(example.position_idx1+example.position_idx2),\
-               torch.tensor([attn_mask1.tolist(), attn_mask2.tolist()]),\
-               torch.tensor(example.label)
+                    logger.info("label: {}".format(label))
+                    logger.info("input_tokens: {}".format([x.replace('\u0120','_') for x in tokenizer.convert_ids_to_tokens(input_ids.tolist())]))
+                    logger.info("input_ids: {}".format(' '.join(map(str, input_ids))))
+
+    def get_feature(self, item):
+        #graph-guided masks are built per batch by a MaskFactory from the descriptors
+        row1,row2=self.rows[item]
+        return torch.from_numpy(np.concatenate([self.functions.input_ids[row1],self.functions.input_ids[row2]]).astype(np.int64)),\
+               torch.from_numpy(np.concatenate([self.functions.position_idx[row1],self.functions.position_idx[row2]]).astype(np.int64)),\
+               (self.functions.descriptors[row1],self.functions.descriptors[row2]),\
+               torch.tensor(self.examples[item][2])
 
     def __len__(self):
         return len(self.examples)
 
     def __getitem__(self, item):
         
-        return self.get_feature(self.examples[item])
+        return self.get_feature(item)
 
 
 def load_and_cache_examples(args, tokenizer, evaluate=False,test=False,pool=None):
@@ -360,7 +147,8 @@ def train(args, train_dataset, model, tokenizer,pool):
     args.train_batch_size = args.per_gpu_train_batch_size * max(1, args.n_gpu)
     train_sampler = RandomSampler(train_dataset) if args.local_rank == -1 else DistributedSampler(train_dataset)
     
-    train_dataloader = DataLoader(train_dataset, sampler=train_sampler, batch_size=args.train_batch_size)
+    train_dataloader = DataLoader(train_dataset, sampler=train_sampler, batch_size=args.train_batch_size,collate_fn=collate_batch)
+    mask_factory=MaskFactory(args.code_length+args.data_flow_length,args.mask_cache_size)
     args.max_steps=args.epoch*len( train_dataloader)
     args.save_steps=len( train_dataloader)
     args.warmup_steps=len( train_dataloader)
@@ -427,10 +215,11 @@ def train(args, train_dataset, model, tokenizer,pool):
         for step, batch in enumerate(bar):
             inputs = batch[0].to(args.device)        
             position_idx = batch[1].to(args.device)
-            attn_mask = batch[2].to(args.device)
+            attn_mask = mask_factory(batch[2]).to(args.device)
+            node_spans = mask_factory.node_spans(batch[2]).to(args.device)
             labels=batch[3].to(args.device) 
             model.train()
-            loss,logits = model(inputs,position_idx,attn_mask,labels)
+            loss,logits = model(inputs,position_idx,attn_mask,labels,node_spans=node_spans)
 
 
             if args.n_gpu > 1:
@@ -486,7 +275,9 @@ def train(args, train_dataset, model, tokenizer,pool):
                         output_dir = os.path.join(output_dir, '{}'.format('model.bin')) 
                         torch.save(model_to_save.state_dict(), output_dir)
                         logger.info("Saving model checkpoint to %s", output_dir)
-                        
+
+        if args.mask_cache_size > 0:
+            logger.info("Mask cache: %d hits, %d misses", mask_factory.hits, mask_factory.misses)
         if args.max_steps > 0 and global_step > args.max_steps:
             train_iterator.close()
             break
@@ -502,7 +293,8 @@ def evaluate(args, model, tokenizer, prefix="",pool=None,eval_when_training=Fals
     args.eval_batch_size = args.per_gpu_eval_batch_size * max(1, args.n_gpu)
     # Note that DistributedSampler samples randomly
     eval_sampler = SequentialSampler(eval_dataset) if args.local_rank == -1 else DistributedSampler(eval_dataset)
-    eval_dataloader = DataLoader(eval_dataset, sampler=eval_sampler, batch_size=args.eval_batch_size,num_workers=4,pin_memory=True)
+    eval_dataloader = DataLoader(eval_dataset, sampler=eval_sampler, batch_size=args.eval_batch_size,num_workers=4,pin_memory=True,collate_fn=collate_batch)
+    mask_factory=MaskFactory(args.code_length+args.data_flow_length,args.mask_cache_size)
 
     # multi-gpu evaluate
     if args.n_gpu > 1 and eval_when_training is False:
@@ -520,10 +312,11 @@ def evaluate(args, model, tokenizer, prefix="",pool=None,eval_when_training=Fals
     for batch in eval_dataloader:
         inputs = batch[0].to(args.device)        
         position_idx = batch[1].to(args.device)
-        attn_mask = batch[2].to(args.device)
+        attn_mask = mask_factory(batch[2]).to(args.device)
+        node_spans = mask_factory.node_spans(batch[2]).to(args.device)
         labels=batch[3].to(args.device) 
         with torch.no_grad():
-            lm_loss,logit = model(inputs,position_idx,attn_mask,labels)
+            lm_loss,logit = model(inputs,position_idx,attn_mask,labels,node_spans=node_spans)
             eval_loss += lm_loss.mean().item()
             logits.append(logit.cpu().numpy())
             y_trues.append(labels.cpu().numpy())
@@ -574,7 +367,8 @@ def test(args, model, tokenizer, prefix="",pool=None,best_threshold=0):
     args.eval_batch_size = args.per_gpu_eval_batch_size * max(1, args.n_gpu)
     # Note that DistributedSampler samples randomly
     eval_sampler = SequentialSampler(eval_dataset) if args.local_rank == -1 else DistributedSampler(eval_dataset)
-    eval_dataloader = DataLoader(eval_dataset, sampler=eval_sampler, batch_size=args.eval_batch_size,num_workers=1)
+    eval_dataloader = DataLoader(eval_dataset, sampler=eval_sampler, batch_size=args.eval_batch_size,num_workers=1,collate_fn=collate_batch)
+    mask_factory=MaskFactory(args.code_length+args.data_flow_length,args.mask_cache_size)
 
     # multi-gpu evaluate
     if args.n_gpu > 1:
@@ -592,10 +386,11 @@ def test(args, model, tokenizer, prefix="",pool=None,best_threshold=0):
     for batch in tqdm(eval_dataloader, total=len(eval_dataloader)):
         inputs = batch[0].to(args.device)        
         position_idx = batch[1].to(args.device)
-        attn_mask = batch[2].to(args.device)
+        attn_mask = mask_factory(batch[2]).to(args.device)
+        node_spans = mask_factory.node_spans(batch[2]).to(args.device)
         labels=batch[3].to(args.device) 
         with torch.no_grad():
-            lm_loss,logit = model(inputs,position_idx,attn_mask,labels)
+            lm_loss,logit = model(inputs,position_idx,attn_mask,labels,node_spans=node_spans)
             eval_loss += lm_loss.mean().item()
             logits.append(logit.cpu().numpy())
             y_trues.append(labels.cpu().numpy())
@@ -604,11 +399,11 @@ def test(args, model, tokenizer, prefix="",pool=None,best_threshold=0):
     y_trues=np.concatenate(y_trues,0)
     y_preds=logits[:,1]>best_threshold
     with open(os.path.join(args.output_dir,"predictions.txt"),'w') as f:
-        for example,pred in zip(eval_dataset.examples,y_preds):
+        for (url1,url2,_),pred in zip(eval_dataset.examples,y_preds):
             if pred:
-                f.write(example.url1+'\t'+example.url2+'\t'+'1'+'\n')
+                f.write(url1+'\t'+url2+'\t'+'1'+'\n')
             else:
-                f.write(example.url1+'\t'+example.url2+'\t'+'0'+'\n')
+                f.write(url1+'\t'+url2+'\t'+'0'+'\n')
                                                 
     from sklearn.metrics import recall_score
     recall=recall_score(y_trues, y_preds, average='macro')
@@ -725,9 +520,13 @@ def main():
     parser.add_argument('--server_ip', type=str, default='', help="For distant debugging.")
     parser.add_argument('--server_port', type=str, default='', help="For distant debugging.")
     parser.add_argument("--test_type", default="", type=str,)
+    parser.add_argument("--dfg_cache_dir", default=None, type=str,
+                        help="Directory of the on-disk data flow cache, unset to parse every function.")
+    parser.add_argument("--mask_cache_size", default=0, type=int,
+                        help="Attention masks of recently seen functions kept in memory, 0 (the default) to build every mask. "
+                             "Only faster at high hit rates.")
 
     
-    pool = multiprocessing.Pool(cpu_cont)
     args = parser.parse_args()
     if args.local_rank == -1 and 'LOCAL_RANK' in os.environ:
         args.local_rank = int(os.environ['LOCAL_RANK'])
@@ -790,6 +589,8 @@ def main():
     tokenizer = tokenizer_class.from_pretrained(args.tokenizer_name,
                                                 do_lower_case=args.do_lower_case,
                                                 cache_dir=args.cache_dir if args.cache_dir else None)
+    #workers load the java grammar only, before the model is built so they do not fork it
+    pool = featurization_pool(cpu_cont,'java',tokenizer,args)
     if args.model_name_or_path:
         model = model_class.from_pretrained(args.model_name_or_path,
                                             from_tf=bool('.ckpt' in args.model_name_or_path),
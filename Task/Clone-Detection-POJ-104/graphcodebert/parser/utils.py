@@ -61,28 +61,30 @@ def remove_comments_and_docstrings(source,lang):
         return '\n'.join(temp)
 
 def tree_to_token_index(root_node):
-    # have child
-    if (len(root_node.children)==0 or root_node.type=='string' or root_node.type=='string_literal') and root_node.type!='comment':
-        return [(root_node.start_point,root_node.end_point)]
-    else:
-        code_tokens=[]
-        for child in root_node.children:
-            code_tokens+=tree_to_token_index(child)
-        return code_tokens
+    # an explicit stack, deeply nested code would exceed the recursion limit
+    code_tokens=[]
+    stack=[root_node]
+    while stack:
+        node=stack.pop()
+        if (len(node.children)==0 or node.type=='string' or node.type=='string_literal') and node.type!='comment':
+            code_tokens.append((node.start_point,node.end_point))
+        else:
+            stack.extend(reversed(node.children))
+    return code_tokens
     
 def tree_to_variable_index(root_node,index_to_code):
-    if (len(root_node.children)==0 or root_node.type=='string' or root_node.type=='string_literal') and root_node.type!='comment':
-        index=(root_node.start_point,root_node.end_point)
-        _,code=index_to_code[index]
-        if root_node.type!=code:
-            return [(root_node.start_point,root_node.end_point)]
+    code_tokens=[]
+    stack=[root_node]
+    while stack:
+        node=stack.pop()
+        if (len(node.children)==0 or node.type=='string' or node.type=='string_literal') and node.type!='comment':
+            index=(node.start_point,node.end_point)
+            _,code=index_to_code[index]
+            if node.type!=code:
+                code_tokens.append(index)
         else:
-            return []
-    else:
-        code_tokens=[]
-        for child in root_node.children:
-            code_tokens+=tree_to_variable_index(child,index_to_code)
-        return code_tokens    
+            stack.extend(reversed(node.children))
+    return code_tokens    
 
 def index_to_code_token(index,code):
     start_point=index[0]
@@ -96,4 +98,39 @@ def index_to_code_token(index,code):
             s+=code[i]
         s+=code[end_point[0]][:end_point[1]]   
     return s
-   
\ No newline at end of file
+
+def tree_to_code_tokens(root_node,code,lang=None):
+    """(code_tokens, byte spans, index_to_code) of the comment-free leaves of root_node in one walk.
+
+    code is the bytes the tree was parsed from. Comments are skipped, and with
+    lang python so are docstrings: their strings stay in index_to_code as
+    (-1,'') for the DFG extractors but are not tokens. Tokens are decoded from
+    byte offsets, their line breaks dropped like index_to_code_token does.
+    """
+    text=code.decode('utf8','replace')
+    if len(text)!=len(code):
+        text=None
+    code_tokens=[]
+    spans=[]
+    index_to_code={}
+    cursor=root_node.walk()
+    while True:
+        node=cursor.node
+        node_type=node.type
+        if node_type=='comment':
+            pass
+        elif lang=='python' and node_type=='expression_statement' and node.child_count==1 and node.children[0].type=='string':
+            leaf=node.children[0]
+            index_to_code[(leaf.start_point,leaf.end_point)]=(-1,'')
+        elif node_type=='string' or node_type=='string_literal' or not cursor.goto_first_child():
+            start,end=node.start_byte,node.end_byte
+            token=text[start:end] if text is not None else code[start:end].decode('utf8','replace')
+            token=token.replace('\n','')
+            index_to_code[(node.start_point,node.end_point)]=(len(code_tokens),token)
+            spans.append((start,end))
+            code_tokens.append(token)
+        else:
+            continue
+        while not cursor.goto_next_sibling():
+            if not cursor.goto_parent():
+                return code_tokens,spans,index_to_code
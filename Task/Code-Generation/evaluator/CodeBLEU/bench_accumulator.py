@@ -0,0 +1,116 @@
+# Equality check and memory benchmark of the streaming CodeBLEU accumulators.
+#
+# Scores one corpus with the corpus_* functions of the four components and
+# corpus_code_bleu, which hold the whole corpus, and with their accumulators
+# fed one generated example at a time. The scores must be identical; wall time
+# and the tracemalloc peak of each pass are reported, the accumulator one stays
+# flat as --num_examples grows.
+#
+#   python bench_accumulator.py --num_examples 20000
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+import bleu
+import code_bleu
+import dataflow_match
+import syntax_match
+import weighted_ngram_match
+from bench_parse_cache import mutate, random_method
+from parse_cache import ParseCache
+
+
+def examples(seed, num_examples, num_refs, statements):
+    """(hypothesis, references) pairs of bench_parse_cache.random_corpus, generated one at a time."""
+    rng = random.Random(seed)
+    for _ in range(num_examples):
+        reference = random_method(rng, statements)
+        references = [reference] + [mutate(rng, reference, 0.05) for _ in range(num_refs - 1)]
+        yield mutate(rng, reference), references
+
+
+def components(hypothesis, references, lang):
+    keywords = code_bleu.load_keywords(lang)
+    tokenized_hyps = [code_bleu.tokenize(x) for x in hypothesis]
+    tokenized_refs = [[code_bleu.tokenize(x) for x in refs] for refs in references]
+    tokenized_refs_with_weights = [[[tokens, code_bleu.make_weights(tokens, keywords)] for tokens in refs]
+                                   for refs in tokenized_refs]
+    cache = ParseCache(lang)
+    return (bleu.corpus_bleu(tokenized_refs, tokenized_hyps),
+            weighted_ngram_match.corpus_bleu(tokenized_refs_with_weights, tokenized_hyps),
+            syntax_match.corpus_syntax_match(references, hypothesis, lang, cache),
+            dataflow_match.corpus_dataflow_match(references, hypothesis, lang, cache))
+
+
+def component_accumulators(pairs, lang):
+    keywords = code_bleu.load_keywords(lang)
+    accumulators = [bleu.BLEUAccumulator(), weighted_ngram_match.BLEUAccumulator(),
+                    syntax_match.SyntaxMatchAccumulator(lang), dataflow_match.DataflowMatchAccumulator(lang)]
+    for hypothesis, references in pairs:
+        tokenized_hyp = code_bleu.tokenize(hypothesis)
+        tokenized_refs = [code_bleu.tokenize(x) for x in references]
+        accumulators[0].add(tokenized_hyp, tokenized_refs)
+        accumulators[1].add(tokenized_hyp, [[tokens, code_bleu.make_weights(tokens, keywords)]
+                                            for tokens in tokenized_refs])
+        accumulators[2].add(hypothesis, references)
+        accumulators[3].add(hypothesis, references)
+    return tuple(x.result() for x in accumulators)
+
+
+def code_bleu_accumulator(pairs, lang):
+    accumulator = code_bleu.CodeBLEUAccumulator(lang)
+    for hypothesis, references in pairs:
+        accumulator.add(hypothesis, references)
+    return accumulator.result()
+
+
+def measure(function):
+    tracemalloc.start()
+    start = time.time()
+    result = function()
+    seconds = time.time() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, {'seconds': round(seconds, 3), 'peak_mb': round(peak / 2 ** 20, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lang', type=str, default='java')
+    parser.add_argument('--num_examples', type=int, default=2000)
+    parser.add_argument('--num_refs', type=int, default=1)
+    parser.add_argument('--statements', type=int, default=8, help='top level statements per method')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    stream = lambda: examples(args.seed, args.num_examples, args.num_refs, args.statements)
+
+    def in_memory():
+        pairs = list(stream())
+        hypothesis = [x[0] for x in pairs]
+        references = [x[1] for x in pairs]
+        return components(hypothesis, references, args.lang), \
+            code_bleu.corpus_code_bleu(references, hypothesis, args.lang)
+
+    # the keyword list is loaded once per process, keep it out of the first measurement
+    code_bleu.load_keywords(args.lang)
+    (expected_components, expected), corpus_report = measure(in_memory)
+    scores_components, components_report = measure(lambda: component_accumulators(stream(), args.lang))
+    scores, accumulator_report = measure(lambda: code_bleu_accumulator(stream(), args.lang))
+    if scores_components != expected_components:
+        raise AssertionError('accumulated component scores {} differ from the corpus ones {}'.format(
+            scores_components, expected_components))
+    if scores != expected:
+        raise AssertionError('accumulated CodeBLEU scores {} differ from corpus_code_bleu ones {}'.format(
+            scores, expected))
+    report = {'num_examples': args.num_examples, 'num_refs': args.num_refs,
+              'scores': dict(zip(['ngram_match', 'weighted_ngram_match', 'syntax_match', 'dataflow_match',
+                                  'code_bleu'], scores)),
+              'corpus': corpus_report, 'component_accumulators': components_report,
+              'code_bleu_accumulator': accumulator_report}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# Scaling benchmark of the multiprocess corpus CodeBLEU of code_bleu.py.
+#
+# Scores the same corpus serially and over pools of an increasing number of
+# workers, checks that every run returns exactly the serial scores and reports
+# throughput, speedup over the serial run and parallel efficiency.
+#
+#   python bench_code_bleu.py --num_examples 2000 --workers 1,2,4,8,16,32
+#   python bench_code_bleu.py --refs ref0.txt --hyp hyp.txt --lang java
+import argparse
+import json
+import multiprocessing
+import random
+import time
+
+import code_bleu
+from bench_parse_cache import random_corpus, read_corpus
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--refs', type=str, nargs='+', default=None,
+                        help='reference files, a synthetic Java corpus when not given')
+    parser.add_argument('--hyp', type=str, default=None, help='hypothesis file')
+    parser.add_argument('--lang', type=str, default='java')
+    parser.add_argument('--num_examples', type=int, default=2000)
+    parser.add_argument('--num_refs', type=int, default=1)
+    parser.add_argument('--statements', type=int, default=8, help='top level statements per method')
+    parser.add_argument('--chunk_size', type=int, default=64)
+    parser.add_argument('--workers', type=str, default=None,
+                        help='comma separated worker counts, powers of two up to the cpu count by default')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    if args.workers is None:
+        counts = [1]
+        while counts[-1] * 2 <= multiprocessing.cpu_count():
+            counts.append(counts[-1] * 2)
+        if counts[-1] != multiprocessing.cpu_count():
+            counts.append(multiprocessing.cpu_count())
+    else:
+        counts = [int(x) for x in args.workers.split(',')]
+    if args.refs:
+        references, hypothesis = read_corpus(args.refs, args.hyp)
+    else:
+        references, hypothesis = random_corpus(random.Random(args.seed), args.num_examples,
+                                               args.num_refs, args.statements)
+
+    start = time.time()
+    expected = code_bleu.corpus_code_bleu(references, hypothesis, args.lang)
+    serial_seconds = time.time() - start
+    report = {'num_examples': len(hypothesis), 'cpu_count': multiprocessing.cpu_count(),
+              'scores': dict(zip(['ngram_match', 'weighted_ngram_match', 'syntax_match', 'dataflow_match',
+                                  'code_bleu'], expected)),
+              'serial': {'seconds': round(serial_seconds, 3),
+                         'examples_per_second': round(len(hypothesis) / serial_seconds, 1)},
+              'workers': []}
+    for count in counts:
+        pool = multiprocessing.Pool(count)
+        try:
+            # the first chunks pay for loading the parsers, keep them out of the timing
+            code_bleu.corpus_code_bleu(references[:count], hypothesis[:count], args.lang, pool=pool, chunk_size=1)
+            start = time.time()
+            scores = code_bleu.corpus_code_bleu(references, hypothesis, args.lang, pool=pool,
+                                                chunk_size=args.chunk_size)
+            seconds = time.time() - start
+        finally:
+            pool.close()
+            pool.join()
+        if scores != expected:
+            raise AssertionError('scores of {} workers {} differ from the serial ones {}'.format(count, scores, expected))
+        report['workers'].append({'workers': count, 'seconds': round(seconds, 3),
+                                  'examples_per_second': round(len(hypothesis) / seconds, 1),
+                                  'speedup': round(serial_seconds / seconds, 2),
+                                  'efficiency': round(serial_seconds / seconds / count, 2)})
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
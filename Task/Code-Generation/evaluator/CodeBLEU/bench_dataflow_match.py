@@ -0,0 +1,121 @@
+# Equality check and benchmark of the interned data flow matching of dataflow_match.py.
+#
+# Every function of a test set is the reference of an example whose hypothesis
+# and second reference are mutated copies of it; the generated set has Java
+# files of --lines lines instead, where the legacy matching is quadratic in the
+# data flows of a file. The data flows are extracted once, then every example
+# is matched the way corpus_dataflow_match used to (normalize_dataflow, then
+# `in` and remove() over a copy of the candidate list for every reference) and
+# with get_dataflow_counts and match_dataflows (interned ids in Counters). The
+# (matched, total) of every example must be identical and corpus_dataflow_match
+# must give the legacy score; seconds of both matchings are reported.
+#
+#   python bench_dataflow_match.py
+#   python bench_dataflow_match.py --test_sets concode --num_examples 500
+#   python bench_dataflow_match.py --test_sets generated --lines 3000
+import argparse
+import json
+import random
+import time
+
+import dataflow_match
+from bench_parse_cache import mutate
+from bench_syntax_match import random_file
+from parse_cache import ParseCache
+
+# name: (file, lang, how to read it), relative to this directory
+TEST_SETS = {
+    'concode': ('../../dataset/concode/test.json', 'java', 'json'),
+    'translation_java': ('../../../Code-Translation/data/test.java-cs.txt.java', 'java', 'text'),
+    'translation_cs': ('../../../Code-Translation/data/test.java-cs.txt.cs', 'c_sharp', 'text'),
+}
+
+
+def read_test_set(name, num_examples):
+    path, lang, kind = TEST_SETS[name]
+    codes = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            codes.append(json.loads(line)['code'] if kind == 'json' else line.strip())
+            if len(codes) == num_examples:
+                break
+    return codes, lang
+
+
+def legacy_match(ref_dfgs, cand_dfg):
+    normalized_cand_dfg = dataflow_match.normalize_dataflow(cand_dfg)
+    match_count = 0
+    total_count = 0
+    for ref_dfg in ref_dfgs:
+        normalized_cand = list(normalized_cand_dfg)
+        normalized_ref_dfg = dataflow_match.normalize_dataflow(ref_dfg)
+        if len(normalized_ref_dfg) > 0:
+            total_count += len(normalized_ref_dfg)
+            for dataflow in normalized_ref_dfg:
+                if dataflow in normalized_cand:
+                    match_count += 1
+                    normalized_cand.remove(dataflow)
+    return match_count, total_count
+
+
+def interned_match(ref_dfgs, cand_dfg, intern):
+    return dataflow_match.match_dataflows([dataflow_match.get_dataflow_counts(x, intern) for x in ref_dfgs],
+                                          dataflow_match.get_dataflow_counts(cand_dfg, intern))
+
+
+def bench_corpus(name, codes, lang, rng, multiline=False):
+    references = [[code, mutate(rng, code, 0.05)] for code in codes]
+    hypothesis = [mutate(rng, code) for code in codes]
+    if multiline:
+        references = [[x.replace(' ; ', ' ;\n') for x in refs] for refs in references]
+        hypothesis = [x.replace(' ; ', ' ;\n') for x in hypothesis]
+    cache = ParseCache(lang)
+    parser = [cache.parser, dataflow_match.dfg_function[lang]]
+    data_flow = lambda code, tree: dataflow_match.get_data_flow(code, parser, tree)
+    examples = [([cache.derive(x, 'data_flow', data_flow) for x in refs], cache.derive(hyp, 'data_flow', data_flow))
+                for refs, hyp in zip(references, hypothesis)]
+
+    start = time.time()
+    legacy = [legacy_match(ref_dfgs, cand_dfg) for ref_dfgs, cand_dfg in examples]
+    legacy_seconds = time.time() - start
+    intern = ParseCache(lang).intern
+    start = time.time()
+    interned = [interned_match(ref_dfgs, cand_dfg, intern) for ref_dfgs, cand_dfg in examples]
+    interned_seconds = time.time() - start
+    for i, (x, y) in enumerate(zip(legacy, interned)):
+        if x != y:
+            raise AssertionError('{} example {}: interned match {} differs from the legacy one {}'.format(name, i, y, x))
+    score = dataflow_match.corpus_dataflow_match_from_stats(legacy)
+    corpus_score = dataflow_match.corpus_dataflow_match(references, hypothesis, lang)
+    if corpus_score != score:
+        raise AssertionError('{}: corpus_dataflow_match {} differs from the legacy score {}'.format(
+            name, corpus_score, score))
+    return {'lang': lang, 'num_examples': len(codes), 'dataflow_match': score,
+            'dataflows_per_example': round(sum(x[1] for x in legacy) / len(codes), 1),
+            'legacy_seconds': round(legacy_seconds, 3), 'interned_seconds': round(interned_seconds, 3),
+            'speedup': round(legacy_seconds / interned_seconds, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--test_sets', type=str, nargs='+', default=sorted(TEST_SETS) + ['generated'],
+                        choices=sorted(TEST_SETS) + ['generated'])
+    parser.add_argument('--num_examples', type=int, default=None, help='first examples of each test set, all by default')
+    parser.add_argument('--lines', type=int, default=1000, help='lines per generated file')
+    parser.add_argument('--num_generated', type=int, default=5, help='generated files')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    report = {}
+    for name in args.test_sets:
+        if name == 'generated':
+            codes = [random_file(rng, args.lines) for _ in range(args.num_generated)]
+            report[name] = bench_corpus(name, codes, 'java', rng, multiline=True)
+        else:
+            codes, lang = read_test_set(name, args.num_examples)
+            report[name] = bench_corpus(name, codes, lang, rng)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
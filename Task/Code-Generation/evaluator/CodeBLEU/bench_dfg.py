@@ -0,0 +1,138 @@
+# Equality check and stress benchmark of the explicit-stack data flow extractors of parser/DFG.py.
+#
+# Two generated inputs per language: one function of --lines lines assigning
+# between --variables live variables with an if/else every few lines, and one
+# of --depth nested if blocks. Both are run through the extractors of this copy
+# and through the recursive ones of an upstream copy (--baseline, the PLBART
+# one by default), which copy the states dict at every node and stop at the
+# interpreter's recursion limit. The DFGs must be identical wherever the
+# upstream ones finish; seconds and DFG edges of each are reported.
+#
+#   python bench_dfg.py --lines 5000 --depth 1000
+#   python bench_dfg.py --lang python --lines 5000 --depth 400
+import argparse
+import importlib.util
+import json
+import os
+import random
+import sys
+import time
+
+from tree_sitter import Language, Parser
+
+import parser as dfg_parser
+
+DFG_FUNCTIONS = {'java': 'DFG_java', 'python': 'DFG_python'}
+
+
+def load_baseline(baseline_dir):
+    spec = importlib.util.spec_from_file_location('baseline_parser', os.path.join(baseline_dir, '__init__.py'),
+                                                  submodule_search_locations=[baseline_dir])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['baseline_parser'] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def statement(rng, lang, variables, target=None):
+    target = target or rng.choice(variables)
+    left, right = rng.choice(variables), rng.choice(variables)
+    if lang == 'python':
+        return '{} = {} + {} * {}'.format(target, left, right, rng.randint(1, 9))
+    return '{} = {} + {} * {} ;'.format(target, left, right, rng.randint(1, 9))
+
+
+def long_function(rng, lang, lines, num_variables):
+    """One function of about lines lines over num_variables variables, an if/else every 8 lines."""
+    variables = ['v{}'.format(i) for i in range(num_variables)]
+    if lang == 'python':
+        code = ['def generated ( a ) :'] + ['    {} = a + {}'.format(x, i) for i, x in enumerate(variables)]
+    else:
+        code = ['int generated ( int a ) {'] + ['    int {} = a + {} ;'.format(x, i) for i, x in enumerate(variables)]
+    while len(code) < lines:
+        if len(code) % 8 == 0:
+            if lang == 'python':
+                code += ['    if {} > {} :'.format(rng.choice(variables), rng.choice(variables)),
+                         '        ' + statement(rng, lang, variables), '    else :',
+                         '        ' + statement(rng, lang, variables)]
+            else:
+                code += ['    if ( {} > {} ) {{'.format(rng.choice(variables), rng.choice(variables)),
+                         '        ' + statement(rng, lang, variables), '    } else {',
+                         '        ' + statement(rng, lang, variables), '    }']
+        else:
+            code.append('    ' + statement(rng, lang, variables))
+    code.append('    return v0' if lang == 'python' else '    return v0 ;\n}')
+    return '\n'.join(code)
+
+
+def nested_function(rng, lang, depth):
+    """One function of depth nested if blocks, each defining a variable from the enclosing ones."""
+    variables = ['a']
+    code = ['def generated ( a ) :' if lang == 'python' else 'int generated ( int a ) {']
+    for level in range(1, depth + 1):
+        indent = '    ' * level
+        code.append(indent + ('if {} > {} :' if lang == 'python' else 'if ( {} > {} ) {{').format(
+            rng.choice(variables), level))
+        variables.append('v{}'.format(level))
+        code.append(indent + '    ' + statement(rng, lang, variables, variables[-1]))
+    if lang != 'python':
+        code += ['    ' * level + '}' for level in range(depth, 0, -1)]
+        code.append('    return a ;\n}')
+    else:
+        code.append('    return a')
+    return '\n'.join(code)
+
+
+def extract(module, code, tree, lang):
+    """(DFG, seconds) with module's utils and extractor, the exception name if it failed."""
+    start = time.time()
+    try:
+        root_node = tree.root_node
+        tokens_index = module.tree_to_token_index(root_node)
+        code_lines = code.split('\n')
+        code_tokens = [module.index_to_code_token(x, code_lines) for x in tokens_index]
+        index_to_code = {index: (idx, token) for idx, (index, token) in enumerate(zip(tokens_index, code_tokens))}
+        DFG, _ = getattr(module, DFG_FUNCTIONS[lang])(root_node, index_to_code, {})
+    except Exception as e:
+        return type(e).__name__, time.time() - start
+    return DFG, time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lang', type=str, default='java', choices=sorted(DFG_FUNCTIONS))
+    parser.add_argument('--lines', type=int, default=5000, help='lines of the long function')
+    parser.add_argument('--variables', type=int, default=200, help='live variables of the long function')
+    parser.add_argument('--depth', type=int, default=1000, help='nesting depth of the nested function')
+    parser.add_argument('--baseline', type=str, default='../../../../PLBART/evaluation/CodeBLEU/parser',
+                        help='parser package with the recursive extractors')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    baseline = load_baseline(args.baseline)
+    tree_parser = Parser()
+    tree_parser.set_language(Language('parser/my-languages.so', args.lang))
+
+    report = {}
+    inputs = {'long': long_function(rng, args.lang, args.lines, args.variables),
+              'nested': nested_function(rng, args.lang, args.depth)}
+    for name, code in inputs.items():
+        tree = tree_parser.parse(bytes(code, 'utf8'))
+        DFG, seconds = extract(dfg_parser, code, tree, args.lang)
+        if isinstance(DFG, str):
+            raise AssertionError('{} input: the explicit-stack extractor failed with {}'.format(name, DFG))
+        baseline_DFG, baseline_seconds = extract(baseline, code, tree, args.lang)
+        entry = {'lines': code.count('\n') + 1, 'dfg_edges': len(DFG), 'seconds': round(seconds, 3)}
+        if isinstance(baseline_DFG, str):
+            entry['baseline'] = baseline_DFG
+        else:
+            if baseline_DFG != DFG:
+                raise AssertionError('{} input: the DFG differs from the baseline one'.format(name))
+            entry['baseline_seconds'] = round(baseline_seconds, 3)
+            entry['speedup'] = round(baseline_seconds / seconds, 2)
+        report[name] = entry
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
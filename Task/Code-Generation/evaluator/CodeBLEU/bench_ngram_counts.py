@@ -0,0 +1,92 @@
+# Equality check and benchmark of the packed integer ngram counting of ngram_counts.py.
+#
+# Every example is tokenized and weighted once, then its ngram and weighted
+# ngram match statistics are computed with the tuple Counters of
+# bleu.sentence_stats and weighted_ngram_match.sentence_stats and with
+# ngram_counts.sentence_stats. The corpus scores of both must agree to 1e-12
+# (they are expected to be identical); seconds per example of each counting
+# path, and of make_weights against the keyword list and the keyword set, are
+# reported for methods of each --statements size.
+#
+#   python bench_ngram_counts.py --num_examples 500 --statements 4,16,64
+#   python bench_ngram_counts.py --refs ref0.txt --hyp hyp.txt --lang java
+import argparse
+import json
+import random
+import time
+
+import bleu
+import code_bleu
+import ngram_counts
+import weighted_ngram_match
+from bench_parse_cache import random_corpus, read_corpus
+
+
+def compare(references, hypothesis, lang):
+    keyword_set = code_bleu.load_keywords(lang)
+    keyword_list = sorted(keyword_set)
+    tokenized_hyps = [code_bleu.tokenize(x) for x in hypothesis]
+    tokenized_refs = [[code_bleu.tokenize(x) for x in refs] for refs in references]
+
+    start = time.time()
+    for refs in tokenized_refs:
+        [code_bleu.make_weights(tokens, keyword_list) for tokens in refs]
+    list_seconds = time.time() - start
+    start = time.time()
+    reference_weights = [[code_bleu.make_weights(tokens, keyword_set) for tokens in refs] for refs in tokenized_refs]
+    set_seconds = time.time() - start
+
+    start = time.time()
+    tuple_stats = [(bleu.sentence_stats(refs, hyp),
+                    weighted_ngram_match.sentence_stats([[x, y] for x, y in zip(refs, weights)], hyp))
+                   for refs, hyp, weights in zip(tokenized_refs, tokenized_hyps, reference_weights)]
+    tuple_seconds = time.time() - start
+    start = time.time()
+    packed_stats = [ngram_counts.sentence_stats(refs, hyp, weights)
+                    for refs, hyp, weights in zip(tokenized_refs, tokenized_hyps, reference_weights)]
+    packed_seconds = time.time() - start
+
+    scores = []
+    for stats in [tuple_stats, packed_stats]:
+        scores.append((bleu.corpus_bleu_from_stats(x[0] for x in stats),
+                       weighted_ngram_match.corpus_bleu_from_stats(x[1] for x in stats)))
+    difference = max(abs(x - y) for x, y in zip(*scores))
+    if difference > 1e-12:
+        raise AssertionError('packed scores {} differ from the tuple ones {}'.format(scores[1], scores[0]))
+    count = len(hypothesis)
+    return {'num_examples': count,
+            'tokens_per_example': round(sum(len(x) for x in tokenized_hyps) / count, 1),
+            'ngram_match': scores[1][0], 'weighted_ngram_match': scores[1][1],
+            'identical': scores[0] == scores[1] and tuple_stats == packed_stats, 'max_difference': difference,
+            'tuple_ms_per_example': round(tuple_seconds / count * 1000, 3),
+            'packed_ms_per_example': round(packed_seconds / count * 1000, 3),
+            'speedup': round(tuple_seconds / packed_seconds, 2),
+            'make_weights_list_ms_per_example': round(list_seconds / count * 1000, 3),
+            'make_weights_set_ms_per_example': round(set_seconds / count * 1000, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--refs', type=str, nargs='+', default=None,
+                        help='reference files, synthetic Java corpora when not given')
+    parser.add_argument('--hyp', type=str, default=None, help='hypothesis file')
+    parser.add_argument('--lang', type=str, default='java')
+    parser.add_argument('--num_examples', type=int, default=500)
+    parser.add_argument('--num_refs', type=int, default=1)
+    parser.add_argument('--statements', type=str, default='4,16,64',
+                        help='comma separated top level statements per method, one corpus each')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    if args.refs:
+        report = [compare(*read_corpus(args.refs, args.hyp), lang=args.lang)]
+    else:
+        report = []
+        for statements in [int(x) for x in args.statements.split(',')]:
+            references, hypothesis = random_corpus(random.Random(args.seed), args.num_examples,
+                                                   args.num_refs, statements)
+            report.append(dict(compare(references, hypothesis, args.lang), statements=statements))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# Equality check and benchmark of the reference-precomputing CodeBLEUScorer of code_bleu.py.
+#
+# Simulates an evaluation loop that scores a new set of hypotheses against the
+# same references every epoch, once with corpus_code_bleu (references tokenized,
+# parsed and counted again each epoch) and once with a CodeBLEUScorer built
+# before the first epoch. The scores of every epoch must be identical; the
+# scorer setup time, seconds per epoch of each and the speedup are reported.
+#
+#   python bench_scorer.py --num_examples 1000 --epochs 5
+#   python bench_scorer.py --refs ref0.txt --hyp hyp.txt --lang java
+import argparse
+import json
+import random
+import time
+
+import code_bleu
+from bench_parse_cache import mutate, random_corpus, read_corpus
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--refs', type=str, nargs='+', default=None,
+                        help='reference files, a synthetic Java corpus when not given')
+    parser.add_argument('--hyp', type=str, default=None, help='hypothesis file, mutated again for every epoch')
+    parser.add_argument('--lang', type=str, default='java')
+    parser.add_argument('--num_examples', type=int, default=1000)
+    parser.add_argument('--num_refs', type=int, default=1)
+    parser.add_argument('--statements', type=int, default=8, help='top level statements per method')
+    parser.add_argument('--epochs', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    if args.refs:
+        references, hypothesis = read_corpus(args.refs, args.hyp)
+    else:
+        references, hypothesis = random_corpus(rng, args.num_examples, args.num_refs, args.statements)
+    epochs = [hypothesis] + [[mutate(rng, x, 0.05) for x in hypothesis] for _ in range(args.epochs - 1)]
+
+    start = time.time()
+    expected = [code_bleu.corpus_code_bleu(references, x, args.lang) for x in epochs]
+    corpus_seconds = time.time() - start
+
+    start = time.time()
+    scorer = code_bleu.CodeBLEUScorer(references, args.lang)
+    setup_seconds = time.time() - start
+    start = time.time()
+    scores = [scorer.score(x) for x in epochs]
+    scorer_seconds = time.time() - start
+
+    for epoch, (score, corpus_score) in enumerate(zip(scores, expected)):
+        if score != corpus_score:
+            raise AssertionError('scorer scores {} of epoch {} differ from the corpus_code_bleu ones {}'.format(
+                score, epoch, corpus_score))
+    report = {'num_examples': len(hypothesis), 'num_refs': len(references[0]), 'epochs': len(epochs),
+              'code_bleu': [x[4] for x in scores],
+              'corpus_code_bleu_seconds_per_epoch': round(corpus_seconds / len(epochs), 3),
+              'scorer_setup_seconds': round(setup_seconds, 3),
+              'scorer_seconds_per_epoch': round(scorer_seconds / len(epochs), 3),
+              'symbols': len(scorer.cache.symbols),
+              'speedup': round(corpus_seconds / (setup_seconds + scorer_seconds), 2),
+              'speedup_per_epoch': round(corpus_seconds / scorer_seconds, 2)}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
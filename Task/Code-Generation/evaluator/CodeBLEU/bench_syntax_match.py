@@ -0,0 +1,72 @@
+# Equality check and benchmark of the hashed subtree matching of syntax_match.py.
+#
+# Every sample is a generated Java file of about --lines lines scored against a
+# mutated copy of itself, once with legacy_syntax_match (sexp() strings looked up
+# in a list) and once with corpus_syntax_match (interned subtree ids looked up
+# in a Counter). The scores must be identical; seconds per sample, subtrees per
+# sample and the size of the sexp() strings the legacy pass builds are reported.
+#
+#   python bench_syntax_match.py --lines 1000 --num_examples 5
+import argparse
+import json
+import random
+import time
+
+import syntax_match
+from bench_parse_cache import legacy_syntax_match, mutate, random_method
+from parse_cache import ParseCache
+
+
+def random_file(rng, lines, statements=6):
+    """Java class of about lines lines, one statement or brace per line."""
+    methods = []
+    count = 0
+    while count < lines:
+        method = random_method(rng, statements)
+        for token in [' ; ', ' { ', ' } ']:
+            method = method.replace(token, token.rstrip() + '\n')
+        methods.append(method)
+        count += method.count('\n') + 1
+    return 'public class Generated {\n' + '\n'.join(methods) + '\n}\n'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lines', type=int, default=1000, help='lines per generated file')
+    parser.add_argument('--num_examples', type=int, default=5)
+    parser.add_argument('--lang', type=str, default='java')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    references = []
+    hypothesis = []
+    for _ in range(args.num_examples):
+        reference = random_file(rng, args.lines)
+        references.append([reference])
+        hypothesis.append(mutate(rng, reference).replace(' ; ', ' ;\n'))
+
+    report = {'num_examples': args.num_examples,
+              'lines': sum(x[0].count('\n') for x in references) / args.num_examples}
+    cache = ParseCache(args.lang)
+    start = time.time()
+    score = syntax_match.corpus_syntax_match(references, hypothesis, args.lang, cache)
+    hashed_seconds = time.time() - start
+    start = time.time()
+    legacy_score, _ = legacy_syntax_match(references, hypothesis, args.lang)
+    legacy_seconds = time.time() - start
+    if score != legacy_score:
+        raise AssertionError('hashed score {} differs from the legacy one {}'.format(score, legacy_score))
+
+    entry = cache.entry(references[0][0])
+    sexps = [x[0] for x in syntax_match.get_all_sub_trees(entry['tree'].root_node)]
+    report.update({'syntax_match': score,
+                   'subtrees_per_sample': len(sexps),
+                   'sexp_mb_per_sample': round(sum(len(x) for x in sexps) / 2 ** 20, 1),
+                   'legacy_seconds_per_sample': round(legacy_seconds / args.num_examples, 3),
+                   'hashed_seconds_per_sample': round(hashed_seconds / args.num_examples, 3),
+                   'speedup': round(legacy_seconds / hashed_seconds, 1)})
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,10 +3,12 @@
 
 from parser import DFG_python,DFG_java,DFG_ruby,DFG_go,DFG_php,DFG_javascript,DFG_csharp
 from parser import (remove_comments_and_docstrings,
-                   tree_to_token_index,
+                   tree_to_code_tokens,
                    index_to_code_token,
                    tree_to_variable_index)
+from collections import Counter
 from tree_sitter import Language, Parser
+from parse_cache import ParseCache
 import pdb
 
 dfg_function={
@@ -22,55 +24,98 @@ dfg_function={
 def calc_dataflow_match(references, candidate, lang):
     return corpus_dataflow_match([references], [candidate], lang)
 
-def corpus_dataflow_match(references, candidates, lang):   
-    LANGUAGE = Language('parser/my-languages.so', lang)
-    parser = Parser()
-    parser.set_language(LANGUAGE)
-    parser = [parser,dfg_function[lang]]
+def get_dataflow_counts(dataflow, intern):
+    """Counter of the normalize_dataflow items of dataflow, by intern(item) instead of the item.
+
+    One dict per function numbers the variables in the order normalize_dataflow
+    names them var_0, var_1..., so two ids are equal exactly when the
+    normalized items are.
+    """
+    var_ids = {}
+    items = []
+    for item in dataflow:
+        # setdefault numbers a new name len(var_ids), parents before the variable like normalize_dataflow
+        par_ids = tuple([var_ids.setdefault(name, len(var_ids)) for name in item[3]])
+        items.append(intern((var_ids.setdefault(item[0], len(var_ids)), item[2], par_ids)))
+    return Counter(items)
+
+def match_dataflows(ref_dataflows_list, cand_dataflows):
+    """(matched, total) data flows of the references' get_dataflow_counts against the candidate's."""
     match_count = 0
     total_count = 0
+    for ref_dataflows in ref_dataflows_list:
+        # every reference consumes the matches from a fresh copy of the candidate flows: the size of the
+        # Counter intersection ref_dataflows & cand_dataflows, summed without building it
+        for dataflow, count in ref_dataflows.items():
+            if dataflow in cand_dataflows:
+                match_count += min(count, cand_dataflows[dataflow])
+        total_count += sum(ref_dataflows.values())
+    return match_count, total_count
 
-    for i in range(len(candidates)):
-        references_sample = references[i]
-        candidate = candidates[i] 
-        for reference in references_sample:
-            try:
-                candidate=remove_comments_and_docstrings(candidate,'java')
-            except:
-                pass    
-            try:
-                reference=remove_comments_and_docstrings(reference,'java')
-            except:
-                pass  
-
-            cand_dfg = get_data_flow(candidate, parser)
-            ref_dfg = get_data_flow(reference, parser)
-            
-            normalized_cand_dfg = normalize_dataflow(cand_dfg)
-            normalized_ref_dfg = normalize_dataflow(ref_dfg)
-
-            if len(normalized_ref_dfg) > 0:
-                total_count += len(normalized_ref_dfg)
-                for dataflow in normalized_ref_dfg:
-                    if dataflow in normalized_cand_dfg:
-                            match_count += 1
-                            normalized_cand_dfg.remove(dataflow)  
+def dataflow_match_stats(references, candidate, lang, cache):
+    """(matched, total) data flows of the references of one candidate, what corpus_dataflow_match adds up."""
+    parser = [cache.parser,dfg_function[lang]]
+    dataflows = lambda code, tree: get_dataflow_counts(get_data_flow(code, parser, tree), cache.intern)
+    cand_dataflows = cache.derive(candidate, 'dataflows', dataflows)
+    return match_dataflows([cache.derive(reference, 'dataflows', dataflows) for reference in references],
+                           cand_dataflows)
+
+def corpus_dataflow_match_from_stats(stats):
+    match_count = 0
+    total_count = 0
+    for matches, total in stats:
+        match_count += matches
+        total_count += total
     if total_count == 0:
         print("WARNING: There is no reference data-flows extracted from the whole corpus, and the data-flow match score degenerates to 0. Please consider ignoring this score.")
         return 0
     score = match_count / total_count
     return score
 
-def get_data_flow(code, parser):
+class DataflowMatchAccumulator(object):
+    """corpus_dataflow_match of a corpus seen one candidate at a time, in memory that does not grow with it."""
+    def __init__(self, lang, cache=None):
+        self.lang = lang
+        self.cache = cache
+        self.match_count = 0
+        self.total_count = 0
+
+    def add(self, candidate, references):
+        if self.cache is None:
+            self.cache = ParseCache(self.lang)
+        self.add_stats(dataflow_match_stats(references, candidate, self.lang, self.cache))
+        self.cache.clear()
+
+    def add_stats(self, stats):
+        matches, total = stats
+        self.match_count += matches
+        self.total_count += total
+
+    def stats(self):
+        return self.match_count, self.total_count
+
+    def result(self):
+        return corpus_dataflow_match_from_stats([self.stats()])
+
+def corpus_dataflow_match(references, candidates, lang, cache=None):   
+    if cache is None:
+        cache = ParseCache(lang)
+    return corpus_dataflow_match_from_stats(dataflow_match_stats(references[i], candidates[i], lang, cache)
+                                            for i in range(len(candidates)))
+
+def get_data_flow(code, parser, tree=None):
     try:
-        tree = parser[0].parse(bytes(code,'utf8'))    
+        code_bytes=bytes(code,'utf8')
+        if tree is None:
+            tree = parser[0].parse(code_bytes)    
         root_node = tree.root_node  
-        tokens_index=tree_to_token_index(root_node)     
-        code=code.split('\n')
-        code_tokens=[index_to_code_token(x,code) for x in tokens_index]  
-        index_to_code={}
-        for idx,(index,code) in enumerate(zip(tokens_index,code_tokens)):
-            index_to_code[index]=(idx,code)  
+        code_tokens,_,index_to_code=tree_to_code_tokens(root_node,code_bytes)
+        # the token text of upstream CodeBLEU, which the scores depend on: the str
+        # lines sliced by the byte columns of the tree, off on non-ASCII code
+        code_lines=code.split('\n')
+        for index,(idx,_) in index_to_code.items():
+            code_tokens[idx]=index_to_code_token(index,code_lines)
+            index_to_code[index]=(idx,code_tokens[idx])
         try:
             DFG,_=parser[1](root_node,index_to_code,{}) 
         except:
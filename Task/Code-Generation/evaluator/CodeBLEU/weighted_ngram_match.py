@@ -146,28 +146,148 @@ def corpus_bleu(
     """
     # Before proceeding to compute BLEU, perform sanity checks.
 
-    p_numerators = Counter()  # Key = ngram order, and value = no. of ngram matches.
-    p_denominators = Counter()  # Key = ngram order, and value = no. of ngram in ref.
-    hyp_lengths, ref_lengths = 0, 0
-
     assert len(list_of_references) == len(hypotheses), (
         "The number of hypotheses and their reference(s) should be the " "same "
     )
 
     # Iterate through each hypothesis and their corresponding references.
+    # The last pair is passed on for the smoothing methods that read it.
+    stats = []
+    references = hypothesis = None
     for references, hypothesis in zip(list_of_references, hypotheses):
-        # For each order of ngram, calculate the numerator and
-        # denominator for the corpus-level modified precision.
-        for i, _ in enumerate(weights, start=1):
-            p_i_numeraotr, p_i_denominator = modified_recall(references, hypothesis, i)
-            p_numerators[i] += p_i_numeraotr
-            p_denominators[i] += p_i_denominator
+        stats.append(sentence_stats(references, hypothesis, weights))
+    return corpus_bleu_from_stats(
+        stats, weights, smoothing_function, auto_reweigh, references, hypothesis
+    )
+
+
+def sentence_stats(references, hypothesis, weights=(0.25, 0.25, 0.25, 0.25)):
+    """
+    The statistics corpus_bleu adds up over the corpus for one hypothesis: the
+    numerator and denominator of the modified recall of each ngram order, the
+    hypothesis length and the closest reference length.
+
+    :param references: reference sentences
+    :type references: list(list(str))
+    :param hypothesis: a hypothesis sentence
+    :type hypothesis: list(str)
+    :param weights: weights for unigrams, bigrams, trigrams and so on
+    :type weights: list(float)
+    :return: (numerators, denominators, hyp_len, closest_ref_len)
+    :rtype: tuple(list(float), list(float), int, int)
+    """
+    numerators, denominators = [], []
+    # For each order of ngram, calculate the numerator and
+    # denominator for the corpus-level modified recall.
+    for i, _ in enumerate(weights, start=1):
+        p_i_numeraotr, p_i_denominator = modified_recall(references, hypothesis, i)
+        numerators.append(p_i_numeraotr)
+        denominators.append(p_i_denominator)
+    hyp_len = len(hypothesis)
+    return numerators, denominators, hyp_len, closest_ref_length(references, hyp_len)
+
+
+def reference_stats(references, weights=(0.25, 0.25, 0.25, 0.25)):
+    """
+    What sentence_stats reads from the references of one hypothesis, for
+    scoring many hypotheses against the same references with hypothesis_stats:
+    for each ngram order and reference its (ngram, count, keyword weight) items
+    and recall denominator, and the reference lengths.
+
+    :param references: [reference tokens, keyword weights] pairs
+    :type references: list(list(list(str), dict))
+    :param weights: weights for unigrams, bigrams, trigrams and so on
+    :type weights: list(float)
+    :rtype: tuple(list(list(tuple)), list(int))
+    """
+    orders = []
+    for n, _ in enumerate(weights, start=1):
+        order = []
+        for reference, reference_weights in references:
+            reference_counts = (
+                Counter(ngrams(reference, n)) if len(reference) >= n else Counter()
+            )
+            # the same products and sums modified_recall takes, in the same order
+            if n == 1 and len(reference_weights) == len(reference_counts):
+                items = [(ngram, count, reference_weights[ngram[0]] if ngram[0] in reference_weights else 1)
+                         for ngram, count in reference_counts.items()]
+                denominator = 0
+                for ngram, count, weight in items:
+                    denominator += count * weight
+                order.append((True, items, max(1, denominator)))
+            else:
+                items = [(ngram, count, 1) for ngram, count in reference_counts.items()]
+                order.append((False, items, max(1, sum(reference_counts.values()))))
+        orders.append(order)
+    # closest_ref_length has always measured the [tokens, weights] pairs
+    return orders, [len(reference) for reference in references]
+
+
+def hypothesis_stats(ref_stats, hypothesis, weights=(0.25, 0.25, 0.25, 0.25)):
+    """
+    sentence_stats of hypothesis against the references ref_stats was computed
+    from with reference_stats, bit for bit.
+    """
+    orders, ref_lens = ref_stats
+    numerators, denominators = [], []
+    for n, _ in enumerate(weights, start=1):
+        counts = Counter(ngrams(hypothesis, n)) if len(hypothesis) >= n else Counter()
+        numerator = 0
+        denominator = 0
+        for weighted, items, reference_denominator in orders[n - 1]:
+            if weighted:
+                sum_counts = 0
+                for ngram, count, weight in items:
+                    sum_counts += min(count, counts[ngram]) * weight
+                numerator += sum_counts
+            else:
+                numerator += sum(min(count, counts[ngram]) for ngram, count, _ in items)
+            denominator += reference_denominator
+        numerators.append(numerator)
+        denominators.append(denominator)
+    hyp_len = len(hypothesis)
+    closest_ref_len = min(
+        ref_lens, key=lambda ref_len: (abs(ref_len - hyp_len), ref_len)
+    )
+    return numerators, denominators, hyp_len, closest_ref_len
+
 
-        # Calculate the hypothesis length and the closest reference length.
-        # Adds them to the corpus-level hypothesis and reference counts.
-        hyp_len = len(hypothesis)
+def corpus_bleu_from_stats(
+    stats,
+    weights=(0.25, 0.25, 0.25, 0.25),
+    smoothing_function=None,
+    auto_reweigh=False,
+    references=None,
+    hypothesis=None,
+):
+    """
+    corpus_bleu from the sentence_stats of every hypothesis of the corpus.
+
+    The weighted numerators are floats, so the order they are added up in
+    matters: they are summed in the order given, and scoring a corpus in
+    shards and passing the statistics in corpus order gives the same score
+    as corpus_bleu, bit for bit.
+
+    :param stats: sentence_stats of each hypothesis, in corpus order
+    :type stats: iter(tuple)
+    :param references: the references of the last hypothesis, read by
+        smoothing methods 4 to 7 only
+    :type references: list(list(str))
+    :param hypothesis: the last hypothesis, read by smoothing methods 4 to 7 only
+    :type hypothesis: list(str)
+    :return: The corpus-level BLEU score.
+    :rtype: float
+    """
+    p_numerators = Counter()  # Key = ngram order, and value = no. of ngram matches.
+    p_denominators = Counter()  # Key = ngram order, and value = no. of ngram in ref.
+    hyp_lengths, ref_lengths = 0, 0
+
+    for numerators, denominators, hyp_len, ref_len in stats:
+        for i, _ in enumerate(weights, start=1):
+            p_numerators[i] += numerators[i - 1]
+            p_denominators[i] += denominators[i - 1]
         hyp_lengths += hyp_len
-        ref_lengths += closest_ref_length(references, hyp_len)
+        ref_lengths += ref_len
 
     # Calculate corpus-level brevity penalty.
     bp = brevity_penalty(ref_lengths, hyp_lengths)
@@ -206,6 +326,73 @@ def corpus_bleu(
     return s
 
 
+class BLEUAccumulator(object):
+    """
+    corpus_bleu of a corpus seen one hypothesis at a time, references given
+    as [tokens, keyword weights] pairs. Only the summed sentence_stats and
+    the last pair (for smoothing methods 4 to 7) are kept, so memory does
+    not grow with the corpus.
+
+        >>> accumulator = BLEUAccumulator()
+        >>> for hypothesis, references in zip(hypotheses, list_of_references):
+        ...     accumulator.add(hypothesis, references)
+        >>> score = accumulator.result()
+
+    :param weights: weights for unigrams, bigrams, trigrams and so on
+    :type weights: list(float)
+    :param smoothing_function:
+    :type smoothing_function: SmoothingFunction
+    :param auto_reweigh: Option to re-normalize the weights uniformly.
+    :type auto_reweigh: bool
+    """
+
+    def __init__(
+        self,
+        weights=(0.25, 0.25, 0.25, 0.25),
+        smoothing_function=None,
+        auto_reweigh=False,
+    ):
+        self.weights = weights
+        self.smoothing_function = smoothing_function
+        self.auto_reweigh = auto_reweigh
+        self.numerators = [0] * len(weights)
+        self.denominators = [0] * len(weights)
+        self.hyp_len = 0
+        self.ref_len = 0
+        self.references = self.hypothesis = None
+
+    def add(self, hypothesis, references):
+        self.add_stats(sentence_stats(references, hypothesis, self.weights))
+        self.references, self.hypothesis = references, hypothesis
+
+    def add_stats(self, stats):
+        """
+        Add the sentence_stats of one hypothesis. The float numerators are
+        summed in the order they are added, so add them in corpus order for
+        the score of corpus_bleu, bit for bit.
+        """
+        numerators, denominators, hyp_len, ref_len = stats
+        for i, _ in enumerate(self.weights):
+            self.numerators[i] += numerators[i]
+            self.denominators[i] += denominators[i]
+        self.hyp_len += hyp_len
+        self.ref_len += ref_len
+
+    def stats(self):
+        """The sentence_stats of everything added, summed."""
+        return self.numerators, self.denominators, self.hyp_len, self.ref_len
+
+    def result(self):
+        return corpus_bleu_from_stats(
+            [self.stats()],
+            self.weights,
+            self.smoothing_function,
+            self.auto_reweigh,
+            self.references,
+            self.hypothesis,
+        )
+
+
 def modified_recall(references, hypothesis, n):
     """
     Calculate modified ngram recall.
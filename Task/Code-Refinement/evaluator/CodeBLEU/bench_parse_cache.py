@@ -0,0 +1,206 @@
+# Equality check and benchmark of the parse-once cache of the structural metrics.
+#
+# legacy_syntax_match and legacy_dataflow_match are corpus_syntax_match and
+# corpus_dataflow_match as they were before parse_cache.py: each builds its own
+# parser, strips the comments of both sides for every reference and parses them
+# again. Both versions score the same corpus, the scores must be identical, and
+# wall time and tree-sitter parse counts of each are reported.
+#
+#   python bench_parse_cache.py --num_examples 500 --num_refs 2
+#   python bench_parse_cache.py --refs ref0.txt ref1.txt --hyp hyp.txt --lang java
+import argparse
+import json
+import random
+import time
+
+from tree_sitter import Language, Parser
+
+import dataflow_match
+import syntax_match
+from parse_cache import ParseCache
+from parser import remove_comments_and_docstrings
+
+TYPES = ['int', 'long', 'double', 'String', 'boolean']
+NAMES = ['i', 'j', 'n', 'sum', 'count', 'total', 'value', 'result', 'index', 'size', 'tmp', 'acc']
+OPS = ['+', '-', '*', '/', '%']
+CALLS = ['Math.max', 'Math.min', 'Math.abs', 'compute', 'helper']
+
+
+def random_expression(rng, names, depth=0):
+    if depth > 1 or rng.random() < 0.4:
+        return rng.choice(names) if rng.random() < 0.7 else str(rng.randint(0, 100))
+    if rng.random() < 0.2:
+        return '{} ( {} , {} )'.format(rng.choice(CALLS), random_expression(rng, names, depth + 1),
+                                       random_expression(rng, names, depth + 1))
+    return '{} {} {}'.format(random_expression(rng, names, depth + 1), rng.choice(OPS),
+                             random_expression(rng, names, depth + 1))
+
+
+def random_statements(rng, names, count, depth=0):
+    statements = []
+    for _ in range(count):
+        kind = rng.random()
+        if depth < 2 and kind < 0.15:
+            statements.append('for ( int {0} = 0 ; {0} < {1} ; {0} ++ ) {{ {2} }}'.format(
+                rng.choice(['i', 'j', 'k']), rng.choice(names),
+                ' '.join(random_statements(rng, names, rng.randint(1, 3), depth + 1))))
+        elif depth < 2 and kind < 0.3:
+            statements.append('if ( {} > {} ) {{ {} }} else {{ {} }}'.format(
+                rng.choice(names), random_expression(rng, names),
+                ' '.join(random_statements(rng, names, rng.randint(1, 2), depth + 1)),
+                ' '.join(random_statements(rng, names, 1, depth + 1))))
+        elif kind < 0.4:
+            statements.append('/* {} */'.format(rng.choice(['update', 'fix me', 'note : keep'])))
+        elif kind < 0.55:
+            name = rng.choice(NAMES)
+            names.append(name)
+            statements.append('{} {} = {} ;'.format(rng.choice(TYPES), name, random_expression(rng, names)))
+        else:
+            statements.append('{} = {} ;'.format(rng.choice(names), random_expression(rng, names)))
+    return statements
+
+
+def random_method(rng, statements):
+    """One line Java method of about statements top level statements."""
+    names = ['a', 'b']
+    body = random_statements(rng, names, statements)
+    return 'public int {} ( int a , int b ) {{ {} return {} ; }}'.format(
+        rng.choice(['run', 'solve', 'apply', 'merge']), ' '.join(body), rng.choice(names))
+
+
+def mutate(rng, code, rate=0.1):
+    """A hypothesis close to code: tokens replaced by identifiers or dropped at rate."""
+    tokens = []
+    for token in code.split():
+        x = rng.random()
+        if x < rate / 2:
+            tokens.append(rng.choice(NAMES))
+        elif x >= rate:
+            tokens.append(token)
+    return ' '.join(tokens)
+
+
+def random_corpus(rng, num_examples, num_refs, statements):
+    references = []
+    hypothesis = []
+    for _ in range(num_examples):
+        reference = random_method(rng, statements)
+        references.append([reference] + [mutate(rng, reference, 0.05) for _ in range(num_refs - 1)])
+        hypothesis.append(mutate(rng, reference))
+    return references, hypothesis
+
+
+def read_corpus(ref_files, hyp_file):
+    pre_references = [[x.strip() for x in open(file, 'r', encoding='utf-8').readlines()] for file in ref_files]
+    hypothesis = [x.strip() for x in open(hyp_file, 'r', encoding='utf-8').readlines()]
+    references = [[refs[i] for refs in pre_references] for i in range(len(hypothesis))]
+    return references, hypothesis
+
+
+class CountingParser(object):
+    def __init__(self, lang):
+        self.parser = Parser()
+        self.parser.set_language(Language('parser/my-languages.so', lang))
+        self.parses = 0
+
+    def parse(self, source):
+        self.parses += 1
+        return self.parser.parse(source)
+
+
+def legacy_syntax_match(references, candidates, lang):
+    parser = CountingParser(lang)
+    match_count = 0
+    total_count = 0
+    for i in range(len(candidates)):
+        candidate = candidates[i]
+        for reference in references[i]:
+            try:
+                candidate = remove_comments_and_docstrings(candidate, 'java')
+            except:
+                pass
+            try:
+                reference = remove_comments_and_docstrings(reference, 'java')
+            except:
+                pass
+            candidate_tree = parser.parse(bytes(candidate, 'utf8')).root_node
+            reference_tree = parser.parse(bytes(reference, 'utf8')).root_node
+            cand_sexps = [x[0] for x in syntax_match.get_all_sub_trees(candidate_tree)]
+            ref_sexps = syntax_match.get_all_sub_trees(reference_tree)
+            for sub_tree, depth in ref_sexps:
+                if sub_tree in cand_sexps:
+                    match_count += 1
+            total_count += len(ref_sexps)
+    return match_count / total_count, parser.parses
+
+
+def legacy_dataflow_match(references, candidates, lang):
+    parser = CountingParser(lang)
+    dfg_parser = [parser, dataflow_match.dfg_function[lang]]
+    match_count = 0
+    total_count = 0
+    for i in range(len(candidates)):
+        candidate = candidates[i]
+        for reference in references[i]:
+            try:
+                candidate = remove_comments_and_docstrings(candidate, 'java')
+            except:
+                pass
+            try:
+                reference = remove_comments_and_docstrings(reference, 'java')
+            except:
+                pass
+            normalized_cand_dfg = dataflow_match.normalize_dataflow(dataflow_match.get_data_flow(candidate, dfg_parser))
+            normalized_ref_dfg = dataflow_match.normalize_dataflow(dataflow_match.get_data_flow(reference, dfg_parser))
+            if len(normalized_ref_dfg) > 0:
+                total_count += len(normalized_ref_dfg)
+                for dataflow in normalized_ref_dfg:
+                    if dataflow in normalized_cand_dfg:
+                        match_count += 1
+                        normalized_cand_dfg.remove(dataflow)
+    if total_count == 0:
+        return 0, parser.parses
+    return match_count / total_count, parser.parses
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--refs', type=str, nargs='+', default=None,
+                        help='reference files, a synthetic Java corpus when not given')
+    parser.add_argument('--hyp', type=str, default=None, help='hypothesis file')
+    parser.add_argument('--lang', type=str, default='java')
+    parser.add_argument('--num_examples', type=int, default=500)
+    parser.add_argument('--num_refs', type=int, default=2)
+    parser.add_argument('--statements', type=int, default=8, help='top level statements per method')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    if args.refs:
+        references, hypothesis = read_corpus(args.refs, args.hyp)
+    else:
+        references, hypothesis = random_corpus(random.Random(args.seed), args.num_examples,
+                                               args.num_refs, args.statements)
+
+    start = time.time()
+    legacy_syntax, syntax_parses = legacy_syntax_match(references, hypothesis, args.lang)
+    legacy_dataflow, dataflow_parses = legacy_dataflow_match(references, hypothesis, args.lang)
+    legacy_seconds = time.time() - start
+
+    start = time.time()
+    cache = ParseCache(args.lang)
+    syntax = syntax_match.corpus_syntax_match(references, hypothesis, args.lang, cache)
+    dataflow = dataflow_match.corpus_dataflow_match(references, hypothesis, args.lang, cache)
+    cached_seconds = time.time() - start
+
+    if (syntax, dataflow) != (legacy_syntax, legacy_dataflow):
+        raise AssertionError('cached scores {} differ from the legacy ones {}'.format(
+            (syntax, dataflow), (legacy_syntax, legacy_dataflow)))
+    report = {'num_examples': len(hypothesis), 'num_refs': len(references[0]),
+              'syntax_match': syntax, 'dataflow_match': dataflow,
+              'legacy': {'seconds': round(legacy_seconds, 3), 'parses': syntax_parses + dataflow_parses},
+              'cached': dict(cache.stats(), seconds=round(cached_seconds, 3)),
+              'speedup': round(legacy_seconds / cached_seconds, 2)}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
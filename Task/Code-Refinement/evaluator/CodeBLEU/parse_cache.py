@@ -0,0 +1,68 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+# Parse-once cache shared by the CodeBLEU components.
+#
+# corpus_syntax_match and corpus_dataflow_match used to build a Parser each,
+# strip the comments of the candidate again for every reference of a sample and
+# parse every reference and candidate once per metric and per pair. A ParseCache
+# strips and parses each distinct code string once per run and memoizes what the
+# metrics derive from its tree (the subtree counts, the data flow), so
+# scoring a corpus parses every distinct hypothesis and reference exactly once.
+from parser import remove_comments_and_docstrings
+from tree_sitter import Language, Parser
+
+
+class ParseCache(object):
+    def __init__(self, lang, language_file='parser/my-languages.so'):
+        self.lang = lang
+        self.parser = Parser()
+        self.parser.set_language(Language(language_file, lang))
+        self.entries = {}
+        # structure -> int table, ids are only comparable within one cache
+        self.symbols = {}
+        self.parses = 0
+        self.lookups = 0
+
+    def entry(self, code):
+        """{'code': comment stripped code, 'tree': its tree, derived values...} of code."""
+        self.lookups += 1
+        entry = self.entries.get(code)
+        if entry is None:
+            # the metrics have always stripped comments the java way, whatever lang is
+            try:
+                stripped = remove_comments_and_docstrings(code, 'java')
+            except:
+                stripped = code
+            entry = {'code': stripped, 'tree': self.parser.parse(bytes(stripped, 'utf8'))}
+            self.parses += 1
+            self.entries[code] = entry
+        return entry
+
+    def derive(self, code, name, build):
+        """build(stripped code, tree) for code, computed on the first call per name."""
+        entry = self.entry(code)
+        if name not in entry:
+            entry[name] = build(entry['code'], entry['tree'])
+        return entry[name]
+
+    def clear(self, symbols=True):
+        """Forget every code, and the interned ids unless symbols is False; the parser is kept."""
+        self.entries.clear()
+        if symbols:
+            self.symbols.clear()
+
+    def lookup(self, key):
+        """intern(key) if key was interned, -1 otherwise; the table does not grow."""
+        return self.symbols.get(key, -1)
+
+    def intern(self, key):
+        """Small int standing for the hashable key, the same for equal keys."""
+        symbol = self.symbols.get(key)
+        if symbol is None:
+            symbol = self.symbols[key] = len(self.symbols)
+        return symbol
+
+    def stats(self):
+        return {'codes': len(self.entries), 'parses': self.parses, 'lookups': self.lookups,
+                'symbols': len(self.symbols)}
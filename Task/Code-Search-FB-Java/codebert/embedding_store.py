@@ -0,0 +1,74 @@
+# Reduced-precision storage of the code and query vectors of evaluate.
+#
+# evaluate kept every batch of vectors as float32 and concatenated them, 3 kB
+# per CodeBERT vector. An EmbeddingStore keeps them as float16 (half the
+# memory) or as int8 with a float32 scale per row, x ~ scale * round(x /
+# scale) with scale = max|x| / 127 (a quarter of the memory, plus 4 bytes a
+# row), quantized batch by batch as they are appended. score dequantizes
+# code_block_size codes at a time to float32 for the matmul, so no float32
+# copy of the whole matrix is ever made; a float32 store is scored with the
+# same np.matmul as a plain array, and gives the same scores.
+import numpy as np
+
+DTYPES = ('float32', 'float16', 'int8')
+
+
+class EmbeddingStore(object):
+    """Rows of vectors appended batch by batch and kept as float32, float16 or int8 with per-row scales."""
+    def __init__(self, dtype='float32', code_block_size=4096):
+        if dtype not in DTYPES:
+            raise ValueError("dtype {} is not one of {}".format(dtype,DTYPES))
+        self.dtype=dtype
+        self.code_block_size=code_block_size
+        self.batches=[]
+        self.scale_batches=[]
+        self._vecs=None
+        self._scales=None
+
+    def append(self, vecs):
+        vecs=np.asarray(vecs,dtype=np.float32)
+        if self.dtype=='int8':
+            scales=np.abs(vecs).max(-1)/127
+            # an all-zero row stays zero with any scale
+            scales[scales==0]=1
+            self.scale_batches.append(scales)
+            vecs=np.round(vecs/scales[:,None]).astype(np.int8)
+        elif self.dtype=='float16':
+            vecs=vecs.astype(np.float16)
+        self.batches.append(vecs)
+        self._vecs=None
+
+    @property
+    def vecs(self):
+        """The stored rows, float32, float16 or int8."""
+        if self._vecs is None:
+            self._vecs=np.concatenate(self.batches,0)
+            self.batches=[self._vecs]
+            if self.dtype=='int8':
+                self._scales=np.concatenate(self.scale_batches,0)
+                self.scale_batches=[self._scales]
+        return self._vecs
+
+    @property
+    def nbytes(self):
+        return self.vecs.nbytes+(self._scales.nbytes if self.dtype=='int8' else 0)
+
+    def __len__(self):
+        return sum(len(x) for x in self.batches)
+
+    def __getitem__(self, rows):
+        """The rows as float32."""
+        vecs=self.vecs[rows]
+        if self.dtype=='int8':
+            return np.multiply(vecs,self._scales[rows,None],dtype=np.float32)
+        return vecs.astype(np.float32,copy=False)
+
+    def score(self, queries):
+        """queries x rows float32 dot products of the float32 queries with every row."""
+        if self.dtype=='float32':
+            return np.matmul(queries,self.vecs.T)
+        scores=np.empty((len(queries),len(self)),dtype=np.float32)
+        for start in range(0,len(self),self.code_block_size):
+            end=start+self.code_block_size
+            np.matmul(queries,self[start:end].T,out=scores[:,start:end])
+        return scores
@@ -19,10 +19,13 @@ class Model(nn.Module):
         self.args=args
     
         
+    def encode(self, inputs):
+        return self.encoder(inputs,attention_mask=inputs.ne(1))[1]
+        
     def forward(self, code_inputs,nl_inputs,return_vec=False): 
         bs=code_inputs.shape[0]
         inputs=torch.cat((code_inputs,nl_inputs),0)
-        outputs=self.encoder(inputs,attention_mask=inputs.ne(1))[1]
+        outputs=self.encode(inputs)
         code_vec=outputs[:bs]
         nl_vec=outputs[bs:]
         
@@ -42,7 +42,9 @@ except:
 
 from tqdm import tqdm, trange
 import multiprocessing
+from embedding_store import DTYPES, EmbeddingStore
 from model import Model
+from ranking import mrr_ranks, write_predictions
 cpu_cont = multiprocessing.cpu_count()
 from transformers import (WEIGHTS_NAME, AdamW, get_linear_schedule_with_warmup,
                           BertConfig, BertForMaskedLM, BertTokenizer,
@@ -370,8 +372,9 @@ def evaluate(args, model, tokenizer,eval_when_training=False, eval_file=None, st
     eval_loss = 0.0
     nb_eval_steps = 0
     model.eval()
-    code_vecs=[] 
-    nl_vecs=[]
+    # kept as args.embedding_dtype, quantized batch by batch
+    code_vecs=EmbeddingStore(args.embedding_dtype)
+    nl_vecs=EmbeddingStore(args.embedding_dtype)
     for batch in eval_dataloader:
         code_inputs = batch[0].to(args.device)    
         nl_inputs = batch[1].to(args.device)
@@ -381,36 +384,21 @@ def evaluate(args, model, tokenizer,eval_when_training=False, eval_file=None, st
             code_vecs.append(code_vec.cpu().numpy())
             nl_vecs.append(nl_vec.cpu().numpy())
         nb_eval_steps += 1
-    code_vecs=np.concatenate(code_vecs,0)
-    nl_vecs=np.concatenate(nl_vecs,0)
     eval_loss = eval_loss / nb_eval_steps
     perplexity = torch.tensor(eval_loss)
 
-    scores=np.matmul(nl_vecs,code_vecs.T)
-    ranks=[]
-    for i in range(len(scores)):
-        score=scores[i,i]
-        rank=1
-        for j in range(len(scores)):
-            if i!=j and scores[i,j]>=score:
-                rank+=1
-        ranks.append(1/rank)    
+    # reciprocal ranks, rank_block_size queries scored at a time
+    ranks=1/mrr_ranks(nl_vecs,code_vecs,args.rank_block_size)
     
     if eval_file == args.test_data_file:
-        sort_ids=np.argsort(scores, axis=-1, kind='quicksort', order=None)[:,::-1]
         indexs=[]
         urls=[]
         for example in eval_dataset.examples:
             indexs.append(example.idx)
             urls.append(example.url)
-        with open(os.path.join(args.output_dir,"predictions_{}.jsonl".format(steps)),'w') as f:
-            for index,url,sort_id in zip(indexs,urls,sort_ids):
-                js={}
-                js['url']=url
-                js['answers']=[]
-                for idx in sort_id[:100]:
-                    js['answers'].append(indexs[int(idx)])
-                f.write(json.dumps(js)+'\n')
+        # the 100 best codes of every query, rank_block_size queries scored at a time
+        write_predictions(os.path.join(args.output_dir,"predictions_{}.jsonl".format(steps)),
+                          nl_vecs,code_vecs,urls,indexs,100,args.rank_block_size)
             
     result = {
         "eval_loss": float(perplexity),
@@ -440,8 +428,9 @@ def test(args, model, tokenizer):
     logger.info("  Batch size = %d", args.eval_batch_size)
     eval_loss = 0.0
     nb_eval_steps = 0
-    code_vecs=[] 
-    nl_vecs=[]
+    # kept as args.embedding_dtype, quantized batch by batch
+    code_vecs=EmbeddingStore(args.embedding_dtype)
+    nl_vecs=EmbeddingStore(args.embedding_dtype)
     for batch in tqdm(eval_dataloader, total=len(eval_dataloader)):
         code_inputs = batch[0].to(args.device)    
         nl_inputs = batch[1].to(args.device)
@@ -451,35 +440,20 @@ def test(args, model, tokenizer):
             code_vecs.append(code_vec.cpu().numpy())
             nl_vecs.append(nl_vec.cpu().numpy())
         nb_eval_steps += 1
-    code_vecs=np.concatenate(code_vecs,0)
-    nl_vecs=np.concatenate(nl_vecs,0)
     eval_loss = eval_loss / nb_eval_steps
     perplexity = torch.tensor(eval_loss)
 
-    scores=np.matmul(nl_vecs,code_vecs.T)
-    ranks=[]
-    for i in range(len(scores)):
-        score=scores[i,i]
-        rank=1
-        for j in range(len(scores)):
-            if i!=j and scores[i,j]>=score:
-                rank+=1
-        ranks.append(1/rank)    
-
-    sort_ids=np.argsort(scores, axis=-1, kind='quicksort', order=None)[:,::-1]
+    # reciprocal ranks, rank_block_size queries scored at a time
+    ranks=1/mrr_ranks(nl_vecs,code_vecs,args.rank_block_size)
+
     indexs=[]
     urls=[]
     for example in eval_dataset.examples:
         indexs.append(example.idx)
         urls.append(example.url)
-    with open(os.path.join(args.output_dir,"predictions.jsonl"),'w') as f:
-        for index,url,sort_id in zip(indexs,urls,sort_ids):
-            js={}
-            js['url']=url
-            js['answers']=[]
-            for idx in sort_id[:100]:
-                js['answers'].append(indexs[int(idx)])
-            f.write(json.dumps(js)+'\n')
+    # the 100 best codes of every query, rank_block_size queries scored at a time
+    write_predictions(os.path.join(args.output_dir,"predictions.jsonl"),
+                      nl_vecs,code_vecs,urls,indexs,100,args.rank_block_size)
     
     result = {
         "eval_loss": float(perplexity),
@@ -538,6 +512,10 @@ def main():
                         help="Batch size per GPU/CPU for training.")
     parser.add_argument("--eval_batch_size", default=4, type=int,
                         help="Batch size per GPU/CPU for evaluation.")
+    parser.add_argument("--rank_block_size", default=1000, type=int,
+                        help="Queries scored at once when ranking the codes in evaluation.")
+    parser.add_argument("--embedding_dtype", default="float32", type=str, choices=DTYPES,
+                        help="Precision the code and query vectors are kept in for the evaluation (int8 with per-row scales).")
     parser.add_argument('--gradient_accumulation_steps', type=int, default=1,
                         help="Number of updates steps to accumulate before performing a backward/update pass.")
     parser.add_argument("--learning_rate", default=5e-5, type=float,
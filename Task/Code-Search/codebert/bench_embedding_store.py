@@ -0,0 +1,85 @@
+# Memory, speed and MRR drift of the reduced-precision EmbeddingStore of embedding_store.py.
+#
+# The vectors are appended to a store of every --dtypes batch by batch, as
+# evaluate does, and ranked with mrr_ranks and the 100 best codes of
+# write_predictions' top_k. Reported per dtype: MB of the code and query
+# stores, seconds of the ranking, the MRR and its drift from float32, and
+# the share of the float32 top 100 kept (recall@100) and of queries whose
+# best code is unchanged. The float32 store must give exactly the MRR of
+# the plain arrays.
+#
+# Synthetic vectors by default (bench_ranking.random_vectors); real ones from
+# --code_vecs and --nl_vecs, .npy files where the code of query i is code i,
+# e.g. the code_vecs.npy of a code_index.py index of the test split and the
+# --query_vecs_file of its search over it.
+#
+#   python bench_embedding_store.py --num 100000
+#   python bench_embedding_store.py --code_vecs code_vecs.npy --nl_vecs nl_vecs.npy
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from bench_ranking import random_vectors
+from embedding_store import DTYPES, EmbeddingStore
+from ranking import mrr_ranks, score_blocks, top_k
+
+
+def fill(vecs, dtype, batch_size):
+    store=EmbeddingStore(dtype)
+    for start in range(0,len(vecs),batch_size):
+        store.append(vecs[start:start+batch_size])
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--code_vecs", default=None, type=str, help="Real code vectors (.npy), synthetic ones by default.")
+    parser.add_argument("--nl_vecs", default=None, type=str, help="Real query vectors (.npy), row i for code i.")
+    parser.add_argument("--num", default=20000, type=int, help="Synthetic codes and queries.")
+    parser.add_argument("--dim", default=768, type=int)
+    parser.add_argument("--duplicates", default=0.01, type=float, help="Fraction of codes copied from another one.")
+    parser.add_argument("--noise", default=8, type=float, help="Scale of the noise between a query and its code.")
+    parser.add_argument("--dtypes", default=list(DTYPES), type=str, nargs='+', choices=DTYPES,
+                        help="Always with float32, the reference.")
+    parser.add_argument("--eval_batch_size", default=64, type=int, help="Rows appended at a time.")
+    parser.add_argument("--rank_block_size", default=1000, type=int)
+    parser.add_argument("--k", default=100, type=int)
+    parser.add_argument("--seed", default=42, type=int)
+    args = parser.parse_args()
+
+    if args.code_vecs:
+        code_vecs=np.load(args.code_vecs).astype(np.float32)
+        nl_vecs=np.load(args.nl_vecs).astype(np.float32)
+    else:
+        nl_vecs,code_vecs=random_vectors(np.random.RandomState(args.seed),args.num,args.dim,args.duplicates,args.noise)
+    exact_mrr=float(np.mean(1/mrr_ranks(nl_vecs,code_vecs,args.rank_block_size)))
+
+    report={'num':len(code_vecs),'dim':code_vecs.shape[1],'dtypes':{}}
+    # float32 first, the others are compared with it
+    for dtype in ['float32']+[x for x in args.dtypes if x!='float32']:
+        codes=fill(code_vecs,dtype,args.eval_batch_size)
+        queries=fill(nl_vecs,dtype,args.eval_batch_size)
+        start=time.time()
+        mrr=float(np.mean(1/mrr_ranks(queries,codes,args.rank_block_size)))
+        ids=np.concatenate([top_k(scores,args.k) for _,scores in score_blocks(queries,codes,args.rank_block_size)])
+        seconds=time.time()-start
+        if dtype=='float32':
+            if mrr!=exact_mrr:
+                raise AssertionError("float32 store MRR {} differs from the arrays' {}".format(mrr,exact_mrr))
+            float32_ids=ids
+            float32_seconds=seconds
+        report['dtypes'][dtype]={'mb':round((codes.nbytes+queries.nbytes)/2**20,1),'seconds':round(seconds,3),
+                                 'mrr':mrr,'mrr_drift':mrr-exact_mrr}
+        report['dtypes'][dtype].update(
+            speedup=round(float32_seconds/seconds,2),
+            same_best=float(np.mean(ids[:,0]==float32_ids[:,0])),
+            recall_at_k=float(np.mean([len(set(a)&set(b))/args.k for a,b in zip(ids.tolist(),float32_ids.tolist())])))
+    print(json.dumps(report,indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# Recall and MRR against latency of the IVF index of ivf_index.py.
+#
+# The exact search (ranking.py, every query against every code) gives the k
+# best codes of every query and the rank of its own code. Then IVF indexes
+# are built for every --nlist and --m (0 for flat lists, else the number of
+# PQ sub-vectors), saved and loaded back memory-mapped, and searched with
+# every --nprobe, PQ ones also with the --rerank x k codes they return
+# rescored exactly against the float32 vectors. Reported per search: the
+# share of the codes a query is scored against (lists are not all the same
+# size, the lists of the nearest centroids tend to be long ones), ms per
+# query, recall@r (share of the exact r best found among the r best
+# returned) and the MRR of the k returned codes (a query's code outside of
+# them counts 0), next to the exact MRR cut at k.
+#
+# Synthetic vectors are drawn around --clusters centers, queries close to
+# their code. Real ones come from --code_vecs and --nl_vecs, .npy files of
+# the same number of rows where the code of query i is code i, e.g. the
+# code_vecs.npy of a code_index.py index and the --query_vecs_file of its
+# search over the same data file.
+#
+#   python bench_ivf.py --num 100000 --nlist 256 1024 --m 0 96 --nprobe 1 4 16 64
+#   python bench_ivf.py --code_vecs code_vecs.npy --nl_vecs nl_vecs.npy --nlist 128 --m 0 64
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from ivf_index import IVFIndex, rerank
+from ranking import mrr_ranks, score_blocks, top_k
+
+
+def clustered_vectors(rng, num, dim, clusters, spread, noise):
+    centers=rng.randn(clusters,dim).astype(np.float32)
+    code_vecs=centers[rng.randint(0,clusters,num)]+rng.randn(num,dim).astype(np.float32)*spread
+    nl_vecs=code_vecs+rng.randn(num,dim).astype(np.float32)*noise
+    return nl_vecs.astype(np.float32),code_vecs.astype(np.float32)
+
+
+def recall(ids, exact_ids, r):
+    return float(np.mean([len(set(a[:r])&set(b[:r]))/r for a,b in zip(ids.tolist(),exact_ids.tolist())]))
+
+
+def mrr_at(ids):
+    """MRR of the returned ids when the code of query i is code i, 0 for a query without it."""
+    hits=ids==np.arange(len(ids))[:,None]
+    found=hits.any(-1)
+    return float(np.sum(1/(hits[found].argmax(-1)+1))/len(ids))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--code_vecs", default=None, type=str, help="Real code vectors (.npy), synthetic ones by default.")
+    parser.add_argument("--nl_vecs", default=None, type=str, help="Real query vectors (.npy), row i for code i.")
+    parser.add_argument("--num", default=100000, type=int, help="Synthetic codes.")
+    parser.add_argument("--dim", default=768, type=int)
+    parser.add_argument("--clusters", default=1000, type=int)
+    parser.add_argument("--spread", default=0.5, type=float, help="Scale of the codes around their center.")
+    parser.add_argument("--noise", default=4, type=float, help="Scale of the noise between a query and its code.")
+    parser.add_argument("--num_queries", default=2000, type=int, help="Queries searched, the first ones.")
+    parser.add_argument("--k", default=100, type=int)
+    parser.add_argument("--recall_at", default=[1,10,100], type=int, nargs='+')
+    parser.add_argument("--nlist", default=[256,1024], type=int, nargs='+')
+    parser.add_argument("--m", default=[0,96], type=int, nargs='+')
+    parser.add_argument("--nprobe", default=[1,4,16,64], type=int, nargs='+')
+    parser.add_argument("--rerank", default=[0,4], type=int, nargs='+',
+                        help="PQ searches also return rerank x k codes rescored exactly, 0 for none.")
+    parser.add_argument("--sample_size", default=None, type=int, help="Codes the index is trained on, all by default.")
+    parser.add_argument("--niter", default=20, type=int)
+    parser.add_argument("--rank_block_size", default=1000, type=int)
+    parser.add_argument("--seed", default=42, type=int)
+    args = parser.parse_args()
+
+    if args.code_vecs:
+        code_vecs=np.load(args.code_vecs).astype(np.float32)
+        nl_vecs=np.load(args.nl_vecs).astype(np.float32)
+    else:
+        rng=np.random.RandomState(args.seed)
+        nl_vecs,code_vecs=clustered_vectors(rng,args.num,args.dim,args.clusters,args.spread,args.noise)
+    nl_vecs=nl_vecs[:args.num_queries]
+
+    start=time.time()
+    exact_ids=np.concatenate([top_k(scores,args.k) for _,scores in score_blocks(nl_vecs,code_vecs,args.rank_block_size)])
+    exact_seconds=time.time()-start
+    ranks=mrr_ranks(nl_vecs,code_vecs,args.rank_block_size,np.arange(len(nl_vecs)))
+    report={'num_codes':len(code_vecs),'num_queries':len(nl_vecs),'dim':code_vecs.shape[1],
+            'exact':{'ms_per_query':round(exact_seconds*1000/len(nl_vecs),3),
+                     'mrr':float(np.mean(1/ranks)),
+                     'mrr_at_k':float(np.mean(np.where(ranks<=args.k,1/ranks,0))),
+                     'mb':round(code_vecs.nbytes/2**20,2)},
+            'ivf':[]}
+
+    work_dir=tempfile.mkdtemp()
+    for nlist in args.nlist:
+        for m in args.m:
+            start=time.time()
+            index=IVFIndex.build(code_vecs,nlist,m,args.niter,args.sample_size,args.seed)
+            build_seconds=time.time()-start
+            index_dir=os.path.join(work_dir,'ivf_{}_{}'.format(nlist,m))
+            index.save(index_dir)
+            index=IVFIndex.load(index_dir)
+            lists=index.codes if m else index.vectors
+            sizes=np.diff(index.list_offsets)
+            for nprobe in args.nprobe:
+                _,probes=index.probe(nl_vecs,min(nprobe,nlist))
+                scanned=float(sizes[probes].sum(-1).mean()/len(code_vecs))
+                for factor in (args.rerank if m else [0]):
+                    start=time.time()
+                    if factor:
+                        _,ids=index.search(nl_vecs,args.k*factor,nprobe,args.rank_block_size)
+                        _,ids=rerank(nl_vecs,code_vecs,ids,args.k)
+                    else:
+                        _,ids=index.search(nl_vecs,args.k,nprobe,args.rank_block_size)
+                    seconds=time.time()-start
+                    entry={'nlist':nlist,'m':m,'nprobe':nprobe,'rerank':factor,'build_seconds':round(build_seconds,1),
+                           'mb':round(lists.nbytes/2**20,2),'ms_per_query':round(seconds*1000/len(nl_vecs),3),
+                           'scanned':round(scanned,4),'speedup':round(exact_seconds/seconds,1),'mrr':mrr_at(ids)}
+                    for r in args.recall_at:
+                        entry['recall@{}'.format(r)]=recall(ids,exact_ids,r)
+                    report['ivf'].append(entry)
+    shutil.rmtree(work_dir)
+    print(json.dumps(report,indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# Equality check and benchmark of the blockwise MRR ranking of ranking.py.
+#
+# Random code vectors, some of them duplicated so that ranks have ties, and
+# query vectors close to their code. For every N the ranks of mrr_ranks are
+# timed; up to --legacy_max they are also counted with the loop evaluate used
+# to run over the full score matrix and the MRR must be identical.
+#
+#   python bench_ranking.py --sizes 1000 10000 100000
+#   python bench_ranking.py --sizes 20000 --dim 768 --rank_block_size 500
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from ranking import mrr_ranks
+
+
+def random_vectors(rng, num, dim, duplicates, noise):
+    code_vecs=rng.randn(num,dim).astype(np.float32)
+    copies=rng.rand(num)<duplicates
+    code_vecs[copies]=code_vecs[rng.randint(0,num,copies.sum())]
+    nl_vecs=(code_vecs+rng.randn(num,dim).astype(np.float32)*noise).astype(np.float32)
+    return nl_vecs,code_vecs
+
+
+def legacy_mrr(nl_vecs, code_vecs):
+    scores=np.matmul(nl_vecs,code_vecs.T)
+    ranks=[]
+    for i in range(len(scores)):
+        score=scores[i,i]
+        rank=1
+        for j in range(len(scores)):
+            if i!=j and scores[i,j]>=score:
+                rank+=1
+        ranks.append(1/rank)
+    return float(np.mean(ranks))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default=[1000,10000,100000], type=int, nargs='+')
+    parser.add_argument("--dim", default=768, type=int)
+    parser.add_argument("--rank_block_size", default=1000, type=int)
+    parser.add_argument("--duplicates", default=0.01, type=float, help="Fraction of codes copied from another one.")
+    parser.add_argument("--noise", default=8, type=float, help="Scale of the noise between a query and its code.")
+    parser.add_argument("--legacy_max", default=10000, type=int, help="Largest N the Python loop is run for.")
+    parser.add_argument("--seed", default=42, type=int)
+    args = parser.parse_args()
+    rng=np.random.RandomState(args.seed)
+
+    report=[]
+    for num in args.sizes:
+        nl_vecs,code_vecs=random_vectors(rng,num,args.dim,args.duplicates,args.noise)
+        start=time.time()
+        mrr=float(np.mean(1/mrr_ranks(nl_vecs,code_vecs,args.rank_block_size)))
+        seconds=time.time()-start
+        entry={'num':num,'mrr':mrr,'seconds':round(seconds,3),
+               'block_mb':round(min(args.rank_block_size,num)*num*4/2**20,1),
+               'full_matrix_mb':round(num*num*4/2**20,1)}
+        if num<=args.legacy_max:
+            start=time.time()
+            legacy=legacy_mrr(nl_vecs,code_vecs)
+            legacy_seconds=time.time()-start
+            if legacy!=mrr:
+                raise AssertionError("N={}: blockwise MRR {} differs from the loop's {}".format(num,mrr,legacy))
+            entry.update(legacy_seconds=round(legacy_seconds,3),speedup=round(legacy_seconds/seconds,1))
+        report.append(entry)
+    print(json.dumps(report,indent=2))
+
+
+if __name__ == "__main__":
+    main()
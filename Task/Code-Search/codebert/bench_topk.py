@@ -0,0 +1,85 @@
+# Equality check and benchmark of the top-k predictions file of ranking.py.
+#
+# Random code vectors, some of them duplicated so that scores tie, and query
+# vectors close to their code. For every N write_predictions writes the 100
+# best codes of every query the blockwise way and, up to --legacy_max, the
+# predictions are also written the way evaluate used to (argsort of the full
+# score matrix); both files must be identical byte for byte. Seconds and the
+# peak of the traced numpy allocations of both writers are reported.
+#
+#   python bench_topk.py --sizes 1000 10000
+#   python bench_topk.py --sizes 50000 --legacy_max 0 --rank_block_size 500
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import filecmp
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from bench_ranking import random_vectors
+from ranking import write_predictions
+
+
+def legacy_write_predictions(path, nl_vecs, code_vecs, urls, indexs):
+    scores=np.matmul(nl_vecs,code_vecs.T)
+    sort_ids=np.argsort(scores, axis=-1, kind='quicksort', order=None)[:,::-1]
+    with open(path,'w') as f:
+        for index,url,sort_id in zip(indexs,urls,sort_ids):
+            js={}
+            js['url']=url
+            js['answers']=[]
+            for idx in sort_id[:100]:
+                js['answers'].append(indexs[int(idx)])
+            f.write(json.dumps(js)+'\n')
+
+
+def traced(function, *args):
+    """Seconds and peak MB of the allocations traced while function(*args) runs."""
+    tracemalloc.start()
+    start=time.time()
+    function(*args)
+    seconds=time.time()-start
+    peak=tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return round(seconds,3),round(peak/2**20,1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default=[1000,10000], type=int, nargs='+')
+    parser.add_argument("--dim", default=768, type=int)
+    parser.add_argument("--rank_block_size", default=1000, type=int)
+    parser.add_argument("--duplicates", default=0.01, type=float, help="Fraction of codes copied from another one.")
+    parser.add_argument("--noise", default=8, type=float, help="Scale of the noise between a query and its code.")
+    parser.add_argument("--legacy_max", default=10000, type=int, help="Largest N the full argsort is run for.")
+    parser.add_argument("--seed", default=42, type=int)
+    args = parser.parse_args()
+    rng=np.random.RandomState(args.seed)
+    work_dir=tempfile.mkdtemp()
+
+    report=[]
+    for num in args.sizes:
+        nl_vecs,code_vecs=random_vectors(rng,num,args.dim,args.duplicates,args.noise)
+        urls=['url{}'.format(i) for i in range(num)]
+        indexs=['idx{}'.format(i) for i in range(num)]
+        path=os.path.join(work_dir,'predictions.jsonl')
+        seconds,peak_mb=traced(write_predictions,path,nl_vecs,code_vecs,urls,indexs,100,args.rank_block_size)
+        entry={'num':num,'seconds':seconds,'peak_mb':peak_mb}
+        if num<=args.legacy_max:
+            legacy_path=os.path.join(work_dir,'legacy_predictions.jsonl')
+            legacy_seconds,legacy_peak_mb=traced(legacy_write_predictions,legacy_path,nl_vecs,code_vecs,urls,indexs)
+            if not filecmp.cmp(path,legacy_path,shallow=False):
+                raise AssertionError("N={}: top-k predictions differ from the full argsort's".format(num))
+            entry.update(legacy_seconds=legacy_seconds,legacy_peak_mb=legacy_peak_mb,
+                         speedup=round(legacy_seconds/seconds,1))
+        report.append(entry)
+    print(json.dumps(report,indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+# Persistent index of the code vectors of a checkpoint, and search over it.
+#
+# evaluate and test encode every code of the corpus again next to its query.
+# Here the codes of --code_data_file are encoded once per checkpoint into
+# code_vecs.npy, a float32 matrix opened memory-mapped, with the url and idx
+# of every row in codes.jsonl. meta.json, written last, records the
+# checkpoint and data file the index was built from; an index whose
+# checkpoint or data file changed since is built again. A search encodes
+# only the queries, of --query_data_file (predictions file and, when their
+# codes are in the index, MRR) or of --query (top-k printed), and scores them
+# blockwise against the mapped matrix with ranking.py. With --nlist an IVF
+# index (ivf_index.py) of the code vectors is kept in the index too, and
+# searches only score the codes of the --nprobe lists nearest to a query.
+#
+#   python code_index.py --output_dir=./saved_models --model_type=roberta \
+#       --config_name=microsoft/codebert-base --model_name_or_path=microsoft/codebert-base \
+#       --tokenizer_name=roberta-base --block_size 256 \
+#       --code_data_file=../dataset/test.jsonl --query_data_file=../dataset/test.jsonl
+#   python code_index.py ... --code_data_file=../dataset/test.jsonl --query "sort a list" --top_k 10
+#   python code_index.py ... --code_data_file=../dataset/test.jsonl --query_data_file=../dataset/test.jsonl \
+#       --nlist 256 --m 96 --nprobe 16 --rerank 4
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+import torch
+
+from ivf_index import IVFIndex, rerank
+from model import Model
+from ranking import mrr_ranks, prediction_lines, score_blocks, top_k, write_predictions
+from run import MODEL_CLASSES, TextDataset
+
+logger = logging.getLogger(__name__)
+
+
+def load_model(args):
+    """Tokenizer and Model of args.checkpoint, in eval mode on args.device."""
+    config_class, model_class, tokenizer_class = MODEL_CLASSES[args.model_type]
+    config = config_class.from_pretrained(args.config_name if args.config_name else args.model_name_or_path,
+                                          cache_dir=args.cache_dir if args.cache_dir else None)
+    config.num_labels=1
+    tokenizer = tokenizer_class.from_pretrained(args.tokenizer_name,
+                                                do_lower_case=args.do_lower_case,
+                                                cache_dir=args.cache_dir if args.cache_dir else None)
+    if args.block_size <= 0:
+        args.block_size = tokenizer.max_len_single_sentence
+    args.block_size = min(args.block_size, tokenizer.max_len_single_sentence)
+    if args.model_name_or_path:
+        model = model_class.from_pretrained(args.model_name_or_path,
+                                            config=config,
+                                            cache_dir=args.cache_dir if args.cache_dir else None)
+    else:
+        model = model_class(config)
+    model=Model(model,config,tokenizer,args)
+    model.load_state_dict(torch.load(args.checkpoint,map_location='cpu'))
+    model.to(args.device)
+    model.eval()
+    return tokenizer,model
+
+
+def encode(model, ids, batch_size, device, out=None):
+    """Vectors of the rows of token ids ids, batch_size rows at a time, into out (a new float32 array by default)."""
+    for start in range(0,len(ids),batch_size):
+        inputs=torch.tensor(ids[start:start+batch_size]).to(device)
+        with torch.no_grad():
+            vecs=model.encode(inputs).cpu().numpy()
+        if out is None:
+            out=np.empty((len(ids),vecs.shape[1]),dtype=np.float32)
+        out[start:start+len(vecs)]=vecs
+    return out
+
+
+def query_ids(query, tokenizer, block_size):
+    """Token ids of the query text, the way convert_examples_to_features builds the nl side."""
+    nl_tokens=tokenizer.tokenize(' '.join(query.split()))[:block_size-2]
+    nl_tokens=[tokenizer.cls_token]+nl_tokens+[tokenizer.sep_token]
+    nl_ids=tokenizer.convert_tokens_to_ids(nl_tokens)
+    return nl_ids+[tokenizer.pad_token_id]*(block_size-len(nl_ids))
+
+
+def index_meta(args):
+    """What an index is built from; an index with other meta is stale."""
+    checkpoint=os.stat(args.checkpoint)
+    data=os.stat(args.code_data_file)
+    return {'checkpoint':os.path.abspath(args.checkpoint),
+            'checkpoint_mtime':checkpoint.st_mtime,'checkpoint_size':checkpoint.st_size,
+            'code_data_file':os.path.abspath(args.code_data_file),
+            'code_data_mtime':data.st_mtime,'code_data_size':data.st_size,
+            'block_size':args.block_size}
+
+
+def read_meta(index_dir):
+    path=os.path.join(index_dir,'meta.json')
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def build_index(args, model, tokenizer, meta):
+    """Encode the codes of args.code_data_file into args.index_dir."""
+    dataset=TextDataset(tokenizer, args, args.code_data_file)
+    logger.info("Encoding %d codes into %s", len(dataset), args.index_dir)
+    if not os.path.exists(args.index_dir):
+        os.makedirs(args.index_dir)
+    # a rebuild must not leave the meta of the old index, or IVF indexes of
+    # the old vectors, next to new vectors
+    if os.path.exists(os.path.join(args.index_dir,'meta.json')):
+        os.remove(os.path.join(args.index_dir,'meta.json'))
+    for name in os.listdir(args.index_dir):
+        if name.startswith('ivf_'):
+            shutil.rmtree(os.path.join(args.index_dir,name))
+    code_vecs=np.lib.format.open_memmap(os.path.join(args.index_dir,'code_vecs.npy'),mode='w+',
+                                        dtype=np.float32,shape=(len(dataset),model.config.hidden_size))
+    encode(model,[example.code_ids for example in dataset.examples],args.eval_batch_size,args.device,code_vecs)
+    code_vecs.flush()
+    del code_vecs
+    with open(os.path.join(args.index_dir,'codes.jsonl'),'w') as f:
+        for example in dataset.examples:
+            f.write(json.dumps({'url':example.url,'idx':example.idx})+'\n')
+    with open(os.path.join(args.index_dir,'meta.json'),'w') as f:
+        json.dump(dict(meta,num_codes=len(dataset)),f)
+
+
+def load_index(index_dir):
+    """(code_vecs memory-mapped, urls, indexs) of the codes of an index."""
+    code_vecs=np.load(os.path.join(index_dir,'code_vecs.npy'),mmap_mode='r')
+    urls=[]
+    indexs=[]
+    with open(os.path.join(index_dir,'codes.jsonl')) as f:
+        for line in f:
+            js=json.loads(line)
+            urls.append(js['url'])
+            indexs.append(js['idx'])
+    return code_vecs,urls,indexs
+
+
+def load_ivf(args, code_vecs):
+    """The IVF index of args.nlist lists and args.m sub-vectors of the index, built and saved the first time."""
+    ivf_dir=os.path.join(args.index_dir,'ivf_{}_{}'.format(args.nlist,args.m))
+    if os.path.exists(os.path.join(ivf_dir,'meta.json')):
+        return IVFIndex.load(ivf_dir)
+    logger.info("Training an IVF index of %d lists into %s", args.nlist, ivf_dir)
+    ivf=IVFIndex.build(code_vecs,args.nlist,args.m,sample_size=args.ivf_sample_size,seed=args.seed)
+    ivf.save(ivf_dir)
+    return IVFIndex.load(ivf_dir)
+
+
+def search(args, nl_vecs, code_vecs, ivf=None):
+    """(scores, ids) of the top_k codes of every query, best first, exact or from the IVF index ivf."""
+    if ivf is None:
+        ids=[]
+        scores=[]
+        for start,block in score_blocks(nl_vecs,code_vecs,args.rank_block_size):
+            ids.append(top_k(block,args.top_k))
+            scores.append(np.take_along_axis(block,ids[-1],-1))
+        return np.concatenate(scores),np.concatenate(ids)
+    if not args.rerank:
+        return ivf.search(nl_vecs,args.top_k,args.nprobe,args.rank_block_size)
+    _,ids=ivf.search(nl_vecs,args.top_k*args.rerank,args.nprobe,args.rank_block_size)
+    return rerank(nl_vecs,code_vecs,ids,args.top_k)
+
+
+def search_data_file(args, model, tokenizer, code_vecs, code_urls, code_indexs, ivf=None):
+    """Write the predictions of the queries of args.query_data_file; their MRR if all their codes are indexed.
+
+    From an IVF index the MRR is the one of the top_k codes returned, a
+    query whose code is not among them counting 0.
+    """
+    dataset=TextDataset(tokenizer, args, args.query_data_file)
+    nl_vecs=encode(model,[example.nl_ids for example in dataset.examples],args.eval_batch_size,args.device)
+    urls=[example.url for example in dataset.examples]
+    if args.query_vecs_file:
+        np.save(args.query_vecs_file,nl_vecs)
+    if ivf is None:
+        write_predictions(args.output_file,nl_vecs,code_vecs,urls,code_indexs,args.top_k,args.rank_block_size)
+    else:
+        _,ids=search(args,nl_vecs,code_vecs,ivf)
+        with open(args.output_file,'w') as f:
+            f.write(prediction_lines(urls,code_indexs,ids))
+    logger.info("Predictions of %d queries written to %s", len(urls), args.output_file)
+    rows={}
+    for row,url in enumerate(code_urls):
+        rows.setdefault(url,row)
+    if not all(url in rows for url in urls):
+        return {}
+    code_ids=np.array([rows[url] for url in urls])
+    if ivf is None:
+        result={"eval_mrr":float(np.mean(1/mrr_ranks(nl_vecs,code_vecs,args.rank_block_size,code_ids)))}
+    else:
+        hits=ids==code_ids[:,None]
+        ranks=np.where(hits.any(-1),hits.argmax(-1)+1,np.inf)
+        result={"eval_mrr_at_{}".format(args.top_k):float(np.mean(1/ranks))}
+    print(result)
+    return result
+
+
+def search_queries(args, model, tokenizer, code_vecs, code_urls, code_indexs, ivf=None):
+    """Print the top_k codes of every --query as a json line."""
+    nl_vecs=encode(model,[query_ids(query,tokenizer,args.block_size) for query in args.query],
+                   args.eval_batch_size,args.device)
+    scores,ids=search(args,nl_vecs,code_vecs,ivf)
+    for query,row_scores,row in zip(args.query,scores.tolist(),ids.tolist()):
+        print(json.dumps({'query':query,
+                          'answers':[{'url':code_urls[j],'idx':code_indexs[j],'score':score}
+                                     for score,j in zip(row_scores,row) if j>=0]}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    ## Required parameters
+    parser.add_argument("--output_dir", default=None, type=str, required=True,
+                        help="The output directory of run.py, where the checkpoints are.")
+    parser.add_argument("--code_data_file", default=None, type=str, required=True,
+                        help="The corpus of codes to index (a jsonl file).")
+
+    ## Other parameters
+    parser.add_argument("--checkpoint", default="checkpoint-best-mrr/model.bin", type=str,
+                        help="The model.bin to encode with, relative to output_dir.")
+    parser.add_argument("--index_dir", default=None, type=str,
+                        help="Where the index is kept, code_index_<code_data_file name> next to the checkpoint by default.")
+    parser.add_argument("--query_data_file", default=None, type=str,
+                        help="Queries to search for (a jsonl file like the data files).")
+    parser.add_argument("--query", default=[], type=str, nargs='*',
+                        help="Queries to search for, as text.")
+    parser.add_argument("--output_file", default=None, type=str,
+                        help="Predictions of --query_data_file, index_predictions.jsonl in output_dir by default.")
+    parser.add_argument("--query_vecs_file", default=None, type=str,
+                        help="Also save the vectors of the --query_data_file queries to this .npy file.")
+    parser.add_argument("--top_k", default=100, type=int,
+                        help="Codes returned per query.")
+    parser.add_argument("--rebuild", action='store_true',
+                        help="Encode the codes again even if the index is up to date.")
+    parser.add_argument("--nlist", default=0, type=int,
+                        help="Search an IVF index of this many lists instead of every code, 0 for the exact search.")
+    parser.add_argument("--m", default=0, type=int,
+                        help="Sub-vectors the codes of the IVF index are product-quantized into, 0 to keep them whole.")
+    parser.add_argument("--nprobe", default=16, type=int,
+                        help="Lists of the IVF index searched per query.")
+    parser.add_argument("--rerank", default=0, type=int,
+                        help="Take rerank x top_k codes from the IVF index and rescore them exactly, 0 to keep its scores.")
+    parser.add_argument("--ivf_sample_size", default=None, type=int,
+                        help="Codes the IVF index is trained on, all by default.")
+    parser.add_argument('--seed', type=int, default=42,
+                        help="random seed for initialization")
+    parser.add_argument("--model_type", default="bert", type=str,
+                        help="The model architecture to be fine-tuned.")
+    parser.add_argument("--model_name_or_path", default=None, type=str,
+                        help="The model checkpoint for weights initialization.")
+    parser.add_argument("--config_name", default="", type=str,
+                        help="Optional pretrained config name or path if not the same as model_name_or_path")
+    parser.add_argument("--tokenizer_name", default="", type=str,
+                        help="Optional pretrained tokenizer name or path if not the same as model_name_or_path")
+    parser.add_argument("--cache_dir", default="", type=str,
+                        help="Optional directory to store the pre-trained models downloaded from s3 (instead of the default one)")
+    parser.add_argument("--block_size", default=-1, type=int,
+                        help="Optional input sequence length after tokenization.")
+    parser.add_argument("--do_lower_case", action='store_true',
+                        help="Set this flag if you are using an uncased model.")
+    parser.add_argument("--eval_batch_size", default=4, type=int,
+                        help="Batch size for encoding.")
+    parser.add_argument("--rank_block_size", default=1000, type=int,
+                        help="Queries scored against all codes at a time.")
+    parser.add_argument("--no_cuda", action='store_true',
+                        help="Avoid using CUDA when available")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(name)s -   %(message)s',
+                        datefmt='%m/%d/%Y %H:%M:%S',
+                        level=logging.INFO)
+    args.device = torch.device("cuda" if torch.cuda.is_available() and not args.no_cuda else "cpu")
+    args.checkpoint = os.path.join(args.output_dir, args.checkpoint)
+    if args.index_dir is None:
+        name=os.path.splitext(os.path.basename(args.code_data_file))[0]
+        args.index_dir = os.path.join(os.path.dirname(args.checkpoint), 'code_index_{}'.format(name))
+    if args.output_file is None:
+        args.output_file = os.path.join(args.output_dir, 'index_predictions.jsonl')
+
+    tokenizer,model=load_model(args)
+    meta=index_meta(args)
+    old_meta=read_meta(args.index_dir)
+    if args.rebuild or old_meta is None or any(old_meta.get(key)!=value for key,value in meta.items()):
+        build_index(args,model,tokenizer,meta)
+    else:
+        logger.info("Index %s is up to date", args.index_dir)
+    code_vecs,code_urls,code_indexs=load_index(args.index_dir)
+    ivf=load_ivf(args,code_vecs) if args.nlist else None
+
+    if args.query_data_file:
+        search_data_file(args,model,tokenizer,code_vecs,code_urls,code_indexs,ivf)
+    if args.query:
+        search_queries(args,model,tokenizer,code_vecs,code_urls,code_indexs,ivf)
+
+
+if __name__ == "__main__":
+    main()
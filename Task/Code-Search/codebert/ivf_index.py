@@ -0,0 +1,196 @@
+# Inverted file (IVF) index over code vectors for approximate code search.
+#
+# The exact search scores every query against every code. An IVF index
+# clusters the codes with k-means into nlist lists around coarse centroids;
+# a query is scored only against the codes of the lists of its nprobe
+# nearest centroids, about nprobe/nlist of the corpus. With m > 0 the
+# codes are also product-quantized: the residual of a code to its centroid is
+# cut into m sub-vectors, each kept as the id (a uint8) of the nearest of 256
+# sub-centroids, and a query scores them through a table of its dot products
+# with the sub-centroids, dim/m times fewer bytes to read than float32
+# vectors. Scores are dot products, as in the model and ranking.py.
+#
+# On disk an index is a directory: meta.json, centroids.npy,
+# list_offsets.npy, ids.npy (the code rows in list order) and vectors.npy or,
+# product-quantized, codes.npy and codebooks.npy; the lists are opened
+# memory-mapped.
+import json
+import os
+
+import numpy as np
+
+from ranking import query_blocks
+
+
+def nearest(x, centroids, block_size=10000):
+    """Id of the centroid nearest (L2) to every row of x."""
+    half_norms=(centroids*centroids).sum(-1)/2
+    assign=np.empty(len(x),dtype=np.int64)
+    for start in range(0,len(x),block_size):
+        # |x-c|^2 = |x|^2 - 2 (x.c - |c|^2/2)
+        assign[start:start+block_size]=np.argmax(np.matmul(x[start:start+block_size],centroids.T)-half_norms,-1)
+    return assign
+
+
+def kmeans(x, k, niter=20, seed=42, block_size=10000):
+    """k x dim float32 centroids of Lloyd's k-means over the rows of x, started from k random rows.
+
+    A cluster left empty is restarted from a random row.
+    """
+    rng=np.random.RandomState(seed)
+    x=np.asarray(x,dtype=np.float32)
+    centroids=x[rng.choice(len(x),k,replace=False)].copy()
+    for _ in range(niter):
+        assign=nearest(x,centroids,block_size)
+        order=np.argsort(assign,kind='stable')
+        counts=np.bincount(assign,minlength=k)
+        filled=np.flatnonzero(counts)
+        starts=np.concatenate([[0],np.cumsum(counts)[:-1]])[filled]
+        centroids[filled]=np.add.reduceat(x[order],starts,axis=0)/counts[filled,None]
+        empty=np.flatnonzero(counts==0)
+        centroids[empty]=x[rng.choice(len(x),len(empty),replace=False)]
+    return centroids
+
+
+def rerank(nl_vecs, code_vecs, ids, k):
+    """(scores, ids) of the k best codes among the candidate ids of every query, scored exactly with code_vecs.
+
+    code_vecs can be memory-mapped, only the candidates are read. Ids -1
+    (no candidate) stay last.
+    """
+    best_scores=np.full((len(nl_vecs),k),-np.inf,dtype=np.float32)
+    best_ids=np.full((len(nl_vecs),k),-1,dtype=np.int64)
+    for i,row in enumerate(ids):
+        # in row order, a memory-mapped matrix is read front to back
+        row=np.sort(row[row>=0])
+        scores=np.matmul(code_vecs[row],nl_vecs[i])
+        best=np.argsort(-scores,kind='stable')[:k]
+        best_scores[i,:len(best)]=scores[best]
+        best_ids[i,:len(best)]=row[best]
+    return best_scores,best_ids
+
+
+class IVFIndex(object):
+    """Codes grouped in lists by coarse centroid, flat or product-quantized; see build, search, save and load."""
+    def __init__(self, centroids, list_offsets, ids, vectors=None, codebooks=None, codes=None):
+        self.centroids=centroids
+        self.list_offsets=list_offsets
+        self.ids=ids
+        self.vectors=vectors
+        self.codebooks=codebooks
+        self.codes=codes
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    @property
+    def m(self):
+        return 0 if self.codebooks is None else len(self.codebooks)
+
+    @classmethod
+    def build(cls, code_vecs, nlist, m=0, niter=20, sample_size=None, seed=42):
+        """Train the centroids (and codebooks if m) on sample_size random codes, all by default, and add every code."""
+        code_vecs=np.asarray(code_vecs,dtype=np.float32)
+        num_codes,dim=code_vecs.shape
+        if m and dim%m:
+            raise ValueError("dim {} is not a multiple of m {}".format(dim,m))
+        sample_ids=np.arange(num_codes)
+        if sample_size and sample_size<num_codes:
+            sample_ids=np.sort(np.random.RandomState(seed).choice(num_codes,sample_size,replace=False))
+        centroids=kmeans(code_vecs[sample_ids],nlist,niter,seed)
+        assign=nearest(code_vecs,centroids)
+        ids=np.argsort(assign,kind='stable')
+        list_offsets=np.concatenate([[0],np.cumsum(np.bincount(assign,minlength=nlist))])
+        if not m:
+            return cls(centroids,list_offsets,ids,vectors=code_vecs[ids])
+        residuals=(code_vecs-centroids[assign]).reshape(num_codes,m,dim//m)
+        codebooks=np.stack([kmeans(residuals[sample_ids,j],min(256,len(sample_ids)),niter,seed+j) for j in range(m)])
+        codes=np.stack([nearest(residuals[ids,j],codebooks[j]) for j in range(m)],-1).astype(np.uint8)
+        return cls(centroids,list_offsets,ids,codebooks=codebooks,codes=codes)
+
+    def probe(self, queries, nprobe):
+        """(queries x nlist dot products with the centroids, queries x nprobe lists to search)."""
+        coarse=np.matmul(queries,self.centroids.T)
+        # the nearest centroids, as the codes were assigned: by q.c alone the
+        # lists of the longest centroids would win for every query
+        half_norms=(self.centroids*self.centroids).sum(-1)/2
+        return coarse,np.argpartition(half_norms-coarse,nprobe-1,axis=-1)[:,:nprobe]
+
+    def search(self, nl_vecs, k, nprobe, block_size=1000):
+        """(scores, ids) of the k best codes of every query in the lists of its nprobe nearest centroids, best first.
+
+        A query whose lists hold fewer than k codes gets ids -1 scored -inf
+        at the end.
+        """
+        nprobe=min(nprobe,self.nlist)
+        best_scores=np.full((len(nl_vecs),k),-np.inf,dtype=np.float32)
+        best_ids=np.full((len(nl_vecs),k),-1,dtype=np.int64)
+        for start,end in query_blocks(len(nl_vecs),block_size):
+            queries=np.asarray(nl_vecs[start:end],dtype=np.float32)
+            coarse,probes=self.probe(queries,nprobe)
+            probes=probes.ravel()
+            rows=np.repeat(np.arange(len(queries)),nprobe)
+            order=np.argsort(probes,kind='stable')
+            probes,rows=probes[order],rows[order]
+            if self.m:
+                # dot products of every sub-vector of a query with the sub-centroids, queries x (m x 256)
+                tables=np.einsum('bjd,jcd->bjc',queries.reshape(len(queries),self.m,-1),self.codebooks)
+                tables=tables.reshape(len(queries),-1)
+                offsets=np.arange(self.m)*self.codebooks.shape[1]
+                sub_centroids=self.codebooks.reshape(-1,self.codebooks.shape[2])
+            # every list once, against all the queries of the block that probe it
+            bounds=np.concatenate([[0],np.flatnonzero(np.diff(probes))+1,[len(probes)]])
+            for lo,hi in zip(bounds[:-1],bounds[1:]):
+                l=probes[lo]
+                qs=rows[lo:hi]
+                first,last=self.list_offsets[l],self.list_offsets[l+1]
+                if first==last:
+                    continue
+                if self.m:
+                    entries=self.codes[first:last].astype(np.int64)+offsets
+                    if len(qs)<8:
+                        # the table entries of the sub-vectors of every code, summed
+                        residual_scores=np.take(tables[qs],entries,axis=1).sum(-1)
+                    else:
+                        # many queries: decode the residuals once, one matmul for all
+                        residuals=np.take(sub_centroids,entries,axis=0).reshape(last-first,-1)
+                        residual_scores=np.matmul(queries[qs],residuals.T)
+                    scores=coarse[qs,l][:,None]+residual_scores
+                else:
+                    scores=np.matmul(queries[qs],self.vectors[first:last].T)
+                self._merge(best_scores,best_ids,start+qs,scores,self.ids[first:last],k)
+        order=np.argsort(-best_scores,axis=-1,kind='stable')
+        return np.take_along_axis(best_scores,order,-1),np.take_along_axis(best_ids,order,-1)
+
+    @staticmethod
+    def _merge(best_scores, best_ids, rows, scores, ids, k):
+        """Keep in best_scores/best_ids[rows] the k best of them and of scores of the codes ids."""
+        scores=np.concatenate([best_scores[rows],scores],1)
+        ids=np.concatenate([best_ids[rows],np.broadcast_to(ids,(len(rows),len(ids)))],1)
+        keep=np.argpartition(-scores,k-1,axis=-1)[:,:k]
+        best_scores[rows]=np.take_along_axis(scores,keep,-1)
+        best_ids[rows]=np.take_along_axis(ids,keep,-1)
+
+    def save(self, index_dir):
+        if not os.path.exists(index_dir):
+            os.makedirs(index_dir)
+        arrays={'centroids':self.centroids,'list_offsets':self.list_offsets,'ids':self.ids}
+        if self.m:
+            arrays.update(codebooks=self.codebooks,codes=self.codes)
+        else:
+            arrays.update(vectors=self.vectors)
+        for name,array in arrays.items():
+            np.save(os.path.join(index_dir,name+'.npy'),array)
+        with open(os.path.join(index_dir,'meta.json'),'w') as f:
+            json.dump({'nlist':self.nlist,'m':self.m,'dim':self.centroids.shape[1],'num_codes':len(self.ids)},f)
+
+    @classmethod
+    def load(cls, index_dir):
+        with open(os.path.join(index_dir,'meta.json')) as f:
+            meta=json.load(f)
+        load=lambda name,mmap_mode=None: np.load(os.path.join(index_dir,name+'.npy'),mmap_mode=mmap_mode)
+        if meta['m']:
+            return cls(load('centroids'),load('list_offsets'),load('ids','r'),
+                       codebooks=load('codebooks'),codes=load('codes','r'))
+        return cls(load('centroids'),load('list_offsets'),load('ids','r'),vectors=load('vectors','r'))
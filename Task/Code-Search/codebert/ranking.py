@@ -0,0 +1,96 @@
+# Blockwise ranking for the code search evaluation.
+#
+# evaluate used to build the whole queries x codes score matrix and find the
+# rank of every query's code with a doubly nested Python loop over it, O(N^2)
+# interpreted comparisons, and argsort every row of it for the 100 codes of
+# each query in the predictions file. Here the scores are computed
+# block_size queries at a time, so no more than block_size x N of them exist
+# at once. mrr_ranks counts, per row, the codes scoring at least as high as
+# the query's own code with one comparison against the diagonal: the ranks
+# are the ones the loop counted, one plus the other codes j != i with
+# scores[i,j] >= scores[i,i]; code_ids points the queries of a separate
+# code index (code_index.py) at their column instead. write_predictions
+# partitions out the k best codes of every query, sorts only those, and
+# streams the file block by block; it is the file the full argsort wrote,
+# byte for byte.
+import json
+
+import numpy as np
+
+
+def query_blocks(num_queries, block_size):
+    """(start, end) of consecutive blocks of about block_size queries, none of a single query.
+
+    numpy multiplies a single row with gemv, whose sums can differ in the
+    last bit from the ones of the full product; a lone last query joins the
+    block before it.
+    """
+    block_size=max(block_size,2)
+    bounds=list(range(0,num_queries,block_size))+[num_queries]
+    if len(bounds)>2 and bounds[-1]-bounds[-2]==1:
+        del bounds[-2]
+    return list(zip(bounds[:-1],bounds[1:]))
+
+
+def score_blocks(nl_vecs, code_vecs, block_size):
+    """(start, scores of queries start:start+len(scores) against every code) per block of query_blocks.
+
+    nl_vecs and code_vecs are arrays or EmbeddingStores (embedding_store.py).
+    """
+    for start,end in query_blocks(len(nl_vecs),block_size):
+        if isinstance(code_vecs,np.ndarray):
+            yield start,np.matmul(nl_vecs[start:end],code_vecs.T)
+        else:
+            yield start,code_vecs.score(nl_vecs[start:end])
+
+
+def mrr_ranks(nl_vecs, code_vecs, block_size=1000, code_ids=None):
+    """Rank of the code of every query nl_vecs[i] among all codes, as an int64 array.
+
+    The code of query i is code_vecs[code_ids[i]], code_vecs[i] by default.
+    """
+    if code_ids is None:
+        code_ids=np.arange(len(nl_vecs))
+    ranks=np.empty(len(nl_vecs),dtype=np.int64)
+    for start,scores in score_blocks(nl_vecs,code_vecs,block_size):
+        rows=np.arange(len(scores))
+        score=scores[rows,code_ids[start:start+len(scores)]][:,None]
+        # the comparison counts the query's own code too, unless its score is nan
+        ranks[start:start+len(scores)]=1+(scores>=score).sum(-1)-(score>=score)[:,0]
+    return ranks
+
+
+def top_k(scores, k):
+    """Ids of the k best codes of every row of scores, best first: np.argsort(scores)[:,::-1][:,:k].
+
+    argpartition finds the k best of a row and only those are sorted. Their
+    order is the one of the full sort unless scores tie among them or with
+    the best code left out, where the order of the full quicksort depends on
+    the whole row; those rows (duplicate codes, nan) are argsorted whole.
+    """
+    num_codes=scores.shape[1]
+    k=min(k,num_codes)
+    ids=np.argpartition(scores,num_codes-k,axis=-1)[:,num_codes-k:]
+    values=np.take_along_axis(scores,ids,-1)
+    order=np.argsort(values,axis=-1,kind='quicksort')[:,::-1]
+    ids=np.take_along_axis(ids,order,-1)
+    values=np.take_along_axis(values,order,-1)
+    ties=(values[:,:-1]==values[:,1:]).any(-1)|np.isnan(values).any(-1)
+    ties|=(scores>=values[:,-1:]).sum(-1)>k
+    for row in np.flatnonzero(ties):
+        ids[row]=np.argsort(scores[row],kind='quicksort')[::-1][:k]
+    return ids
+
+
+def prediction_lines(urls, indexs, ids):
+    """Lines {'url', 'answers': indexs of the codes ids[i]} of the queries urls; ids -1 (none) are left out."""
+    return ''.join(json.dumps({'url':url,'answers':[indexs[idx] for idx in row if idx>=0]})+'\n'
+                   for url,row in zip(urls,ids.tolist()))
+
+
+def write_predictions(path, nl_vecs, code_vecs, urls, indexs, k=100, block_size=1000):
+    """Write {'url', 'answers': idx of its k best codes} of every query to the jsonl file path."""
+    with open(path,'w') as f:
+        for start,scores in score_blocks(nl_vecs,code_vecs,block_size):
+            ids=top_k(scores,k)
+            f.write(prediction_lines(urls[start:start+len(ids)],indexs,ids))
@@ -28,9 +28,7 @@ from transformers import (WEIGHTS_NAME, AdamW, get_linear_schedule_with_warmup,
                           DistilBertConfig, DistilBertForMaskedLM, DistilBertTokenizer)
 
 from parser import DFG_python,DFG_java,DFG_ruby,DFG_go,DFG_php,DFG_javascript,DFG_c
-from parser import (remove_comments_and_docstrings,
-                   tree_to_token_index,
-                   index_to_code_token,
+from parser import (tree_to_code_tokens,
                    tree_to_variable_index)
 from tree_sitter import Language, Parser
 dfg_function={
@@ -64,23 +62,15 @@ MODEL_CLASSES = {
 
 #remove comments, tokenize code and extract dataflow                                        
 def extract_dataflow(code, parser,lang):
-    #remove comments
-    try:
-        code=remove_comments_and_docstrings(code,lang)
-    except:
-        pass    
     #obtain dataflow
     if lang=="php":
         code="<?php"+code+"?>"    
     try:
-        tree = parser[0].parse(bytes(code,'utf8'))    
+        #comments and docstrings are skipped while walking the tree, no regex or tokenize pass
+        code_bytes=bytes(code,'utf8')
+        tree = parser[0].parse(code_bytes)    
         root_node = tree.root_node  
-        tokens_index=tree_to_token_index(root_node)     
-        code=code.split('\n')
-        code_tokens=[index_to_code_token(x,code) for x in tokens_index]  
-        index_to_code={}
-        for idx,(index,code) in enumerate(zip(tokens_index,code_tokens)):
-            index_to_code[index]=(idx,code)  
+        code_tokens,_,index_to_code=tree_to_code_tokens(root_node,code_bytes,lang)
         try:
             DFG,_=parser[1](root_node,index_to_code,{}) 
         except:
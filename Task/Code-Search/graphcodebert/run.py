@@ -52,10 +52,9 @@ from transformers import (WEIGHTS_NAME, AdamW, get_linear_schedule_with_warmup,
                           DistilBertConfig, DistilBertForMaskedLM, DistilBertTokenizer)
 
 from parser import DFG_python,DFG_java,DFG_ruby,DFG_go,DFG_php,DFG_javascript,DFG_c
-from parser import (remove_comments_and_docstrings,
-                   tree_to_token_index,
-                   index_to_code_token,
+from parser import (tree_to_code_tokens,
                    tree_to_variable_index)
+from parser import load_dfg_cache, dfg_cache_stats
 from tree_sitter import Language, Parser
 dfg_function={
     'python':DFG_python,
@@ -88,23 +87,15 @@ MODEL_CLASSES = {
 
 #remove comments, tokenize code and extract dataflow                                        
 def extract_dataflow(code, parser,lang):
-    #remove comments
-    try:
-        code=remove_comments_and_docstrings(code,lang)
-    except:
-        pass    
     #obtain dataflow
     if lang=="php":
         code="<?php"+code+"?>"    
     try:
-        tree = parser[0].parse(bytes(code,'utf8'))    
+        #comments and docstrings are skipped while walking the tree, no regex or tokenize pass
+        code_bytes=bytes(code,'utf8')
+        tree = parser[0].parse(code_bytes)    
         root_node = tree.root_node  
-        tokens_index=tree_to_token_index(root_node)     
-        code=code.split('\n')
-        code_tokens=[index_to_code_token(x,code) for x in tokens_index]  
-        index_to_code={}
-        for idx,(index,code) in enumerate(zip(tokens_index,code_tokens)):
-            index_to_code[index]=(idx,code)  
+        code_tokens,_,index_to_code=tree_to_code_tokens(root_node,code_bytes,lang)
         try:
             DFG,_=parser[1](root_node,index_to_code,{}) 
         except:
@@ -125,6 +116,12 @@ def extract_dataflow(code, parser,lang):
         dfg=[]
     return code_tokens,dfg
 
+def cached_dataflow(code, parser, lang, args):
+    """extract_dataflow, served from the cache in args.dfg_cache_dir when it is set."""
+    if not args.dfg_cache_dir:
+        return extract_dataflow(code,parser,lang)
+    return load_dfg_cache(args.dfg_cache_dir,extract_dataflow).dataflow(code,parser,lang)
+
 class InputFeatures(object):
     """A single training/test features for a example."""
     def __init__(self,
@@ -159,7 +156,7 @@ def convert_examples_to_features(item):
         code=js['original_string']
     else:
         code=' '.join(js['function_tokens'])
-    code_tokens,dfg=extract_dataflow(code,parser,args.lang)
+    code_tokens,dfg=cached_dataflow(code,parser,args.lang,args)
     code_tokens=[tokenizer.tokenize('@ '+x)[1:] if idx!=0 else tokenizer.tokenize(x) for idx,x in enumerate(code_tokens)]
     ori2cur_pos={}
     ori2cur_pos[-1]=(0,0)
@@ -215,6 +212,8 @@ class TextDataset(Dataset):
                     data.append((js,tokenizer,args))
                     # if len(data) > 1000: break
             self.examples=list(map(convert_examples_to_features, tqdm(data,total=len(data))))
+            if args.dfg_cache_dir:
+                logger.info("DFG cache: %(hits)d hits, %(misses)d misses", dfg_cache_stats())
             pickle.dump(self.examples,open(cache_file,'wb'))
             
         if 'train' in file_path:
@@ -663,6 +662,8 @@ def main():
                         help="For distributed training: local_rank")
     parser.add_argument('--server_ip', type=str, default='', help="For distant debugging.")
     parser.add_argument('--server_port', type=str, default='', help="For distant debugging.")
+    parser.add_argument("--dfg_cache_dir", default=None, type=str,
+                        help="Directory of the on-disk data flow cache, unset to parse every function.")
 
     
 
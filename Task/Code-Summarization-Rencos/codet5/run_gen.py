@@ -78,7 +78,7 @@ def eval_ppl_epoch(args, eval_data, eval_examples, model, tokenizer):
     return eval_ppl
 
 
-def eval_bleu_epoch(args, eval_data, eval_examples, model, tokenizer, split_tag, criteria):
+def eval_bleu_epoch(args, eval_data, eval_examples, model, tokenizer, split_tag, criteria, pool=None):
     logger.info("  ***** Running bleu evaluation on {} data*****".format(split_tag))
     logger.info("  Num examples = %d", len(eval_examples))
     logger.info("  Batch size = %d", args.eval_batch_size)
@@ -153,7 +153,7 @@ def eval_bleu_epoch(args, eval_data, eval_examples, model, tokenizer, split_tag,
         else:
             bleu = round(_bleu(gold_fn, output_fn), 2)
             if args.task in ['concode', 'translate', 'refine']:
-                codebleu = calc_code_bleu.get_codebleu(gold_fn, output_fn, args.lang)
+                codebleu = calc_code_bleu.get_codebleu(gold_fn, output_fn, args.lang, pool=pool)
 
         result = {'em': np.mean(dev_accs) * 100, 'bleu': bleu}
         if args.task in ['concode', 'translate', 'refine']:
@@ -313,7 +313,7 @@ def main():
                     eval_examples, eval_data = load_and_cache_gen_data(args, args.dev_filename, pool, tokenizer, 'dev',
                                                                        only_src=True, is_sample=True)
 
-                    result = eval_bleu_epoch(args, eval_data, eval_examples, model, tokenizer, 'dev', 'e%d' % cur_epoch)
+                    result = eval_bleu_epoch(args, eval_data, eval_examples, model, tokenizer, 'dev', 'e%d' % cur_epoch, pool)
                     dev_bleu, dev_em = result['bleu'], result['em']
                     if args.task in ['summarize']:
                         dev_bleu_em = dev_bleu
@@ -373,7 +373,7 @@ def main():
                 model.load_state_dict(torch.load(file))
             eval_examples, eval_data = load_and_cache_gen_data(args, args.test_filename, pool, tokenizer, 'test',
                                                                only_src=True, is_sample=False)
-            result = eval_bleu_epoch(args, eval_data, eval_examples, model, tokenizer, 'test', criteria)
+            result = eval_bleu_epoch(args, eval_data, eval_examples, model, tokenizer, 'test', criteria, pool)
             test_bleu, test_em = result['bleu'], result['em']
             test_codebleu = result['codebleu'] if 'codebleu' in result else 0
             result_str = "[%s] bleu-4: %.2f, em: %.4f, codebleu: %.4f\n" % (criteria, test_bleu, test_em, test_codebleu)
@@ -142,28 +142,124 @@ def corpus_bleu(
     """
     # Before proceeding to compute BLEU, perform sanity checks.
 
-    p_numerators = Counter()  # Key = ngram order, and value = no. of ngram matches.
-    p_denominators = Counter()  # Key = ngram order, and value = no. of ngram in ref.
-    hyp_lengths, ref_lengths = 0, 0
-
     assert len(list_of_references) == len(hypotheses), (
         "The number of hypotheses and their reference(s) should be the " "same "
     )
 
     # Iterate through each hypothesis and their corresponding references.
+    # The last pair is passed on for the smoothing methods that read it.
+    stats = []
+    references = hypothesis = None
     for references, hypothesis in zip(list_of_references, hypotheses):
-        # For each order of ngram, calculate the numerator and
-        # denominator for the corpus-level modified precision.
-        for i, _ in enumerate(weights, start=1):
-            p_i = modified_precision(references, hypothesis, i)
-            p_numerators[i] += p_i.numerator
-            p_denominators[i] += p_i.denominator
+        stats.append(sentence_stats(references, hypothesis, weights))
+    return corpus_bleu_from_stats(
+        stats, weights, smoothing_function, auto_reweigh, references, hypothesis
+    )
+
+
+def sentence_stats(references, hypothesis, weights=(0.25, 0.25, 0.25, 0.25)):
+    """
+    The statistics corpus_bleu adds up over the corpus for one hypothesis: the
+    numerator and denominator of the modified precision of each ngram order, the
+    hypothesis length and the closest reference length.
+
+    :param references: reference sentences
+    :type references: list(list(str))
+    :param hypothesis: a hypothesis sentence
+    :type hypothesis: list(str)
+    :param weights: weights for unigrams, bigrams, trigrams and so on
+    :type weights: list(float)
+    :return: (numerators, denominators, hyp_len, closest_ref_len)
+    :rtype: tuple(list(int), list(int), int, int)
+    """
+    numerators, denominators = [], []
+    # For each order of ngram, calculate the numerator and
+    # denominator for the corpus-level modified precision.
+    for i, _ in enumerate(weights, start=1):
+        p_i = modified_precision(references, hypothesis, i)
+        numerators.append(p_i.numerator)
+        denominators.append(p_i.denominator)
+    hyp_len = len(hypothesis)
+    return numerators, denominators, hyp_len, closest_ref_length(references, hyp_len)
+
+
+def reference_stats(references, weights=(0.25, 0.25, 0.25, 0.25)):
+    """
+    What sentence_stats reads from the references of one hypothesis, for
+    scoring many hypotheses against the same references with hypothesis_stats:
+    the maximum count over the references of every ngram of each order, and
+    the reference lengths.
+
+    :param references: reference sentences
+    :type references: list(list(str))
+    :param weights: weights for unigrams, bigrams, trigrams and so on
+    :type weights: list(float)
+    :rtype: tuple(list(Counter), list(int))
+    """
+    max_counts = []
+    for i, _ in enumerate(weights, start=1):
+        counts = Counter()
+        for reference in references:
+            if len(reference) >= i:
+                counts |= Counter(ngrams(reference, i))
+        max_counts.append(counts)
+    return max_counts, [len(reference) for reference in references]
+
+
+def hypothesis_stats(ref_stats, hypothesis, weights=(0.25, 0.25, 0.25, 0.25)):
+    """
+    sentence_stats of hypothesis against the references ref_stats was computed
+    from with reference_stats.
+    """
+    max_counts, ref_lens = ref_stats
+    numerators, denominators = [], []
+    for i, _ in enumerate(weights, start=1):
+        counts = Counter(ngrams(hypothesis, i)) if len(hypothesis) >= i else Counter()
+        numerators.append(
+            sum(min(count, max_counts[i - 1][ngram]) for ngram, count in counts.items())
+        )
+        denominators.append(max(1, sum(counts.values())))
+    hyp_len = len(hypothesis)
+    closest_ref_len = min(
+        ref_lens, key=lambda ref_len: (abs(ref_len - hyp_len), ref_len)
+    )
+    return numerators, denominators, hyp_len, closest_ref_len
 
-        # Calculate the hypothesis length and the closest reference length.
-        # Adds them to the corpus-level hypothesis and reference counts.
-        hyp_len = len(hypothesis)
+
+def corpus_bleu_from_stats(
+    stats,
+    weights=(0.25, 0.25, 0.25, 0.25),
+    smoothing_function=None,
+    auto_reweigh=False,
+    references=None,
+    hypothesis=None,
+):
+    """
+    corpus_bleu from the sentence_stats of every hypothesis of the corpus.
+
+    The statistics are integers, so scoring a corpus in shards and passing
+    their statistics gives the same score as corpus_bleu, bit for bit.
+
+    :param stats: sentence_stats of each hypothesis, in corpus order
+    :type stats: iter(tuple)
+    :param references: the references of the last hypothesis, read by
+        smoothing methods 4 to 7 only
+    :type references: list(list(str))
+    :param hypothesis: the last hypothesis, read by smoothing methods 4 to 7 only
+    :type hypothesis: list(str)
+    :return: The corpus-level BLEU score.
+    :rtype: float
+    """
+    p_numerators = Counter()  # Key = ngram order, and value = no. of ngram matches.
+    p_denominators = Counter()  # Key = ngram order, and value = no. of ngram in ref.
+    hyp_lengths, ref_lengths = 0, 0
+
+    for numerators, denominators, hyp_len, ref_len in stats:
+        for i, _ in enumerate(weights, start=1):
+            p_numerators[i] += numerators[i - 1]
+            p_denominators[i] += denominators[i - 1]
         hyp_lengths += hyp_len
-        ref_lengths += closest_ref_length(references, hyp_len)
+        ref_lengths += ref_len
 
     # Calculate corpus-level brevity penalty.
     bp = brevity_penalty(ref_lengths, hyp_lengths)
@@ -201,6 +297,68 @@ def corpus_bleu(
     return s
 
 
+class BLEUAccumulator(object):
+    """
+    corpus_bleu of a corpus seen one hypothesis at a time. Only the summed
+    sentence_stats and the last pair (for smoothing methods 4 to 7) are
+    kept, so memory does not grow with the corpus.
+
+        >>> accumulator = BLEUAccumulator()
+        >>> for hypothesis, references in zip(hypotheses, list_of_references):
+        ...     accumulator.add(hypothesis, references)
+        >>> score = accumulator.result()
+
+    :param weights: weights for unigrams, bigrams, trigrams and so on
+    :type weights: list(float)
+    :param smoothing_function:
+    :type smoothing_function: SmoothingFunction
+    :param auto_reweigh: Option to re-normalize the weights uniformly.
+    :type auto_reweigh: bool
+    """
+
+    def __init__(
+        self,
+        weights=(0.25, 0.25, 0.25, 0.25),
+        smoothing_function=None,
+        auto_reweigh=False,
+    ):
+        self.weights = weights
+        self.smoothing_function = smoothing_function
+        self.auto_reweigh = auto_reweigh
+        self.numerators = [0] * len(weights)
+        self.denominators = [0] * len(weights)
+        self.hyp_len = 0
+        self.ref_len = 0
+        self.references = self.hypothesis = None
+
+    def add(self, hypothesis, references):
+        self.add_stats(sentence_stats(references, hypothesis, self.weights))
+        self.references, self.hypothesis = references, hypothesis
+
+    def add_stats(self, stats):
+        """Add the sentence_stats of one hypothesis."""
+        numerators, denominators, hyp_len, ref_len = stats
+        for i, _ in enumerate(self.weights):
+            self.numerators[i] += numerators[i]
+            self.denominators[i] += denominators[i]
+        self.hyp_len += hyp_len
+        self.ref_len += ref_len
+
+    def stats(self):
+        """The sentence_stats of everything added, summed."""
+        return self.numerators, self.denominators, self.hyp_len, self.ref_len
+
+    def result(self):
+        return corpus_bleu_from_stats(
+            [self.stats()],
+            self.weights,
+            self.smoothing_function,
+            self.auto_reweigh,
+            self.references,
+            self.hypothesis,
+        )
+
+
 def modified_precision(references, hypothesis, n):
     """
     Calculate modified ngram precision.
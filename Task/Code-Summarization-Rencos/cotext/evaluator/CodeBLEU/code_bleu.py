@@ -0,0 +1,230 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+# Corpus CodeBLEU from additive per-example statistics.
+#
+# Each of the four components is a ratio of sums over the corpus, so
+# example_stats computes what one hypothesis adds to those sums and a corpus
+# can be sharded over a process pool. Workers parse with a ParseCache of their
+# own, loaded with the first chunk they get, and the parent adds the statistics
+# up in corpus order: the integer sums are exact and the float sums of the
+# weighted ngram match are taken in the same order as in a serial run, so the
+# scores are bit-identical whatever the number of processes. The dataflow match
+# depends on the string hash seed through the set() merges of get_data_flow;
+# forked workers share the parent's.
+import itertools
+import os
+
+from evaluator.CodeBLEU import bleu, weighted_ngram_match, syntax_match, dataflow_match, ngram_counts
+from evaluator.CodeBLEU.parse_cache import ParseCache
+
+root_dir = os.path.dirname(__file__)
+_keywords = {}
+# per process, workers keep the parser between chunks
+_caches = {}
+
+
+def load_keywords(lang):
+    if lang not in _keywords:
+        _keywords[lang] = set(x.strip() for x in
+                              open(root_dir + '/keywords/' + lang + '.txt', 'r', encoding='utf-8').readlines())
+    return _keywords[lang]
+
+
+def make_weights(reference_tokens, key_word_list):
+    return {token: 1 if token in key_word_list else 0.2 for token in reference_tokens}
+
+
+def tokenize(code):
+    return code.split()
+
+
+def example_stats(references, hypothesis, lang, cache):
+    """What one hypothesis adds to the ngram, weighted ngram, syntax and dataflow match sums."""
+    keywords = load_keywords(lang)
+    tokenized_hyp = tokenize(hypothesis)
+    tokenized_refs = [tokenize(x) for x in references]
+    ngram_stats, weighted_ngram_stats = ngram_counts.sentence_stats(
+        tokenized_refs, tokenized_hyp, [make_weights(reference_tokens, keywords) for reference_tokens in tokenized_refs])
+    return (ngram_stats,
+            weighted_ngram_stats,
+            syntax_match.syntax_match_stats(references, hypothesis, cache),
+            dataflow_match.dataflow_match_stats(references, hypothesis, lang, cache))
+
+
+def read_examples(ref_files, hyp_file):
+    """(references, hypothesis) of every line of hyp_file and the ref_files, read as they are consumed."""
+    files = [open(file, 'r', encoding='utf-8') for file in [hyp_file] + list(ref_files)]
+    try:
+        for lines in itertools.zip_longest(*files):
+            assert None not in lines, 'the hypothesis and reference files differ in length'
+            yield [x.strip() for x in lines[1:]], lines[0].strip()
+    finally:
+        for file in files:
+            file.close()
+
+
+def _chunks(examples, lang, chunk_size):
+    examples = iter(examples)
+    while True:
+        chunk = list(itertools.islice(examples, chunk_size))
+        if not chunk:
+            return
+        yield lang, [refs for refs, _ in chunk], [hyp for _, hyp in chunk]
+
+
+def _chunk_stats(task):
+    lang, references, hypothesis = task
+    if lang not in _caches:
+        _caches[lang] = ParseCache(lang)
+    cache = _caches[lang]
+    # the parsed code only lives for one chunk
+    cache.clear()
+    return [example_stats(refs, hyp, lang, cache) for refs, hyp in zip(references, hypothesis)]
+
+
+def iter_stats(examples, lang, pool=None, chunk_size=64):
+    """example_stats of each (references, hypothesis) of examples in order, computed by pool when given.
+
+    examples may be a generator such as read_examples; chunk_size examples
+    are parsed at a time. A pool reads the examples ahead of its workers.
+    """
+    chunks = _chunks(examples, lang, chunk_size)
+    for chunk in (pool.imap(_chunk_stats, chunks) if pool is not None else map(_chunk_stats, chunks)):
+        for stats in chunk:
+            yield stats
+
+
+def corpus_stats(references, hypothesis, lang, pool=None, chunk_size=64):
+    """example_stats of every hypothesis in corpus order, computed by pool when given."""
+    assert len(references) == len(hypothesis)
+    return list(iter_stats(zip(references, hypothesis), lang, pool, chunk_size))
+
+
+def code_bleu_from_stats(stats, params='0.25,0.25,0.25,0.25'):
+    """(ngram match, weighted ngram match, syntax match, dataflow match, CodeBLEU) of example_stats."""
+    alpha, beta, gamma, theta = [float(x) for x in params.split(',')]
+    ngram_match_score = bleu.corpus_bleu_from_stats(x[0] for x in stats)
+    weighted_ngram_match_score = weighted_ngram_match.corpus_bleu_from_stats(x[1] for x in stats)
+    syntax_match_score = syntax_match.corpus_syntax_match_from_stats(x[2] for x in stats)
+    dataflow_match_score = dataflow_match.corpus_dataflow_match_from_stats(x[3] for x in stats)
+    code_bleu_score = alpha * ngram_match_score \
+                      + beta * weighted_ngram_match_score \
+                      + gamma * syntax_match_score \
+                      + theta * dataflow_match_score
+    return (ngram_match_score, weighted_ngram_match_score, syntax_match_score, dataflow_match_score,
+            code_bleu_score)
+
+
+def corpus_code_bleu(references, hypothesis, lang, params='0.25,0.25,0.25,0.25', pool=None, chunk_size=64):
+    """(ngram match, weighted ngram match, syntax match, dataflow match, CodeBLEU) of the corpus.
+
+    references[i] is the list of references of hypothesis[i]; with a
+    multiprocessing pool the examples are scored in chunks of chunk_size.
+    """
+    assert len(references) == len(hypothesis)
+    accumulator = CodeBLEUAccumulator(lang, params)
+    for stats in iter_stats(zip(references, hypothesis), lang, pool, chunk_size):
+        accumulator.add_stats(stats)
+    return accumulator.result()
+
+
+class CodeBLEUAccumulator(object):
+    """corpus_code_bleu of a corpus seen one hypothesis at a time.
+
+    Only the summed statistics of the four components are kept, so memory does
+    not grow with the corpus and a generation loop can score its hypotheses as
+    it decodes them. The scores are the ones of corpus_code_bleu as long as the
+    hypotheses are added in corpus order.
+
+        accumulator = CodeBLEUAccumulator('java')
+        for hypothesis, references in examples:
+            accumulator.add(hypothesis, references)
+        ngram, weighted, syntax, dataflow, code_bleu = accumulator.result()
+    """
+
+    def __init__(self, lang, params='0.25,0.25,0.25,0.25'):
+        self.lang = lang
+        self.params = params
+        self.cache = None
+        self.ngram_match = bleu.BLEUAccumulator()
+        self.weighted_ngram_match = weighted_ngram_match.BLEUAccumulator()
+        self.syntax_match = syntax_match.SyntaxMatchAccumulator(lang)
+        self.dataflow_match = dataflow_match.DataflowMatchAccumulator(lang)
+
+    def add(self, hypothesis, references):
+        if self.cache is None:
+            self.cache = ParseCache(self.lang)
+        self.add_stats(example_stats(references, hypothesis, self.lang, self.cache))
+        self.cache.clear()
+
+    def add_stats(self, stats):
+        """Add the example_stats of one hypothesis."""
+        self.ngram_match.add_stats(stats[0])
+        self.weighted_ngram_match.add_stats(stats[1])
+        self.syntax_match.add_stats(stats[2])
+        self.dataflow_match.add_stats(stats[3])
+
+    def result(self):
+        """(ngram match, weighted ngram match, syntax match, dataflow match, CodeBLEU) of everything added."""
+        return code_bleu_from_stats([(self.ngram_match.stats(), self.weighted_ngram_match.stats(),
+                                      self.syntax_match.stats(), self.dataflow_match.stats())], self.params)
+
+
+class CodeBLEUScorer(object):
+    """corpus_code_bleu of fixed references, for scoring them again and again.
+
+    Everything the four components read from the references (ngram counts,
+    keyword weights, subtree counts, interned data flow) is computed once at
+    construction, score() then only tokenizes, parses and matches the
+    hypotheses. The scores are the ones corpus_code_bleu returns, bit for bit.
+
+        scorer = CodeBLEUScorer(references, 'java')
+        for epoch in range(epochs):
+            ngram, weighted, syntax, dataflow, code_bleu = scorer.score(hypothesis)
+    """
+
+    def __init__(self, references, lang, params='0.25,0.25,0.25,0.25'):
+        self.lang = lang
+        self.params = params
+        self.cache = ParseCache(lang)
+        keywords = load_keywords(lang)
+        parser = [self.cache.parser, dataflow_match.dfg_function[lang]]
+        self.references = []
+        for refs in references:
+            tokenized_refs = [tokenize(x) for x in refs]
+            tokenized_refs_with_weights = [[reference_tokens, make_weights(reference_tokens, keywords)]
+                                           for reference_tokens in tokenized_refs]
+            entries = [self.cache.entry(x) for x in refs]
+            self.references.append((
+                bleu.reference_stats(tokenized_refs),
+                weighted_ngram_match.reference_stats(tokenized_refs_with_weights),
+                [syntax_match.get_sub_tree_counts(entry['tree'].root_node, self.cache.intern) for entry in entries],
+                [dataflow_match.get_dataflow_counts(dataflow_match.get_data_flow(entry['code'], parser, entry['tree']),
+                                                    self.cache.intern) for entry in entries]))
+        # the trees are done with, the subtree and data flow ids are what the hypotheses are matched by
+        self.cache.clear(symbols=False)
+
+    def example_stats(self, i, hypothesis):
+        """example_stats of hypothesis against the i-th references."""
+        bleu_refs, weighted_refs, ref_sub_trees, ref_dfgs = self.references[i]
+        tokenized_hyp = tokenize(hypothesis)
+        entry = self.cache.entry(hypothesis)
+        # a subtree or data flow the references do not have cannot match, looking it up keeps the table at its size
+        cand_sub_trees = syntax_match.get_sub_tree_counts(entry['tree'].root_node, self.cache.lookup)
+        parser = [self.cache.parser, dataflow_match.dfg_function[self.lang]]
+        cand_dfg = dataflow_match.get_dataflow_counts(
+            dataflow_match.get_data_flow(entry['code'], parser, entry['tree']), self.cache.lookup)
+        return (bleu.hypothesis_stats(bleu_refs, tokenized_hyp),
+                weighted_ngram_match.hypothesis_stats(weighted_refs, tokenized_hyp),
+                syntax_match.match_sub_trees(ref_sub_trees, cand_sub_trees),
+                dataflow_match.match_dataflows(ref_dfgs, cand_dfg))
+
+    def score(self, hypothesis):
+        """(ngram match, weighted ngram match, syntax match, dataflow match, CodeBLEU) of hypothesis."""
+        assert len(hypothesis) == len(self.references)
+        try:
+            stats = [self.example_stats(i, hyp) for i, hyp in enumerate(hypothesis)]
+        finally:
+            self.cache.clear(symbols=False)
+        return code_bleu_from_stats(stats, self.params)
@@ -6,7 +6,9 @@ from evaluator.CodeBLEU.parser import (remove_comments_and_docstrings,
                                        tree_to_token_index,
                                        index_to_code_token,
                                        tree_to_variable_index)
+from collections import Counter
 from tree_sitter import Language, Parser
+from evaluator.CodeBLEU.parse_cache import ParseCache
 import os
 
 root_dir = os.path.dirname(__file__)
@@ -25,54 +27,129 @@ def calc_syntax_match(references, candidate, lang):
     return corpus_syntax_match([references], [candidate], lang)
 
 
-def corpus_syntax_match(references, candidates, lang):
-    JAVA_LANGUAGE = Language(root_dir + '/parser/my-languages.so', lang)
-    parser = Parser()
-    parser.set_language(JAVA_LANGUAGE)
+def get_all_sub_trees(root_node):
+    node_stack = []
+    sub_tree_sexp_list = []
+    depth = 1
+    node_stack.append([root_node, depth])
+    while len(node_stack) != 0:
+        cur_node, cur_depth = node_stack.pop()
+        sub_tree_sexp_list.append([cur_node.sexp(), cur_depth])
+        for child_node in cur_node.children:
+            if len(child_node.children) != 0:
+                depth = cur_depth + 1
+                node_stack.append([child_node, depth])
+    return sub_tree_sexp_list
+
+
+def _node_label(node):
+    # the text node.sexp() opens the node with, see ts_subtree__write_to_string
+    if node.is_missing:
+        return '(MISSING ' + (node.type if node.is_named else '"%s"' % node.type)
+    if node.type == 'ERROR' and node.child_count == 0 and node.end_byte > node.start_byte:
+        # (UNEXPECTED 'c') of a character the node api does not expose
+        return node.sexp()
+    return '(' + node.type
+
+
+def get_sub_tree_counts(root_node, intern):
+    """Counter of the subtrees get_all_sub_trees lists, by intern(structure) instead of sexp().
+
+    One post-order pass hashes every node from its label and the (field, id) of
+    the children sexp() prints, so two ids are equal exactly when the sexp()
+    strings are, without building a string per subtree.
+    """
+    counts = Counter()
+    cursor = root_node.walk()
+    # [node, field name, flat (field, id) items of its printed children]
+    frames = [[root_node, None, []]]
+    while frames:
+        if cursor.goto_first_child():
+            frames.append([cursor.node, cursor.current_field_name(), []])
+            continue
+        while frames:
+            node, field, items = frames.pop()
+            is_root = not frames
+            if node.is_named or node.is_missing:
+                symbol = intern((_node_label(node),) + tuple(items))
+                items = [field, symbol]
+            else:
+                # anonymous nodes are not printed, their children are, inheriting the field
+                symbol = intern(('("%s")' % node.type,) + tuple(items))
+                items = [field if i % 2 == 0 and x is None else x for i, x in enumerate(items)]
+            if is_root or node.child_count != 0:
+                counts[symbol] += 1
+            if is_root:
+                break
+            frames[-1][2].extend(items)
+            if cursor.goto_next_sibling():
+                frames.append([cursor.node, cursor.current_field_name(), []])
+                break
+            cursor.goto_parent()
+    return counts
+
+
+def match_sub_trees(ref_sub_trees_list, cand_sub_trees):
+    """(matched, total) subtrees of the references' get_sub_tree_counts against the candidate's."""
     match_count = 0
     total_count = 0
+    for ref_sub_trees in ref_sub_trees_list:
+        # a reference subtree matches when the candidate has it at all, however often
+        for sub_tree, count in ref_sub_trees.items():
+            if sub_tree in cand_sub_trees:
+                match_count += count
+        total_count += sum(ref_sub_trees.values())
+    return match_count, total_count
+
 
-    for i in range(len(candidates)):
-        references_sample = references[i]
-        candidate = candidates[i]
-        for reference in references_sample:
-            try:
-                candidate = remove_comments_and_docstrings(candidate, 'java')
-            except:
-                pass
-            try:
-                reference = remove_comments_and_docstrings(reference, 'java')
-            except:
-                pass
-
-            candidate_tree = parser.parse(bytes(candidate, 'utf8')).root_node
-
-            reference_tree = parser.parse(bytes(reference, 'utf8')).root_node
-
-            def get_all_sub_trees(root_node):
-                node_stack = []
-                sub_tree_sexp_list = []
-                depth = 1
-                node_stack.append([root_node, depth])
-                while len(node_stack) != 0:
-                    cur_node, cur_depth = node_stack.pop()
-                    sub_tree_sexp_list.append([cur_node.sexp(), cur_depth])
-                    for child_node in cur_node.children:
-                        if len(child_node.children) != 0:
-                            depth = cur_depth + 1
-                            node_stack.append([child_node, depth])
-                return sub_tree_sexp_list
-
-            cand_sexps = [x[0] for x in get_all_sub_trees(candidate_tree)]
-            ref_sexps = get_all_sub_trees(reference_tree)
-
-            # print(cand_sexps)
-            # print(ref_sexps)
-
-            for sub_tree, depth in ref_sexps:
-                if sub_tree in cand_sexps:
-                    match_count += 1
-            total_count += len(ref_sexps)
+def syntax_match_stats(references, candidate, cache):
+    """(matched, total) subtrees of the references of one candidate, what corpus_syntax_match adds up."""
+    sub_trees = lambda code, tree: get_sub_tree_counts(tree.root_node, cache.intern)
+    cand_sub_trees = cache.derive(candidate, 'sub_trees', sub_trees)
+    return match_sub_trees([cache.derive(reference, 'sub_trees', sub_trees) for reference in references],
+                           cand_sub_trees)
 
+
+def corpus_syntax_match_from_stats(stats):
+    match_count = 0
+    total_count = 0
+    for matches, total in stats:
+        match_count += matches
+        total_count += total
     score = match_count / total_count
     return score
+
+
+class SyntaxMatchAccumulator(object):
+    """corpus_syntax_match of a corpus seen one candidate at a time, in memory that does not grow with it."""
+
+    def __init__(self, lang, cache=None):
+        self.lang = lang
+        self.cache = cache
+        self.match_count = 0
+        self.total_count = 0
+
+    def add(self, candidate, references):
+        if self.cache is None:
+            self.cache = ParseCache(self.lang)
+        self.add_stats(syntax_match_stats(references, candidate, self.cache))
+        # the subtree ids only have to agree within one candidate and its references
+        self.cache.clear()
+
+    def add_stats(self, stats):
+        matches, total = stats
+        self.match_count += matches
+        self.total_count += total
+
+    def stats(self):
+        return self.match_count, self.total_count
+
+    def result(self):
+        return corpus_syntax_match_from_stats([self.stats()])
+
+
+def corpus_syntax_match(references, candidates, lang, cache=None):
+    if cache is None:
+        cache = ParseCache(lang)
+    return corpus_syntax_match_from_stats(syntax_match_stats(references[i], candidates[i], cache)
+                                          for i in range(len(candidates)))
@@ -0,0 +1,106 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+# Packed integer ngram counting for the ngram and weighted ngram matches.
+#
+# bleu.modified_precision and weighted_ngram_match.modified_recall count tuple
+# ngrams in a Counter per sentence, per order and per reference. sentence_stats
+# here interns the tokens of one example to small ints once, packs every ngram
+# of an order into one int64 (bits per token enough for the example's
+# vocabulary) and counts and clips them with numpy.unique and searchsorted. The
+# statistics are the ones of bleu.sentence_stats and
+# weighted_ngram_match.sentence_stats, bit for bit: the counts are integers and
+# the keyword weighted sums are taken with cumsum, in the order modified_recall
+# adds them up. An example whose vocabulary does not fit in 64 bit keys falls
+# back to the tuple Counters.
+import numpy as np
+
+from evaluator.CodeBLEU import bleu, weighted_ngram_match
+
+
+def intern_tokens(sentences):
+    """Per sentence int64 arrays of token ids, and the number of distinct tokens."""
+    vocab = {}
+    ids = [np.array([vocab.setdefault(token, len(vocab)) for token in sentence], dtype=np.int64)
+           for sentence in sentences]
+    return ids, len(vocab)
+
+
+def packed_ngrams(ids, n, bits):
+    """The ngrams of order n of the token ids, each packed into one int64 with bits per token."""
+    if len(ids) < n:
+        return np.empty(0, dtype=np.int64)
+    keys = ids[:len(ids) - n + 1].copy()
+    for i in range(1, n):
+        keys = (keys << bits) | ids[i:len(ids) - n + 1 + i]
+    return keys
+
+
+def _lookup(keys, counts, queries):
+    """counts of queries in the sorted unique keys, 0 for the missing ones."""
+    if len(keys) == 0:
+        return np.zeros(len(queries), dtype=np.int64)
+    index = np.minimum(np.searchsorted(keys, queries), len(keys) - 1)
+    return np.where(keys[index] == queries, counts[index], 0)
+
+
+def _weighted_sum(values):
+    # the running sum of modified_recall's weighted_sum, 0 plus each term in turn
+    return float(np.cumsum(values)[-1]) if len(values) else 0
+
+
+def sentence_stats(references, hypothesis, reference_weights, weights=(0.25, 0.25, 0.25, 0.25)):
+    """(bleu.sentence_stats, weighted_ngram_match.sentence_stats) of one hypothesis.
+
+    references are token lists and reference_weights their keyword weights, the
+    [reference, reference_weights[i]] pairs of weighted_ngram_match.
+    """
+    ids, vocab_size = intern_tokens([hypothesis] + list(references))
+    bits = max(1, vocab_size.bit_length())
+    if bits * len(weights) > 63:
+        references_with_weights = [[x, y] for x, y in zip(references, reference_weights)]
+        return (bleu.sentence_stats(references, hypothesis, weights),
+                weighted_ngram_match.sentence_stats(references_with_weights, hypothesis, weights))
+    hyp_ids, ref_ids = ids[0], ids[1:]
+
+    # token id -> keyword weight of each reference, 1 for the tokens it has no weight for
+    id_weights = []
+    for reference, ids_of_reference, reference_weight in zip(references, ref_ids, reference_weights):
+        token_weights = np.ones(vocab_size)
+        for token, token_id in zip(reference, ids_of_reference.tolist()):
+            if token in reference_weight:
+                token_weights[token_id] = reference_weight[token]
+        id_weights.append(token_weights)
+
+    numerators, denominators = [], []
+    weighted_numerators, weighted_denominators = [], []
+    for n, _ in enumerate(weights, start=1):
+        hyp_keys, hyp_counts = np.unique(packed_ngrams(hyp_ids, n, bits), return_counts=True)
+        max_counts = np.zeros(len(hyp_keys), dtype=np.int64)
+        numerator = 0
+        denominator = 0
+        for ids_of_reference, reference_weight, token_weights in zip(ref_ids, reference_weights, id_weights):
+            ref_keys, first, ref_counts = np.unique(packed_ngrams(ids_of_reference, n, bits),
+                                                    return_index=True, return_counts=True)
+            # modified_precision: the most any one reference has of each hypothesis ngram
+            max_counts = np.maximum(max_counts, _lookup(ref_keys, ref_counts, hyp_keys))
+            # modified_recall: the reference ngrams in the order its Counter has them
+            order = np.argsort(first, kind='stable')
+            ref_keys, ref_counts = ref_keys[order], ref_counts[order]
+            clipped = np.minimum(ref_counts, _lookup(hyp_keys, hyp_counts, ref_keys))
+            if n == 1 and len(reference_weight) == len(ref_keys):
+                ngram_weights = token_weights[ref_keys]
+                numerator += _weighted_sum(clipped * ngram_weights)
+                denominator += max(1, _weighted_sum(ref_counts * ngram_weights))
+            else:
+                numerator += int(clipped.sum())
+                denominator += max(1, int(ref_counts.sum()))
+        numerators.append(int(np.minimum(hyp_counts, max_counts).sum()))
+        denominators.append(max(1, int(hyp_counts.sum())))
+        weighted_numerators.append(numerator)
+        weighted_denominators.append(denominator)
+
+    hyp_len = len(hypothesis)
+    # weighted_ngram_match measures its [tokens, weights] pairs, which are always 2 long
+    return ((numerators, denominators, hyp_len, bleu.closest_ref_length(references, hyp_len)),
+            (weighted_numerators, weighted_denominators, hyp_len, 2))
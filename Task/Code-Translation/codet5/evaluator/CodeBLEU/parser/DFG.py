@@ -8,7 +8,157 @@ from .utils import (remove_comments_and_docstrings,
                    tree_to_variable_index)
 
 
-def DFG_python(root_node,index_to_code,states):
+# The extractors below are generators: where the recursive version called
+# itself on a child they yield (child, states) and get that call's
+# (DFG, states) back. extract() runs them with an explicit stack, so nesting
+# depth is not limited by the interpreter's recursion limit. The states of the
+# walk are States, persistent maps sharing structure between their copies, so
+# the copy every node makes is O(1) whatever the number of live variables.
+_hash_mask=(1<<64)-1
+
+
+def _slot(key,h,shift):
+    # 5 hash bits per level, the key itself once the 64 bits are used up
+    return (h>>shift)&31 if shift<64 else key
+
+
+def _trie_get(node,key):
+    h=hash(key)&_hash_mask
+    shift=0
+    while True:
+        entry=node.get((h>>shift)&31 if shift<64 else key)
+        if entry is None:
+            return None
+        if type(entry) is tuple:
+            return entry[1] if entry[0]==key else None
+        node=entry
+        shift+=5
+
+
+def _trie_insert(node,key,h,value,shift):
+    """Set key in node, a node not shared yet; the nodes below it on key's path are copied."""
+    slot=_slot(key,h,shift)
+    entry=node.get(slot)
+    if entry is None or type(entry) is tuple and entry[0]==key:
+        node[slot]=(key,value)
+    elif type(entry) is tuple:
+        child={}
+        _trie_insert(child,entry[0],hash(entry[0])&_hash_mask,entry[1],shift+5)
+        _trie_insert(child,key,h,value,shift+5)
+        node[slot]=child
+    else:
+        child=entry.copy()
+        _trie_insert(child,key,h,value,shift+5)
+        node[slot]=child
+
+
+def _trie_items(node):
+    for entry in node.values():
+        if type(entry) is tuple:
+            yield entry
+        else:
+            yield from _trie_items(entry)
+
+
+def _trie_merge(nodes,shift):
+    """Union of the tries at shift, the merged value of a key being the sorted set of its values.
+
+    Values are sorted lists of unique indexes, so a subtrie all nodes share
+    merges to itself and is not walked.
+    """
+    first=nodes[0]
+    if all(node is first for node in nodes):
+        return first
+    entries={}
+    for node in nodes:
+        for slot,entry in node.items():
+            entries.setdefault(slot,[]).append(entry)
+    merged={}
+    for slot,group in entries.items():
+        first=group[0]
+        if all(entry is first for entry in group):
+            merged[slot]=first
+        elif all(type(entry) is dict for entry in group):
+            merged[slot]=_trie_merge(group,shift+5)
+        else:
+            values={}
+            for entry in group:
+                for key,value in ([entry] if type(entry) is tuple else _trie_items(entry)):
+                    values.setdefault(key,[]).append(value)
+            child={}
+            for key,value in values.items():
+                value=value[0] if all(x is value[0] for x in value) else sorted(set(sum(value,[])))
+                _trie_insert(child,key,hash(key)&_hash_mask,value,shift+5)
+            merged[slot]=child
+    return merged
+
+
+class States(object):
+    """Variable name -> indexes of its last definitions, a persistent hash trie behind a dict-like handle.
+
+    copy() shares the trie; setting a name copies only the nodes on its path.
+    Handles are mutable like the dicts they replace, so code passing the same
+    states object to several children sees the same updates it did before.
+    """
+    __slots__=('root',)
+
+    def __init__(self,root=None):
+        self.root={} if root is None else root
+
+    @staticmethod
+    def from_dict(states):
+        root={}
+        for key,value in states.items():
+            _trie_insert(root,key,hash(key)&_hash_mask,value,0)
+        return States(root)
+
+    def copy(self):
+        return States(self.root)
+
+    def __contains__(self,key):
+        return _trie_get(self.root,key) is not None
+
+    def __getitem__(self,key):
+        value=_trie_get(self.root,key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self,key,value):
+        root=self.root.copy()
+        _trie_insert(root,key,hash(key)&_hash_mask,value,0)
+        self.root=root
+
+    def __iter__(self):
+        return (key for key,_ in _trie_items(self.root))
+
+    def items(self):
+        return _trie_items(self.root)
+
+    @staticmethod
+    def merge(states_list):
+        """The states after branches ending in states_list: every name with the sorted union of its indexes."""
+        return States(_trie_merge([states.root for states in states_list],0))
+
+
+def extract(extractor,root_node,index_to_code,states):
+    """(DFG, states) of root_node, running extractor's generators on an explicit stack."""
+    stack=[extractor(root_node,index_to_code,States.from_dict(states))]
+    result=None
+    while stack:
+        try:
+            node,states=stack[-1].send(result)
+        except StopIteration as stop:
+            stack.pop()
+            result=stop.value
+        else:
+            stack.append(extractor(node,index_to_code,states))
+            result=None
+    DFG,states=result
+    return DFG,dict(states.items())
+
+
+def _DFG_python(root_node,index_to_code,states):
     assignment=['assignment','augmented_assignment','for_in_clause']
     if_statement=['if_statement']
     for_statement=['for_statement']
@@ -40,7 +190,7 @@ def DFG_python(root_node,index_to_code,states):
         else:
             name_indexs=tree_to_variable_index(name,index_to_code)
             value_indexs=tree_to_variable_index(value,index_to_code)
-            temp,states=DFG_python(value,index_to_code,states)
+            temp,states=yield value,states
             DFG+=temp            
             for index1 in name_indexs:
                 idx1,code1=index_to_code[index1]
@@ -67,7 +217,7 @@ def DFG_python(root_node,index_to_code,states):
                 right_nodes=[root_node.child_by_field_name('right')]
         DFG=[]
         for node in right_nodes:
-            temp,states=DFG_python(node,index_to_code,states)
+            temp,states=yield node,states
             DFG+=temp
             
         for left_node,right_node in zip(left_nodes,right_nodes):
@@ -92,24 +242,16 @@ def DFG_python(root_node,index_to_code,states):
             if 'else' in child.type:
                 tag=True
             if child.type not in ['elif_clause','else_clause']:
-                temp,current_states=DFG_python(child,index_to_code,current_states)
+                temp,current_states=yield child,current_states
                 DFG+=temp
             else:
-                temp,new_states=DFG_python(child,index_to_code,states)
+                temp,new_states=yield child,states
                 DFG+=temp
                 others_states.append(new_states)
         others_states.append(current_states)
         if tag is False:
             others_states.append(states)
-        new_states={}
-        for dic in others_states:
-            for key in dic:
-                if key not in new_states:
-                    new_states[key]=dic[key].copy()
-                else:
-                    new_states[key]+=dic[key]
-        for key in new_states:
-            new_states[key]=sorted(list(set(new_states[key])))
+        new_states=States.merge(others_states)
         return sorted(DFG,key=lambda x:x[1]),new_states
     elif root_node.type in for_statement:
         DFG=[]
@@ -124,7 +266,7 @@ def DFG_python(root_node,index_to_code,states):
             if len(right_nodes)==0:
                 right_nodes=[root_node.child_by_field_name('right')]
             for node in right_nodes:
-                temp,states=DFG_python(node,index_to_code,states)
+                temp,states=yield node,states
                 DFG+=temp
             for left_node,right_node in zip(left_nodes,right_nodes):
                 left_tokens_index=tree_to_variable_index(left_node,index_to_code)
@@ -137,7 +279,7 @@ def DFG_python(root_node,index_to_code,states):
                     states[code1]=[idx1]
                 DFG+=temp   
             if  root_node.children[-1].type=="block":
-                temp,states=DFG_python(root_node.children[-1],index_to_code,states)
+                temp,states=yield root_node.children[-1],states
                 DFG+=temp 
         dic={}
         for x in DFG:
@@ -152,7 +294,7 @@ def DFG_python(root_node,index_to_code,states):
         DFG=[]
         for i in range(2):
             for child in root_node.children:
-                temp,states=DFG_python(child,index_to_code,states)
+                temp,states=yield child,states
                 DFG+=temp    
         dic={}
         for x in DFG:
@@ -167,17 +309,21 @@ def DFG_python(root_node,index_to_code,states):
         DFG=[]
         for child in root_node.children:
             if child.type in do_first_statement:
-                temp,states=DFG_python(child,index_to_code,states)
+                temp,states=yield child,states
                 DFG+=temp
         for child in root_node.children:
             if child.type not in do_first_statement:
-                temp,states=DFG_python(child,index_to_code,states)
+                temp,states=yield child,states
                 DFG+=temp
         
         return sorted(DFG,key=lambda x:x[1]),states
-        
 
-def DFG_java(root_node,index_to_code,states):
+
+def DFG_python(root_node,index_to_code,states):
+    return extract(_DFG_python,root_node,index_to_code,states)
+
+
+def _DFG_java(root_node,index_to_code,states):
     assignment=['assignment_expression']
     def_statement=['variable_declarator']
     increment_statement=['update_expression']
@@ -211,7 +357,7 @@ def DFG_java(root_node,index_to_code,states):
         else:
             name_indexs=tree_to_variable_index(name,index_to_code)
             value_indexs=tree_to_variable_index(value,index_to_code)
-            temp,states=DFG_java(value,index_to_code,states)
+            temp,states=yield value,states
             DFG+=temp            
             for index1 in name_indexs:
                 idx1,code1=index_to_code[index1]
@@ -224,7 +370,7 @@ def DFG_java(root_node,index_to_code,states):
         left_nodes=root_node.child_by_field_name('left')
         right_nodes=root_node.child_by_field_name('right')
         DFG=[]
-        temp,states=DFG_java(right_nodes,index_to_code,states)
+        temp,states=yield right_nodes,states
         DFG+=temp            
         name_indexs=tree_to_variable_index(left_nodes,index_to_code)
         value_indexs=tree_to_variable_index(right_nodes,index_to_code)        
@@ -257,35 +403,27 @@ def DFG_java(root_node,index_to_code,states):
             if 'else' in child.type:
                 tag=True
             if child.type not in if_statement and flag is False:
-                temp,current_states=DFG_java(child,index_to_code,current_states)
+                temp,current_states=yield child,current_states
                 DFG+=temp
             else:
                 flag=True
-                temp,new_states=DFG_java(child,index_to_code,states)
+                temp,new_states=yield child,states
                 DFG+=temp
                 others_states.append(new_states)
         others_states.append(current_states)
         if tag is False:
             others_states.append(states)
-        new_states={}
-        for dic in others_states:
-            for key in dic:
-                if key not in new_states:
-                    new_states[key]=dic[key].copy()
-                else:
-                    new_states[key]+=dic[key]
-        for key in new_states:
-            new_states[key]=sorted(list(set(new_states[key])))
+        new_states=States.merge(others_states)
         return sorted(DFG,key=lambda x:x[1]),new_states
     elif root_node.type in for_statement:
         DFG=[]
         for child in root_node.children:
-            temp,states=DFG_java(child,index_to_code,states)
+            temp,states=yield child,states
             DFG+=temp
         flag=False
         for child in root_node.children:
             if flag:
-                temp,states=DFG_java(child,index_to_code,states)
+                temp,states=yield child,states
                 DFG+=temp                
             elif child.type=="local_variable_declaration":
                 flag=True
@@ -304,7 +442,7 @@ def DFG_java(root_node,index_to_code,states):
         body=root_node.child_by_field_name('body')
         DFG=[]
         for i in range(2):
-            temp,states=DFG_java(value,index_to_code,states)
+            temp,states=yield value,states
             DFG+=temp       
             name_indexs=tree_to_variable_index(name,index_to_code)
             value_indexs=tree_to_variable_index(value,index_to_code)        
@@ -314,7 +452,7 @@ def DFG_java(root_node,index_to_code,states):
                     idx2,code2=index_to_code[index2]
                     DFG.append((code1,idx1,'computedFrom',[code2],[idx2]))
                 states[code1]=[idx1]   
-            temp,states=DFG_java(body,index_to_code,states)
+            temp,states=yield body,states
             DFG+=temp                       
         dic={}
         for x in DFG:
@@ -329,7 +467,7 @@ def DFG_java(root_node,index_to_code,states):
         DFG=[]
         for i in range(2):
             for child in root_node.children:
-                temp,states=DFG_java(child,index_to_code,states)
+                temp,states=yield child,states
                 DFG+=temp    
         dic={}
         for x in DFG:
@@ -344,16 +482,21 @@ def DFG_java(root_node,index_to_code,states):
         DFG=[]
         for child in root_node.children:
             if child.type in do_first_statement:
-                temp,states=DFG_java(child,index_to_code,states)
+                temp,states=yield child,states
                 DFG+=temp
         for child in root_node.children:
             if child.type not in do_first_statement:
-                temp,states=DFG_java(child,index_to_code,states)
+                temp,states=yield child,states
                 DFG+=temp
         
         return sorted(DFG,key=lambda x:x[1]),states
 
-def DFG_csharp(root_node,index_to_code,states):
+
+def DFG_java(root_node,index_to_code,states):
+    return extract(_DFG_java,root_node,index_to_code,states)
+
+
+def _DFG_csharp(root_node,index_to_code,states):
     assignment=['assignment_expression']
     def_statement=['variable_declarator']
     increment_statement=['postfix_unary_expression']
@@ -391,7 +534,7 @@ def DFG_csharp(root_node,index_to_code,states):
         else:
             name_indexs=tree_to_variable_index(name,index_to_code)
             value_indexs=tree_to_variable_index(value,index_to_code)
-            temp,states=DFG_csharp(value,index_to_code,states)
+            temp,states=yield value,states
             DFG+=temp            
             for index1 in name_indexs:
                 idx1,code1=index_to_code[index1]
@@ -404,7 +547,7 @@ def DFG_csharp(root_node,index_to_code,states):
         left_nodes=root_node.child_by_field_name('left')
         right_nodes=root_node.child_by_field_name('right')
         DFG=[]
-        temp,states=DFG_csharp(right_nodes,index_to_code,states)
+        temp,states=yield right_nodes,states
         DFG+=temp            
         name_indexs=tree_to_variable_index(left_nodes,index_to_code)
         value_indexs=tree_to_variable_index(right_nodes,index_to_code)        
@@ -437,35 +580,27 @@ def DFG_csharp(root_node,index_to_code,states):
             if 'else' in child.type:
                 tag=True
             if child.type not in if_statement and flag is False:
-                temp,current_states=DFG_csharp(child,index_to_code,current_states)
+                temp,current_states=yield child,current_states
                 DFG+=temp
             else:
                 flag=True
-                temp,new_states=DFG_csharp(child,index_to_code,states)
+                temp,new_states=yield child,states
                 DFG+=temp
                 others_states.append(new_states)
         others_states.append(current_states)
         if tag is False:
             others_states.append(states)
-        new_states={}
-        for dic in others_states:
-            for key in dic:
-                if key not in new_states:
-                    new_states[key]=dic[key].copy()
-                else:
-                    new_states[key]+=dic[key]
-        for key in new_states:
-            new_states[key]=sorted(list(set(new_states[key])))
+        new_states=States.merge(others_states)
         return sorted(DFG,key=lambda x:x[1]),new_states
     elif root_node.type in for_statement:
         DFG=[]
         for child in root_node.children:
-            temp,states=DFG_csharp(child,index_to_code,states)
+            temp,states=yield child,states
             DFG+=temp
         flag=False
         for child in root_node.children:
             if flag:
-                temp,states=DFG_csharp(child,index_to_code,states)
+                temp,states=yield child,states
                 DFG+=temp                
             elif child.type=="local_variable_declaration":
                 flag=True
@@ -484,7 +619,7 @@ def DFG_csharp(root_node,index_to_code,states):
         body=root_node.child_by_field_name('body')
         DFG=[]
         for i in range(2):
-            temp,states=DFG_csharp(value,index_to_code,states)
+            temp,states=yield value,states
             DFG+=temp       
             name_indexs=tree_to_variable_index(name,index_to_code)
             value_indexs=tree_to_variable_index(value,index_to_code)        
@@ -494,7 +629,7 @@ def DFG_csharp(root_node,index_to_code,states):
                     idx2,code2=index_to_code[index2]
                     DFG.append((code1,idx1,'computedFrom',[code2],[idx2]))
                 states[code1]=[idx1]   
-            temp,states=DFG_csharp(body,index_to_code,states)
+            temp,states=yield body,states
             DFG+=temp                       
         dic={}
         for x in DFG:
@@ -509,7 +644,7 @@ def DFG_csharp(root_node,index_to_code,states):
         DFG=[]
         for i in range(2):
             for child in root_node.children:
-                temp,states=DFG_csharp(child,index_to_code,states)
+                temp,states=yield child,states
                 DFG+=temp    
         dic={}
         for x in DFG:
@@ -524,19 +659,21 @@ def DFG_csharp(root_node,index_to_code,states):
         DFG=[]
         for child in root_node.children:
             if child.type in do_first_statement:
-                temp,states=DFG_csharp(child,index_to_code,states)
+                temp,states=yield child,states
                 DFG+=temp
         for child in root_node.children:
             if child.type not in do_first_statement:
-                temp,states=DFG_csharp(child,index_to_code,states)
+                temp,states=yield child,states
                 DFG+=temp
         
         return sorted(DFG,key=lambda x:x[1]),states
 
 
-    
-    
-def DFG_ruby(root_node,index_to_code,states):
+def DFG_csharp(root_node,index_to_code,states):
+    return extract(_DFG_csharp,root_node,index_to_code,states)
+
+
+def _DFG_ruby(root_node,index_to_code,states):
     assignment=['assignment','operator_assignment']
     if_statement=['if','elsif','else','unless','when']
     for_statement=['for']
@@ -568,7 +705,7 @@ def DFG_ruby(root_node,index_to_code,states):
         else:
             name_indexs=tree_to_variable_index(name,index_to_code)
             value_indexs=tree_to_variable_index(value,index_to_code)
-            temp,states=DFG_ruby(value,index_to_code,states)
+            temp,states=yield value,states
             DFG+=temp            
             for index1 in name_indexs:
                 idx1,code1=index_to_code[index1]
@@ -593,7 +730,7 @@ def DFG_ruby(root_node,index_to_code,states):
 
         DFG=[]
         for node in right_nodes:
-            temp,states=DFG_ruby(node,index_to_code,states)
+            temp,states=yield node,states
             DFG+=temp
             
         for left_node,right_node in zip(left_nodes,right_nodes):
@@ -618,24 +755,16 @@ def DFG_ruby(root_node,index_to_code,states):
             if 'else' in child.type:
                 tag=True
             if child.type not in if_statement:
-                temp,current_states=DFG_ruby(child,index_to_code,current_states)
+                temp,current_states=yield child,current_states
                 DFG+=temp
             else:
-                temp,new_states=DFG_ruby(child,index_to_code,states)
+                temp,new_states=yield child,states
                 DFG+=temp
                 others_states.append(new_states)
         others_states.append(current_states)
         if tag is False:
             others_states.append(states)
-        new_states={}
-        for dic in others_states:
-            for key in dic:
-                if key not in new_states:
-                    new_states[key]=dic[key].copy()
-                else:
-                    new_states[key]+=dic[key]
-        for key in new_states:
-            new_states[key]=sorted(list(set(new_states[key])))
+        new_states=States.merge(others_states)
         return sorted(DFG,key=lambda x:x[1]),new_states
     elif root_node.type in for_statement:
         DFG=[]
@@ -644,7 +773,7 @@ def DFG_ruby(root_node,index_to_code,states):
             right_nodes=[root_node.child_by_field_name('value')]
             assert len(right_nodes)==len(left_nodes)
             for node in right_nodes:
-                temp,states=DFG_ruby(node,index_to_code,states)
+                temp,states=yield node,states
                 DFG+=temp
             for left_node,right_node in zip(left_nodes,right_nodes):
                 left_tokens_index=tree_to_variable_index(left_node,index_to_code)
@@ -656,7 +785,7 @@ def DFG_ruby(root_node,index_to_code,states):
                                  [index_to_code[x][0] for x in right_tokens_index]))
                     states[code1]=[idx1]
                 DFG+=temp 
-            temp,states=DFG_ruby(root_node.child_by_field_name('body'),index_to_code,states)
+            temp,states=yield root_node.child_by_field_name('body'),states
             DFG+=temp 
         dic={}
         for x in DFG:
@@ -671,7 +800,7 @@ def DFG_ruby(root_node,index_to_code,states):
         DFG=[]
         for i in range(2):
             for child in root_node.children:
-                temp,states=DFG_ruby(child,index_to_code,states)
+                temp,states=yield child,states
                 DFG+=temp    
         dic={}
         for x in DFG:
@@ -686,16 +815,21 @@ def DFG_ruby(root_node,index_to_code,states):
         DFG=[]
         for child in root_node.children:
             if child.type in do_first_statement:
-                temp,states=DFG_ruby(child,index_to_code,states)
+                temp,states=yield child,states
                 DFG+=temp
         for child in root_node.children:
             if child.type not in do_first_statement:
-                temp,states=DFG_ruby(child,index_to_code,states)
+                temp,states=yield child,states
                 DFG+=temp
         
         return sorted(DFG,key=lambda x:x[1]),states
 
-def DFG_go(root_node,index_to_code,states):
+
+def DFG_ruby(root_node,index_to_code,states):
+    return extract(_DFG_ruby,root_node,index_to_code,states)
+
+
+def _DFG_go(root_node,index_to_code,states):
     assignment=['assignment_statement',]
     def_statement=['var_spec']
     increment_statement=['inc_statement']
@@ -729,7 +863,7 @@ def DFG_go(root_node,index_to_code,states):
         else:
             name_indexs=tree_to_variable_index(name,index_to_code)
             value_indexs=tree_to_variable_index(value,index_to_code)
-            temp,states=DFG_go(value,index_to_code,states)
+            temp,states=yield value,states
             DFG+=temp            
             for index1 in name_indexs:
                 idx1,code1=index_to_code[index1]
@@ -742,7 +876,7 @@ def DFG_go(root_node,index_to_code,states):
         left_nodes=root_node.child_by_field_name('left')
         right_nodes=root_node.child_by_field_name('right')
         DFG=[]
-        temp,states=DFG_go(right_nodes,index_to_code,states)
+        temp,states=yield right_nodes,states
         DFG+=temp            
         name_indexs=tree_to_variable_index(left_nodes,index_to_code)
         value_indexs=tree_to_variable_index(right_nodes,index_to_code)        
@@ -775,44 +909,31 @@ def DFG_go(root_node,index_to_code,states):
             if 'else' in child.type:
                 tag=True
             if child.type not in if_statement and flag is False:
-                temp,current_states=DFG_go(child,index_to_code,current_states)
+                temp,current_states=yield child,current_states
                 DFG+=temp
             else:
                 flag=True
-                temp,new_states=DFG_go(child,index_to_code,states)
+                temp,new_states=yield child,states
                 DFG+=temp
                 others_states.append(new_states)
         others_states.append(current_states)
         if tag is False:
             others_states.append(states)
-        new_states={}
-        for dic in others_states:
-            for key in dic:
-                if key not in new_states:
-                    new_states[key]=dic[key].copy()
-                else:
-                    new_states[key]+=dic[key]
-        for key in states:
-            if key not in new_states:
-                new_states[key]=states[key]
-            else:
-                new_states[key]+=states[key]
-        for key in new_states:
-            new_states[key]=sorted(list(set(new_states[key])))
+        new_states=States.merge(others_states+[states])
         return sorted(DFG,key=lambda x:x[1]),new_states
     elif root_node.type in for_statement:
         DFG=[]
         for child in root_node.children:
-            temp,states=DFG_go(child,index_to_code,states)
+            temp,states=yield child,states
             DFG+=temp
         flag=False
         for child in root_node.children:
             if flag:
-                temp,states=DFG_go(child,index_to_code,states)
+                temp,states=yield child,states
                 DFG+=temp                
             elif child.type=="for_clause":
                 if child.child_by_field_name('update') is not None:
-                    temp,states=DFG_go(child.child_by_field_name('update'),index_to_code,states)
+                    temp,states=yield child.child_by_field_name('update'),states
                     DFG+=temp                 
                 flag=True
         dic={}
@@ -828,19 +949,21 @@ def DFG_go(root_node,index_to_code,states):
         DFG=[]
         for child in root_node.children:
             if child.type in do_first_statement:
-                temp,states=DFG_go(child,index_to_code,states)
+                temp,states=yield child,states
                 DFG+=temp
         for child in root_node.children:
             if child.type not in do_first_statement:
-                temp,states=DFG_go(child,index_to_code,states)
+                temp,states=yield child,states
                 DFG+=temp
         
         return sorted(DFG,key=lambda x:x[1]),states
 
-    
-    
 
-def DFG_php(root_node,index_to_code,states):
+def DFG_go(root_node,index_to_code,states):
+    return extract(_DFG_go,root_node,index_to_code,states)
+
+
+def _DFG_php(root_node,index_to_code,states):
     assignment=['assignment_expression','augmented_assignment_expression']
     def_statement=['simple_parameter']
     increment_statement=['update_expression']
@@ -874,7 +997,7 @@ def DFG_php(root_node,index_to_code,states):
         else:
             name_indexs=tree_to_variable_index(name,index_to_code)
             value_indexs=tree_to_variable_index(value,index_to_code)
-            temp,states=DFG_php(value,index_to_code,states)
+            temp,states=yield value,states
             DFG+=temp            
             for index1 in name_indexs:
                 idx1,code1=index_to_code[index1]
@@ -887,7 +1010,7 @@ def DFG_php(root_node,index_to_code,states):
         left_nodes=root_node.child_by_field_name('left')
         right_nodes=root_node.child_by_field_name('right')
         DFG=[]
-        temp,states=DFG_php(right_nodes,index_to_code,states)
+        temp,states=yield right_nodes,states
         DFG+=temp            
         name_indexs=tree_to_variable_index(left_nodes,index_to_code)
         value_indexs=tree_to_variable_index(right_nodes,index_to_code)        
@@ -920,38 +1043,25 @@ def DFG_php(root_node,index_to_code,states):
             if 'else' in child.type:
                 tag=True
             if child.type not in if_statement and flag is False:
-                temp,current_states=DFG_php(child,index_to_code,current_states)
+                temp,current_states=yield child,current_states
                 DFG+=temp
             else:
                 flag=True
-                temp,new_states=DFG_php(child,index_to_code,states)
+                temp,new_states=yield child,states
                 DFG+=temp
                 others_states.append(new_states)
         others_states.append(current_states)
-        new_states={}
-        for dic in others_states:
-            for key in dic:
-                if key not in new_states:
-                    new_states[key]=dic[key].copy()
-                else:
-                    new_states[key]+=dic[key]
-        for key in states:
-            if key not in new_states:
-                new_states[key]=states[key]
-            else:
-                new_states[key]+=states[key]
-        for key in new_states:
-            new_states[key]=sorted(list(set(new_states[key])))
+        new_states=States.merge(others_states+[states])
         return sorted(DFG,key=lambda x:x[1]),new_states
     elif root_node.type in for_statement:
         DFG=[]
         for child in root_node.children:
-            temp,states=DFG_php(child,index_to_code,states)
+            temp,states=yield child,states
             DFG+=temp
         flag=False
         for child in root_node.children:
             if flag:
-                temp,states=DFG_php(child,index_to_code,states)
+                temp,states=yield child,states
                 DFG+=temp                
             elif child.type=="assignment_expression":               
                 flag=True
@@ -976,7 +1086,7 @@ def DFG_php(root_node,index_to_code,states):
         body=root_node.child_by_field_name('body')
         DFG=[]
         for i in range(2):
-            temp,states=DFG_php(value,index_to_code,states)
+            temp,states=yield value,states
             DFG+=temp       
             name_indexs=tree_to_variable_index(name,index_to_code)
             value_indexs=tree_to_variable_index(value,index_to_code)        
@@ -986,7 +1096,7 @@ def DFG_php(root_node,index_to_code,states):
                     idx2,code2=index_to_code[index2]
                     DFG.append((code1,idx1,'computedFrom',[code2],[idx2]))
                 states[code1]=[idx1]   
-            temp,states=DFG_php(body,index_to_code,states)
+            temp,states=yield body,states
             DFG+=temp                       
         dic={}
         for x in DFG:
@@ -1001,7 +1111,7 @@ def DFG_php(root_node,index_to_code,states):
         DFG=[]
         for i in range(2):
             for child in root_node.children:
-                temp,states=DFG_php(child,index_to_code,states)
+                temp,states=yield child,states
                 DFG+=temp    
         dic={}
         for x in DFG:
@@ -1016,17 +1126,21 @@ def DFG_php(root_node,index_to_code,states):
         DFG=[]
         for child in root_node.children:
             if child.type in do_first_statement:
-                temp,states=DFG_php(child,index_to_code,states)
+                temp,states=yield child,states
                 DFG+=temp
         for child in root_node.children:
             if child.type not in do_first_statement:
-                temp,states=DFG_php(child,index_to_code,states)
+                temp,states=yield child,states
                 DFG+=temp
         
         return sorted(DFG,key=lambda x:x[1]),states
 
 
-def DFG_javascript(root_node,index_to_code,states):
+def DFG_php(root_node,index_to_code,states):
+    return extract(_DFG_php,root_node,index_to_code,states)
+
+
+def _DFG_javascript(root_node,index_to_code,states):
     assignment=['assignment_pattern','augmented_assignment_expression']
     def_statement=['variable_declarator']
     increment_statement=['update_expression']
@@ -1060,7 +1174,7 @@ def DFG_javascript(root_node,index_to_code,states):
         else:
             name_indexs=tree_to_variable_index(name,index_to_code)
             value_indexs=tree_to_variable_index(value,index_to_code)
-            temp,states=DFG_javascript(value,index_to_code,states)
+            temp,states=yield value,states
             DFG+=temp            
             for index1 in name_indexs:
                 idx1,code1=index_to_code[index1]
@@ -1073,7 +1187,7 @@ def DFG_javascript(root_node,index_to_code,states):
         left_nodes=root_node.child_by_field_name('left')
         right_nodes=root_node.child_by_field_name('right')
         DFG=[]
-        temp,states=DFG_javascript(right_nodes,index_to_code,states)
+        temp,states=yield right_nodes,states
         DFG+=temp            
         name_indexs=tree_to_variable_index(left_nodes,index_to_code)
         value_indexs=tree_to_variable_index(right_nodes,index_to_code)        
@@ -1106,40 +1220,27 @@ def DFG_javascript(root_node,index_to_code,states):
             if 'else' in child.type:
                 tag=True
             if child.type not in if_statement and flag is False:
-                temp,current_states=DFG_javascript(child,index_to_code,current_states)
+                temp,current_states=yield child,current_states
                 DFG+=temp
             else:
                 flag=True
-                temp,new_states=DFG_javascript(child,index_to_code,states)
+                temp,new_states=yield child,states
                 DFG+=temp
                 others_states.append(new_states)
         others_states.append(current_states)
         if tag is False:
             others_states.append(states)        
-        new_states={}
-        for dic in others_states:
-            for key in dic:
-                if key not in new_states:
-                    new_states[key]=dic[key].copy()
-                else:
-                    new_states[key]+=dic[key]
-        for key in states:
-            if key not in new_states:
-                new_states[key]=states[key]
-            else:
-                new_states[key]+=states[key]
-        for key in new_states:
-            new_states[key]=sorted(list(set(new_states[key])))
+        new_states=States.merge(others_states+[states])
         return sorted(DFG,key=lambda x:x[1]),new_states
     elif root_node.type in for_statement:
         DFG=[]
         for child in root_node.children:
-            temp,states=DFG_javascript(child,index_to_code,states)
+            temp,states=yield child,states
             DFG+=temp
         flag=False
         for child in root_node.children:
             if flag:
-                temp,states=DFG_javascript(child,index_to_code,states)
+                temp,states=yield child,states
                 DFG+=temp                
             elif child.type=="variable_declaration":               
                 flag=True
@@ -1156,7 +1257,7 @@ def DFG_javascript(root_node,index_to_code,states):
         DFG=[]
         for i in range(2):
             for child in root_node.children:
-                temp,states=DFG_javascript(child,index_to_code,states)
+                temp,states=yield child,states
                 DFG+=temp    
         dic={}
         for x in DFG:
@@ -1171,14 +1272,15 @@ def DFG_javascript(root_node,index_to_code,states):
         DFG=[]
         for child in root_node.children:
             if child.type in do_first_statement:
-                temp,states=DFG_javascript(child,index_to_code,states)
+                temp,states=yield child,states
                 DFG+=temp
         for child in root_node.children:
             if child.type not in do_first_statement:
-                temp,states=DFG_javascript(child,index_to_code,states)
+                temp,states=yield child,states
                 DFG+=temp
         
         return sorted(DFG,key=lambda x:x[1]),states
 
 
-     
+def DFG_javascript(root_node,index_to_code,states):
+    return extract(_DFG_javascript,root_node,index_to_code,states)
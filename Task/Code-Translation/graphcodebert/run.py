@@ -45,10 +45,9 @@ logging.basicConfig(format = '%(asctime)s - %(levelname)s - %(name)s -   %(messa
                     datefmt = '%m/%d/%Y %H:%M:%S',
                     level = logging.INFO)
 from parser import DFG_python,DFG_java,DFG_ruby,DFG_go,DFG_php,DFG_javascript,DFG_csharp
-from parser import (remove_comments_and_docstrings,
-                   tree_to_token_index,
-                   index_to_code_token,
+from parser import (tree_to_code_tokens,
                    tree_to_variable_index)
+from parser import load_dfg_cache, dfg_cache_stats
 from tree_sitter import Language, Parser
 dfg_function={
     'python':DFG_python,
@@ -72,23 +71,15 @@ for lang in dfg_function:
     
 #remove comments, tokenize code and extract dataflow     
 def extract_dataflow(code, parser,lang):
-    #remove comments
-    try:
-        code=remove_comments_and_docstrings(code,lang)
-    except:
-        pass    
     #obtain dataflow
     if lang=="php":
         code="<?php"+code+"?>"    
     try:
-        tree = parser[0].parse(bytes(code,'utf8'))    
+        #comments and docstrings are skipped while walking the tree, no regex or tokenize pass
+        code_bytes=bytes(code,'utf8')
+        tree = parser[0].parse(code_bytes)    
         root_node = tree.root_node  
-        tokens_index=tree_to_token_index(root_node)     
-        code=code.split('\n')
-        code_tokens=[index_to_code_token(x,code) for x in tokens_index]  
-        index_to_code={}
-        for idx,(index,code) in enumerate(zip(tokens_index,code_tokens)):
-            index_to_code[index]=(idx,code)  
+        code_tokens,_,index_to_code=tree_to_code_tokens(root_node,code_bytes,lang)
         try:
             DFG,_=parser[1](root_node,index_to_code,{}) 
         except:
@@ -110,6 +101,12 @@ def extract_dataflow(code, parser,lang):
         dfg=[]
     return code_tokens,dfg
 
+def cached_dataflow(code, parser, lang, args):
+    """extract_dataflow, served from the cache in args.dfg_cache_dir when it is set."""
+    if not args.dfg_cache_dir:
+        return extract_dataflow(code,parser,lang)
+    return load_dfg_cache(args.dfg_cache_dir,extract_dataflow).dataflow(code,parser,lang)
+
 
 class Example(object):
     """A single training/test example."""
@@ -177,7 +174,7 @@ def convert_examples_to_features(examples, tokenizer, args,stage=None):
     features = []
     for example_index, example in enumerate(tqdm(examples,total=len(examples))):
         ##extract data flow
-        code_tokens,dfg=extract_dataflow(example.source,parsers[args.lang],args.lang)
+        code_tokens,dfg=cached_dataflow(example.source,parsers[args.lang],args.lang,args)
         if len(code_tokens) == 0: continue
 
         code_tokens=[tokenizer.tokenize('@ '+x)[1:] if idx!=0 else tokenizer.tokenize(x) for idx,x in enumerate(code_tokens)]
@@ -252,6 +249,8 @@ def convert_examples_to_features(examples, tokenizer, args,stage=None):
                  target_mask,
             )
         )
+    if args.dfg_cache_dir:
+        logger.info("DFG cache: %(hits)d hits, %(misses)d misses", dfg_cache_stats())
     return features
 
 class TextDataset(Dataset):
@@ -469,6 +468,8 @@ def main():
                         help="For distributed training: local_rank")   
     parser.add_argument('--seed', type=int, default=42,
                         help="random seed for initialization")
+    parser.add_argument("--dfg_cache_dir", default=None, type=str,
+                        help="Directory of the on-disk data flow cache, unset to parse every function.")
     # print arguments
     args = parser.parse_args()
     logger.info(args)
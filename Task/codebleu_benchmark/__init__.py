@@ -0,0 +1 @@
+# Conformance and speed benchmark of every vendored CodeBLEU copy, see __main__.py.
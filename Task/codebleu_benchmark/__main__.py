@@ -0,0 +1,148 @@
+# Conformance and speed benchmark of every vendored CodeBLEU copy.
+#
+# From Task:
+#   python -m codebleu_benchmark list
+#   python -m codebleu_benchmark run --output base.json
+#   ... change a copy ...
+#   python -m codebleu_benchmark run --output new.json
+#   python -m codebleu_benchmark compare base.json new.json --fail_on_regression
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from codebleu_benchmark import copies, synthetic
+from codebleu_benchmark.compare import compare_reports, conformance_table
+
+task_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+default_baseline = os.path.join('PLBART', 'evaluation', 'CodeBLEU')
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=copies.root_dir,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def list_copies(args):
+    for copy in copies.discover():
+        reason = copies.unavailable(copy)
+        print('{:<60} {}'.format(copy, 'ok' if reason is None else 'skipped: ' + reason))
+
+
+def run(args):
+    work_dir = os.path.abspath(args.work_dir or tempfile.mkdtemp(prefix='codebleu_benchmark_'))
+    args.output = os.path.abspath(args.output)
+    corpus_dir = os.path.join(work_dir, 'corpus')
+    synthetic.write_corpora(corpus_dir, args.languages, args.num_examples, args.num_refs, args.statements, args.seed)
+    names = args.copies or copies.discover()
+    report = {'meta': {'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+                       'git_commit': _git_commit(),
+                       'python': platform.python_version(),
+                       'platform': platform.platform(),
+                       'config': {key: value for key, value in vars(args).items()
+                                  if key not in ('command', 'output', 'work_dir')}},
+              'copies': {}}
+    # the dataflow match depends on set order, every copy gets the same string hashes
+    env = dict(os.environ, PYTHONHASHSEED=str(args.hash_seed))
+    for index, name in enumerate(names):
+        result_file = os.path.join(work_dir, 'copy{}.json'.format(index))
+        # one process per copy: the script style copies share module names
+        command = [sys.executable, '-m', 'codebleu_benchmark', 'copy', '--copy', name, '--corpus_dir', corpus_dir,
+                   '--languages'] + args.languages + ['--repeat', str(args.repeat), '--output', result_file]
+        print('[codebleu_benchmark] {}'.format(name), file=sys.stderr)
+        returncode = subprocess.call(command, cwd=task_dir, env=env)
+        if returncode != 0 or not os.path.exists(result_file):
+            report['copies'][name] = {'skipped': 'failed with exit code {}'.format(returncode)}
+            continue
+        with open(result_file) as f:
+            report['copies'][name] = json.load(f)
+
+    baseline = args.baseline
+    if 'skipped' in report['copies'].get(baseline, {'skipped': 'not run'}):
+        available = [name for name, result in report['copies'].items() if 'skipped' not in result]
+        if not available:
+            raise RuntimeError('no copy could run, build their parser/my-languages.so first')
+        print('baseline {} did not run, comparing against {}'.format(baseline, available[0]))
+        baseline = available[0]
+    report['meta']['baseline'] = baseline
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    flagged = conformance_table(report, baseline, args.score_tolerance)
+    print('report written to {}'.format(args.output))
+    if flagged and args.fail_on_mismatch:
+        sys.exit(1)
+
+
+def run_copy(args):
+    from codebleu_benchmark.runner import benchmark_copy
+    result = benchmark_copy(args.copy, args.corpus_dir, args.languages, args.repeat)
+    with open(args.output, 'w') as f:
+        json.dump(result, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m codebleu_benchmark')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('list', help="List the CodeBLEU copies and whether they can run here.")
+
+    run_parser = subparsers.add_parser('run', help="Benchmark the copies and write a JSON report.")
+    run_parser.add_argument("--copies", nargs='+', default=None,
+                            help="Copies relative to the repository root, every discovered one by default.")
+    run_parser.add_argument("--baseline", default=default_baseline, type=str,
+                            help="The copy the others are checked against.")
+    run_parser.add_argument("--languages", nargs='+', default=synthetic.languages, choices=synthetic.languages)
+    run_parser.add_argument("--num_examples", default=200, type=int)
+    run_parser.add_argument("--num_refs", default=1, type=int)
+    run_parser.add_argument("--statements", default=8, type=int, help="Top level statements per function.")
+    run_parser.add_argument("--repeat", default=1, type=int, help="Runs per component, the fastest is reported.")
+    run_parser.add_argument("--seed", default=42, type=int)
+    run_parser.add_argument("--hash_seed", default=0, type=int, help="PYTHONHASHSEED of the copy processes.")
+    run_parser.add_argument("--score_tolerance", default=1e-12, type=float)
+    run_parser.add_argument("--fail_on_mismatch", action='store_true',
+                            help="Exit non-zero when a copy's scores differ from the baseline's or it fails.")
+    run_parser.add_argument("--output", default='codebleu_benchmark.json', type=str)
+    run_parser.add_argument("--work_dir", default=None, type=str,
+                            help="Where the corpora and per-copy results go, a temporary directory by default.")
+
+    copy_parser = subparsers.add_parser('copy', help="(internal) benchmark a single copy.")
+    copy_parser.add_argument("--copy", required=True, type=str)
+    copy_parser.add_argument("--corpus_dir", required=True, type=str)
+    copy_parser.add_argument("--languages", nargs='+', required=True)
+    copy_parser.add_argument("--repeat", default=1, type=int)
+    copy_parser.add_argument("--output", required=True, type=str)
+
+    compare_parser = subparsers.add_parser('compare', help="Diff two JSON reports.")
+    compare_parser.add_argument("base", type=str)
+    compare_parser.add_argument("new", type=str)
+    compare_parser.add_argument("--tolerance", default=0.05, type=float,
+                                help="Relative slowdown that counts as a regression.")
+    compare_parser.add_argument("--score_tolerance", default=1e-12, type=float)
+    compare_parser.add_argument("--fail_on_regression", action='store_true')
+
+    args = parser.parse_args()
+    if args.command == 'list':
+        list_copies(args)
+    elif args.command == 'run':
+        run(args)
+    elif args.command == 'copy':
+        run_copy(args)
+    else:
+        with open(args.base) as f:
+            base = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        flagged = compare_reports(base, new, args.tolerance, args.score_tolerance)
+        if flagged and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# Tables of benchmark reports.
+#
+# conformance_table() lines every copy of one report up against a baseline
+# copy: score deltas and speed ratio per language. All copies
+# score the same corpora with the same tokens and hash seed, so a score delta
+# is a difference in the copy's code. compare_reports() diffs two reports of the
+# same copies (before and after a change) and flags slowdowns beyond a tolerance
+# and any changed score.
+measures = ['ngram_match', 'weighted_ngram_match', 'syntax_match', 'dataflow_match', 'code_bleu']
+
+
+def _print_table(header, rows):
+    widths = [max(len(str(row[i])) for row in rows + [header]) for i in range(len(header))]
+    for row in [header] + rows:
+        print('  '.join(str(x).ljust(width) for x, width in zip(row, widths)).rstrip())
+
+
+def _languages(result):
+    return [lang for lang, entry in result.items() if isinstance(entry, dict)]
+
+
+def _conformance_rows(report, baseline, score_tolerance):
+    base_result = report['copies'][baseline]
+    for copy, result in report['copies'].items():
+        if 'skipped' in result:
+            yield copy, '-', '', '', '', result['skipped'], 'skipped'
+            continue
+        for lang in _languages(result):
+            base, cur = base_result.get(lang, {}), result[lang]
+            errors = [measure for measure in measures[:-1] if 'error' in cur.get(measure, {})]
+            if errors:
+                yield copy, lang, '', '', '', cur[errors[0]]['error'], 'ERROR ' + ','.join(errors)
+                continue
+            deltas = {measure: cur[measure]['score'] - base[measure]['score'] for measure in measures
+                      if 'score' in cur.get(measure, {}) and 'score' in base.get(measure, {})}
+            mismatched = [measure for measure in measures[:-1] if abs(deltas.get(measure, 0.0)) > score_tolerance]
+            if copy == baseline:
+                flag = 'baseline'
+            elif mismatched == ['weighted_ngram_match'] and base.get('keywords') and not cur.get('keywords'):
+                # the copy ships no keyword list for lang, every token weighs 0.2
+                flag = 'no keywords'
+            else:
+                flag = 'MISMATCH ' + ','.join(mismatched) if mismatched else ''
+            seconds = cur['code_bleu']['seconds']
+            yield (copy, lang, round(cur['code_bleu']['score'], 6),
+                   '{:.3g}'.format(max(abs(x) for x in deltas.values())) if deltas else '',
+                   seconds, '{:.2f}x'.format(base['code_bleu']['seconds'] / seconds) if seconds else '', flag)
+
+
+def conformance_table(report, baseline, score_tolerance=1e-12):
+    """Print every copy against baseline, returns the number of mismatched or failed rows.
+
+    One row per copy and language: its CodeBLEU, the largest score delta of
+    the components against baseline, the seconds of the four components and
+    the speed relative to baseline (above 1 is faster).
+    """
+    rows = list(_conformance_rows(report, baseline, score_tolerance))
+    _print_table(('copy', 'lang', 'code_bleu', 'max_delta', 'seconds', 'speed', ''), rows)
+    return sum(1 for row in rows if row[-1].startswith(('MISMATCH', 'ERROR')))
+
+
+def _compare_rows(base, new, tolerance, score_tolerance):
+    for copy in sorted(set(base['copies']) | set(new['copies'])):
+        old_result = base['copies'].get(copy, {'skipped': 'not run'})
+        new_result = new['copies'].get(copy, {'skipped': 'not run'})
+        if 'skipped' in old_result or 'skipped' in new_result:
+            yield copy, '-', old_result.get('skipped', ''), new_result.get('skipped', ''), '', 'skipped'
+            continue
+        for lang in _languages(new_result):
+            for measure in measures:
+                old, cur = old_result.get(lang, {}).get(measure, {}), new_result[lang].get(measure, {})
+                if 'score' not in old or 'score' not in cur:
+                    if 'error' in cur:
+                        yield copy, '{}.{}'.format(lang, measure), '', cur['error'], '', 'ERROR'
+                    continue
+                change = (cur['seconds'] - old['seconds']) / old['seconds'] if old['seconds'] else 0.0
+                yield (copy, '{}.{}.seconds'.format(lang, measure), old['seconds'], cur['seconds'],
+                       '{:+.1%}'.format(change), 'REGRESSION' if change > tolerance else '')
+                if abs(cur['score'] - old['score']) > score_tolerance:
+                    yield (copy, '{}.{}.score'.format(lang, measure), old['score'], cur['score'], '', 'CHANGED')
+
+
+def compare_reports(base, new, tolerance=0.05, score_tolerance=1e-12):
+    """Print the diff table, returns the number of flagged rows."""
+    rows = list(_compare_rows(base, new, tolerance, score_tolerance))
+    _print_table(('copy', 'measure', 'base', 'new', 'change', ''), rows)
+    return sum(1 for row in rows if row[-1] in ('REGRESSION', 'CHANGED', 'ERROR'))
@@ -0,0 +1,84 @@
+# The vendored CodeBLEU copies.
+#
+# A copy is a directory named CodeBLEU with the four component modules. Copies
+# under the codet5/cotext/codetrans trees import themselves as the
+# evaluator.CodeBLEU package, the others as top-level scripts run from their
+# own directory, and both load parser/my-languages.so. A copy shipping a
+# parser-old package is benchmarked a second time as "<copy>:parser-old", with
+# that package standing in for parser/. Copies are loaded one per process: the
+# script-style ones all define top-level modules named bleu, parser, utils...
+import importlib
+import importlib.util
+import os
+import sys
+
+root_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+components = ['bleu', 'weighted_ngram_match', 'syntax_match', 'dataflow_match']
+
+
+def discover(root=root_dir):
+    """Every copy under root, as paths relative to it, in a stable order."""
+    copies = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(x for x in dirnames if x not in ('.git', '__pycache__'))
+        if os.path.basename(dirpath) == 'CodeBLEU' and all(x + '.py' in filenames for x in components):
+            path = os.path.relpath(dirpath, root)
+            copies.append(path)
+            if os.path.exists(os.path.join(dirpath, 'parser-old', '__init__.py')):
+                copies.append(path + ':parser-old')
+    return copies
+
+
+def split(copy):
+    """(directory, parser variant or None) of a copy name."""
+    path, _, variant = copy.partition(':')
+    return os.path.join(root_dir, path), variant or None
+
+
+def is_package(copy_dir):
+    with open(os.path.join(copy_dir, 'syntax_match.py'), encoding='utf-8') as f:
+        return 'from evaluator.CodeBLEU' in f.read()
+
+
+def unavailable(copy):
+    """None when the copy can run here, otherwise the reason it cannot."""
+    copy_dir, variant = split(copy)
+    if not os.path.exists(os.path.join(copy_dir, 'syntax_match.py')):
+        return 'no CodeBLEU copy at {}'.format(copy_dir)
+    if not os.path.exists(os.path.join(copy_dir, 'parser', 'my-languages.so')):
+        return 'parser/my-languages.so is not built (see parser/build.sh)'
+    if variant and not os.path.exists(os.path.join(copy_dir, variant, '__init__.py')):
+        return 'no {} package'.format(variant)
+    return None
+
+
+def load(copy):
+    """The component modules of copy, imported from its directory the way its calc_code_bleu.py does."""
+    copy_dir, variant = split(copy)
+    os.chdir(copy_dir)
+    if is_package(copy_dir):
+        sys.path.insert(0, os.path.dirname(os.path.dirname(copy_dir)))
+        prefix = 'evaluator.CodeBLEU.'
+        importlib.import_module('evaluator.CodeBLEU')
+    else:
+        sys.path.insert(0, copy_dir)
+        prefix = ''
+    if variant:
+        variant_dir = os.path.join(copy_dir, variant)
+        spec = importlib.util.spec_from_file_location(prefix + 'parser', os.path.join(variant_dir, '__init__.py'),
+                                                      submodule_search_locations=[variant_dir])
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[prefix + 'parser'] = module
+        spec.loader.exec_module(module)
+    return [importlib.import_module(prefix + name) for name in components]
+
+
+def keywords(copy, lang):
+    """The keyword list the copy ships for lang, None when it has none."""
+    copy_dir, _ = split(copy)
+    path = os.path.join(copy_dir, 'keywords', lang + '.txt')
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return [x.strip() for x in f.readlines()]
@@ -0,0 +1,78 @@
+# Component scores and timings of one CodeBLEU copy.
+#
+# benchmark_copy() loads the copy's bleu, weighted_ngram_match, syntax_match
+# and dataflow_match modules and scores every synthetic corpus with their corpus
+# functions, the way calc_code_bleu.py calls them. The copies differ in how
+# their calc_code_bleu.py tokenizes and builds keyword weights, so that part is
+# done here once for all of them: whitespace tokens, weight 1 for the copy's
+# keywords and 0.2 otherwise. What is left, the ngram counting, the parsing and
+# the subtree and data flow matching, is each copy's own code. It runs in a
+# fresh process per copy with the hash seed the parent fixed, so the dataflow
+# match (which depends on set order) is comparable across copies.
+import contextlib
+import io
+import json
+import os
+import resource
+import time
+
+from codebleu_benchmark import copies
+
+stages = ['ngram_match', 'weighted_ngram_match', 'syntax_match', 'dataflow_match']
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _timed(call, repeat):
+    """(result of call, fastest of repeat runs in seconds), stdout of the call swallowed."""
+    seconds = None
+    for _ in range(repeat):
+        start = time.time()
+        # corpus_dataflow_match prints a warning on corpora without data flow
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = call()
+        elapsed = time.time() - start
+        seconds = elapsed if seconds is None else min(seconds, elapsed)
+    return result, seconds
+
+
+def benchmark_copy(copy, corpus_dir, languages, repeat=1):
+    """{lang: {stage: {'score', 'seconds', ...}}} of one copy, or {'skipped': reason}."""
+    reason = copies.unavailable(copy)
+    if reason is not None:
+        return {'skipped': reason}
+    bleu, weighted_ngram_match, syntax_match, dataflow_match = copies.load(copy)
+    result = {}
+    for lang in languages:
+        with open(os.path.join(corpus_dir, lang + '.json')) as f:
+            corpus = json.load(f)
+        references, hypothesis = corpus['references'], corpus['hypothesis']
+        keywords = copies.keywords(copy, lang)
+        keyword_set = set(keywords or [])
+        tokenized_hyps = [x.split() for x in hypothesis]
+        tokenized_refs = [[x.split() for x in refs] for refs in references]
+        tokenized_refs_with_weights = [[[tokens, {token: 1 if token in keyword_set else 0.2 for token in tokens}]
+                                        for tokens in refs] for refs in tokenized_refs]
+        calls = {'ngram_match': lambda: bleu.corpus_bleu(tokenized_refs, tokenized_hyps),
+                 'weighted_ngram_match': lambda: weighted_ngram_match.corpus_bleu(tokenized_refs_with_weights,
+                                                                                  tokenized_hyps),
+                 'syntax_match': lambda: syntax_match.corpus_syntax_match(references, hypothesis, lang),
+                 'dataflow_match': lambda: dataflow_match.corpus_dataflow_match(references, hypothesis, lang)}
+        entry = {'num_examples': len(hypothesis), 'keywords': keywords is not None}
+        for stage in stages:
+            try:
+                score, seconds = _timed(calls[stage], repeat)
+            except Exception as e:
+                entry[stage] = {'error': '{}: {}'.format(type(e).__name__, e)}
+                continue
+            entry[stage] = {'score': score, 'seconds': round(seconds, 4),
+                            'examples_per_second': round(len(hypothesis) / seconds, 1) if seconds > 0 else None}
+        if all('score' in entry[stage] for stage in stages):
+            entry['code_bleu'] = {'score': sum(0.25 * entry[stage]['score'] for stage in stages),
+                                  'seconds': round(sum(entry[stage]['seconds'] for stage in stages), 4)}
+        result[lang] = entry
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
@@ -0,0 +1,201 @@
+# Synthetic CodeBLEU corpora, one per language.
+#
+# Every reference is a random function (declarations, assignments, nested
+# if/else and for loops, calls, string literals, line and block comments)
+# rendered in the target language with one statement per line, and its
+# hypothesis a copy with a tenth of the tokens of each line replaced or
+# dropped, keeping the indentation python needs. Extra references are lighter
+# mutations of the first. write_corpora() writes <out>/<lang>.json holding
+# {"references": [[code, ...], ...], "hypothesis": [code, ...]}; the same
+# seed always gives the same corpora.
+#
+# Some identifiers, string literals and comments are not ASCII, with tokens
+# after them on the same line, so that a copy reading tokens by byte offset
+# where another reads them by character shows up. The python grammar only
+# takes Greek letters in identifiers, the java and c_sharp ones none: their
+# non-ASCII identifiers parse as errors, which the copies must handle alike.
+import json
+import os
+import random
+
+languages = ['java', 'c_sharp', 'python', 'javascript']
+
+_names = ['count', 'total', 'index', 'value', 'result', 'size', 'offset', 'item', 'limit', 'acc']
+_ops = ['+', '-', '*', '%']
+_calls = ['compute', 'helper', 'clamp']
+_texts = ['update the total', 'fix me', 'keep in sync', 'bounds checked above', 'größe prüfen', 'naïve café',
+          '日本語のテキスト']
+
+
+def _expression(rng, names, depth=0):
+    if depth > 1 or rng.random() < 0.4:
+        return rng.choice(names) if rng.random() < 0.7 else str(rng.randint(0, 100))
+    if rng.random() < 0.2:
+        return '{} ( {} , {} )'.format(rng.choice(_calls), _expression(rng, names, depth + 1),
+                                       _expression(rng, names, depth + 1))
+    return '{} {} {}'.format(_expression(rng, names, depth + 1), rng.choice(_ops), _expression(rng, names, depth + 1))
+
+
+def _statements(rng, names, count, depth=0, new_names=_names):
+    """A language neutral statement tree: (kind, fields...) tuples, declaring names from new_names."""
+    statements = []
+    for _ in range(count):
+        kind = rng.random()
+        if depth < 3 and kind < 0.12:
+            statements.append(('for', rng.choice(['i', 'j', 'k']), rng.choice(names),
+                               _statements(rng, names, rng.randint(1, 3), depth + 1, new_names)))
+        elif depth < 3 and kind < 0.25:
+            statements.append(('if', rng.choice(names), _expression(rng, names),
+                               _statements(rng, names, rng.randint(1, 2), depth + 1, new_names),
+                               _statements(rng, names, rng.randint(0, 1), depth + 1, new_names)))
+        elif kind < 0.32:
+            statements.append(('comment', rng.choice(_texts), rng.random() < 0.5))
+        elif kind < 0.38:
+            statements.append(('print', rng.choice(_texts), rng.choice(names)))
+        elif kind < 0.55:
+            name = rng.choice(new_names)
+            names.append(name)
+            statements.append(('declare', name, _expression(rng, names)))
+        else:
+            statements.append(('assign', rng.choice(names), _expression(rng, names)))
+    return statements
+
+
+class _CLike(object):
+    """Brace languages; subclasses fill in the few tokens that differ."""
+    unicode_names = ['größe', 'zähler', 'naïve']
+    header = 'public int {name} ( int a , int b ) {{'
+    declare = 'int {} = {} ;'
+    loop_var = 'int'
+    print_call = 'System . out . println'
+
+    def render(self, name, statements, result):
+        lines = [self.header.format(name=name)]
+        self.block(lines, statements, 1)
+        lines += ['    return {} ;'.format(result), '}']
+        return '\n'.join(lines)
+
+    def block(self, lines, statements, depth):
+        indent = '    ' * depth
+        for statement in statements:
+            kind = statement[0]
+            if kind == 'for':
+                _, var, bound, body = statement
+                lines.append('{}for ( {} {v} = 0 ; {v} < {} ; {v} ++ ) {{'.format(indent, self.loop_var, bound, v=var))
+                self.block(lines, body, depth + 1)
+                lines.append(indent + '}')
+            elif kind == 'if':
+                _, name, expression, then, otherwise = statement
+                lines.append('{}if ( {} > {} ) {{'.format(indent, name, expression))
+                self.block(lines, then, depth + 1)
+                if otherwise:
+                    lines.append(indent + '} else {')
+                    self.block(lines, otherwise, depth + 1)
+                lines.append(indent + '}')
+            elif kind == 'comment':
+                _, text, block = statement
+                lines.append(indent + ('/* {} */' if block else '// {}').format(text))
+            elif kind == 'print':
+                lines.append('{}{} ( "{}" + {} ) ;'.format(indent, self.print_call, statement[1], statement[2]))
+            elif kind == 'declare':
+                lines.append(indent + self.declare.format(statement[1], statement[2]))
+            else:
+                lines.append('{}{} = {} ;'.format(indent, statement[1], statement[2]))
+
+
+class _Java(_CLike):
+    pass
+
+
+class _CSharp(_CLike):
+    print_call = 'Console . WriteLine'
+
+    def render(self, name, statements, result):
+        return _CLike.render(self, name[0].upper() + name[1:], statements, result)
+
+
+class _JavaScript(_CLike):
+    header = 'function {name} ( a , b ) {{'
+    declare = 'let {} = {} ;'
+    loop_var = 'let'
+    print_call = 'console . log'
+
+
+class _Python(object):
+    unicode_names = ['π', 'λ', 'δx']
+
+    def render(self, name, statements, result):
+        lines = ['def {} ( a , b ) :'.format(name)]
+        if statements and statements[0][0] == 'comment':
+            lines.append('    """ {} """'.format(statements[0][1]))
+        self.block(lines, statements, 1)
+        lines.append('    return {}'.format(result))
+        return '\n'.join(lines)
+
+    def block(self, lines, statements, depth):
+        indent = '    ' * depth
+        if not statements:
+            lines.append(indent + 'pass')
+        for statement in statements:
+            kind = statement[0]
+            if kind == 'for':
+                _, var, bound, body = statement
+                lines.append('{}for {} in range ( {} ) :'.format(indent, var, bound))
+                self.block(lines, body, depth + 1)
+            elif kind == 'if':
+                _, name, expression, then, otherwise = statement
+                lines.append('{}if {} > {} :'.format(indent, name, expression))
+                self.block(lines, then, depth + 1)
+                if otherwise:
+                    lines.append(indent + 'else :')
+                    self.block(lines, otherwise, depth + 1)
+            elif kind == 'comment':
+                lines.append('{}# {}'.format(indent, statement[1]))
+            elif kind == 'print':
+                lines.append('{}print ( "{}" , {} )'.format(indent, statement[1], statement[2]))
+            else:
+                lines.append('{}{} = {}'.format(indent, statement[1], statement[2]))
+
+
+renderers = {'java': _Java(), 'c_sharp': _CSharp(), 'python': _Python(), 'javascript': _JavaScript()}
+
+
+def random_function(rng, lang, statements):
+    names = ['a', 'b']
+    body = _statements(rng, names, statements, new_names=_names + renderers[lang].unicode_names)
+    return renderers[lang].render(rng.choice(['run', 'solve', 'apply', 'merge']), body, rng.choice(names))
+
+
+def mutate(rng, code, rate=0.1):
+    """A hypothesis close to code: tokens replaced by identifiers or dropped at rate, indentation kept."""
+    lines = []
+    for line in code.split('\n'):
+        indent = line[:len(line) - len(line.lstrip())]
+        tokens = []
+        for token in line.split():
+            x = rng.random()
+            if x < rate / 2:
+                tokens.append(rng.choice(_names))
+            elif x >= rate:
+                tokens.append(token)
+        lines.append(indent + ' '.join(tokens))
+    return '\n'.join(lines)
+
+
+def make_corpus(lang, num_examples=200, num_refs=1, statements=8, seed=42):
+    rng = random.Random('{}-{}'.format(seed, lang))
+    references = []
+    hypothesis = []
+    for _ in range(num_examples):
+        reference = random_function(rng, lang, statements)
+        references.append([reference] + [mutate(rng, reference, 0.05) for _ in range(num_refs - 1)])
+        hypothesis.append(mutate(rng, reference))
+    return references, hypothesis
+
+
+def write_corpora(out_dir, langs=languages, num_examples=200, num_refs=1, statements=8, seed=42):
+    os.makedirs(out_dir, exist_ok=True)
+    for lang in langs:
+        references, hypothesis = make_corpus(lang, num_examples, num_refs, statements, seed)
+        with open(os.path.join(out_dir, lang + '.json'), 'w') as f:
+            json.dump({'references': references, 'hypothesis': hypothesis}, f)